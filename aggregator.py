@@ -0,0 +1,250 @@
+import sys
+import json
+import time
+import signal
+import threading
+from array import array
+from metrics import REGISTRY
+
+AGGREGATE_MESSAGES = REGISTRY.counter("meeting_aggregator_messages_total", "Watcher state messages received",
+                                      labels=("result",))
+AGGREGATE_SUMMARIES = REGISTRY.counter("meeting_aggregator_summaries_total", "Summaries published", labels=("kind",))
+
+# Desk states, kept one byte per desk
+OFF = 0
+ON = 1
+UNKNOWN = 2
+ON_PAYLOADS = (b"1", b"true", b"True")
+
+
+class TopicLayout:
+    """ Map watcher topics to (floor, room, desk) with a pattern like meeting/{floor}/{room}/{desk} """
+    fields = ("floor", "room", "desk")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.levels = pattern.split("/")
+        self.indexes = {}
+        for index, level in enumerate(self.levels):
+            if level.startswith("{") and level.endswith("}"):
+                name = level[1:-1]
+                if name not in self.fields:
+                    raise ValueError(f"Unknown topic field {level}, use {{floor}}, {{room}} or {{desk}}")
+                self.indexes[name] = index
+        if "desk" not in self.indexes:
+            raise ValueError(f"Topic pattern {pattern} has no {{desk}} level")
+        self.literals = [(index, level) for index, level in enumerate(self.levels) if index not in self.indexes.values()]
+        # The wildcard subscription that receives every watcher topic
+        self.subscription = "/".join("+" if index in self.indexes.values() else level
+                                     for index, level in enumerate(self.levels))
+
+    def parse(self, topic):
+        """ Return (floor, room, desk), or None if the topic does not follow the pattern """
+        parts = topic.split("/")
+        if len(parts) != len(self.levels):
+            return None
+        for index, level in self.literals:
+            if parts[index] != level:
+                return None
+        floor = parts[self.indexes["floor"]] if "floor" in self.indexes else ""
+        room = parts[self.indexes["room"]] if "room" in self.indexes else ""
+        return floor, room, parts[self.indexes["desk"]]
+
+
+class Aggregator:
+    """ Roll desk meeting states up into room and floor counts, publishing batched summaries at a bounded rate """
+    def __init__(self, publisher, layout, summary_topic="meeting/summary", interval=1.0, full_interval=60,
+                 verbose=False):
+        self.publisher = publisher
+        self.layout = layout
+        self.summary_topic = summary_topic
+        self.interval = interval
+        self.full_interval = full_interval
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        # topic -> desk slot, a topic is parsed once
+        self.slots = {}
+        self.state = bytearray()
+        self.desk_room = array("I")
+        # (floor, room) -> room index
+        self.room_index = {}
+        self.rooms = []
+        self.room_floor = array("I")
+        self.room_on = array("I")
+        self.room_known = array("I")
+        # floor name -> floor index
+        self.floor_index = {}
+        self.floors = []
+        self.floor_on = array("I")
+        self.floor_known = array("I")
+        self.total_on = 0
+        self.total_known = 0
+        self.dirty_rooms = set()
+        self.full_at = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"messages": 0, "changes": 0, "ignored": 0, "summaries": 0, "desks": 0}
+
+    def __floor__(self, floor):
+        index = self.floor_index.get(floor)
+        if index is None:
+            index = self.floor_index[floor] = len(self.floors)
+            self.floors.append(floor)
+            self.floor_on.append(0)
+            self.floor_known.append(0)
+        return index
+
+    def __room__(self, floor, room):
+        index = self.room_index.get((floor, room))
+        if index is None:
+            index = self.room_index[(floor, room)] = len(self.rooms)
+            self.rooms.append(f"{floor}/{room}" if floor else room)
+            self.room_floor.append(self.__floor__(floor))
+            self.room_on.append(0)
+            self.room_known.append(0)
+        return index
+
+    def __add_desk__(self, topic):
+        parsed = self.layout.parse(topic) if topic != self.summary_topic else None
+        if parsed is None:
+            return None
+        floor, room, _ = parsed
+        slot = len(self.state)
+        self.desk_room.append(self.__room__(floor, room))
+        self.state.append(UNKNOWN)
+        self.slots[topic] = slot
+        self.stats["desks"] += 1
+        return slot
+
+    def update(self, topic, payload):
+        """ Apply one watcher message, returns True if the desk changed state """
+        with self.lock:
+            self.stats["messages"] += 1
+            slot = self.slots.get(topic)
+            if slot is None:
+                slot = self.__add_desk__(topic)
+                if slot is None:
+                    self.stats["ignored"] += 1
+                    return False
+            # An empty (retained) payload means the watcher is gone
+            value = UNKNOWN if not payload else ON if payload in ON_PAYLOADS else OFF
+            previous = self.state[slot]
+            if value == previous:
+                return False
+            self.state[slot] = value
+            on = (value == ON) - (previous == ON)
+            known = (value != UNKNOWN) - (previous != UNKNOWN)
+            room = self.desk_room[slot]
+            floor = self.room_floor[room]
+            self.room_on[room] += on
+            self.room_known[room] += known
+            self.floor_on[floor] += on
+            self.floor_known[floor] += known
+            self.total_on += on
+            self.total_known += known
+            self.dirty_rooms.add(room)
+            self.stats["changes"] += 1
+            return True
+
+    def on_message(self, client, userdata, msg):
+        changed = self.update(msg.topic, msg.payload)
+        AGGREGATE_MESSAGES.inc(result="changed" if changed else "unchanged")
+
+    def summary(self, full=False):
+        """ Totals and floors, plus every room when full or only the rooms changed since the last summary """
+        with self.lock:
+            rooms = range(len(self.rooms)) if full else sorted(self.dirty_rooms)
+            self.dirty_rooms = set()
+            return {
+                "timestamp": time.time(),
+                "full": full,
+                "desks": self.total_known,
+                "in_meeting": self.total_on,
+                "floors": {
+                    floor: {"desks": self.floor_known[index], "in_meeting": self.floor_on[index]}
+                    for index, floor in enumerate(self.floors) if floor
+                },
+                "rooms": {
+                    self.rooms[index]: {"desks": self.room_known[index], "in_meeting": self.room_on[index]}
+                    for index in rooms
+                },
+            }
+
+    def publish_summary(self, full=False):
+        summary = self.summary(full)
+        # Full summaries are retained for new subscribers, the batches in between are not
+        self.publisher.publish(self.summary_topic, json.dumps(summary, separators=(",", ":")), retain=full)
+        self.stats["summaries"] += 1
+        AGGREGATE_SUMMARIES.inc(kind="full" if full else "changes")
+        return summary
+
+    def __summary_thread__(self):
+        while not self.stop_event.wait(self.interval):
+            now = time.monotonic()
+            if now >= self.full_at:
+                self.full_at = now + self.full_interval
+                self.publish_summary(full=True)
+            elif self.dirty_rooms:
+                self.publish_summary()
+
+    def start(self):
+        self.publisher.subscribe(self.layout.subscription, self.on_message)
+        self.publisher.start()
+        self.stop_event.clear()
+        self.full_at = time.monotonic() + self.interval
+        self.thread = threading.Thread(target=self.__summary_thread__, name="aggregate", daemon=True)
+        self.thread.start()
+        if self.verbose:
+            print(f"Aggregating {self.layout.subscription} into {self.summary_topic}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.publisher.stop()
+
+
+def create_aggregator(user_config, verbose=False):
+    """ Build an Aggregator on the mqtt broker from the aggregate section of the user config """
+    from publisher import MqttPublisher
+    mqtt_config = user_config.mqtt
+    config = user_config.aggregate or {}
+    publisher = MqttPublisher(
+        mqtt_config["host"], mqtt_config.get("port", 1883), mqtt_config.get("user"), mqtt_config.get("password"),
+        qos=config.get("qos", 0),
+        reconnect_min=mqtt_config.get("reconnect_min", 1),
+        reconnect_max=mqtt_config.get("reconnect_max", 60),
+        verbose=verbose
+    )
+    layout = TopicLayout(config.get("topic_pattern", "meeting/{floor}/{room}/{desk}"))
+    return Aggregator(
+        publisher, layout,
+        summary_topic=config.get("summary_topic", "meeting/summary"),
+        interval=config.get("interval", 1.0),
+        full_interval=config.get("full_interval", 60),
+        verbose=verbose
+    )
+
+
+def run(app_config):
+    """ Aggregate until SIGTERM or SIGINT, returns the process exit code """
+    if not app_config.user_config.ready:
+        print(f"User config not ready. {app_config.user_config.error}", file=sys.stderr)
+        return 1
+    try:
+        aggregator = create_aggregator(app_config.user_config, verbose=app_config.verbose)
+    except ValueError as e:
+        print(f"Invalid aggregate config: {e}", file=sys.stderr)
+        return 1
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda sig, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda sig, frame: stop_event.set())
+    aggregator.start()
+    try:
+        stop_event.wait()
+    finally:
+        aggregator.stop()
+    if app_config.verbose:
+        print(f"Aggregated {aggregator.stats['messages']} messages from {aggregator.stats['desks']} desks")
+    return 0
@@ -0,0 +1,349 @@
+"""
+Benchmarks for the meeting watcher detection cycle and log store.
+
+Runs the process detector, the full watcher cycle and the log store
+against synthetic process tables and a fake MQTT client, then compares
+the results with the stored baselines. Lookup counts are exact and fail
+the run, latencies are scaled by a reference loop timed in the same run
+and only reported.
+
+Usage:
+    python benchmarks/bench_watch.py [--quick] [--update-baseline]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fakes  # noqa: E402
+
+# The fakes have to be in place before the watcher modules import psutil and paho
+fakes.install(fakes.SyntheticProcessTable())
+
+from detectors import Detector, register_detector  # noqa: E402
+from logger import LogStore  # noqa: E402
+from rules import RuleSet  # noqa: E402
+from watch import MeetingWatcher  # noqa: E402
+
+BASELINE_FILE = os.path.join(BENCH_DIR, "baselines.json")
+# Baseline entry holding the reference loop timing the latencies are scaled by
+REFERENCE = "reference"
+# Latency is machine dependent, only report large slowdowns. Lookup counts are exact.
+LATENCY_TOLERANCE = 0.5
+# Sub-millisecond differences are timer noise
+LATENCY_FLOOR_MS = 0.5
+
+
+@register_detector("bench_mic")
+class BenchMicDetector(Detector):
+    """ Microphone detector that never reports a meeting """
+    source = "microphone"
+
+    def detect(self):
+        return False
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return samples[0], samples[0], samples[0]
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[89], cuts[98]
+
+
+def build_watcher(rules, db_path, mic=False):
+    user_config = SimpleNamespace(
+        mqtt={"host": "localhost"},
+        watch={"proc": True, "microphone": False, "bench_mic": mic},
+        options={"watch_interval": 5, "proc_events": "poll", "notifications": False},
+        proc=rules,
+        sinks=[],
+        metrics={},
+    )
+    app_config = SimpleNamespace(
+        verbose=False,
+        user_config=user_config,
+        log_db_file=db_path,
+        log_store=LogStore(db_path, setup_schema=True),
+        user_config_file=None,
+        record_file=None,
+    )
+    return MeetingWatcher(app_config, status_callback=lambda status: None, state_callback=lambda state: None)
+
+
+def legacy_watch_proc(psutil, rules):
+    """ The original O(rules x processes) scan, kept for comparison """
+    for proc_name, children in rules.items():
+        for process in psutil.process_iter():
+            if process.name().lower() == proc_name:
+                for child in process.children():
+                    if child.name() in children:
+                        return True
+    return False
+
+
+class Result:
+    def __init__(self, name, latencies, lookups, alloc_kib=None, cold=None):
+        self.name = name
+        self.p50, self.p90, self.p99 = percentiles(latencies)
+        self.lookups = lookups
+        self.alloc_kib = alloc_kib
+        self.cold = cold
+
+    def row(self):
+        alloc = f"{self.alloc_kib:9.1f}" if self.alloc_kib is not None else f"{'-':>9}"
+        cold = f"{self.cold * 1000:9.2f}" if self.cold is not None else f"{'-':>9}"
+        return (f"{self.name:<28} {self.p50 * 1000:9.3f} {self.p90 * 1000:9.3f} {self.p99 * 1000:9.3f} "
+                f"{cold} {self.lookups:9.1f} {alloc}")
+
+    def as_baseline(self):
+        return {"p50_ms": round(self.p50 * 1000, 4), "lookups": self.lookups}
+
+
+def measure_allocations(run_cycle, cycles=5):
+    """ Peak traced KiB per cycle """
+    tracemalloc.start()
+    peaks = []
+    for _ in range(cycles):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        run_cycle()
+        peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+    tracemalloc.stop()
+    return statistics.mean(peaks)
+
+
+def bench_proc_scan(size, rule_count, cycles, db_path, churn=0.005):
+    table, rules = fakes.build_table(size, rule_count)
+    fakes.use_table(table)
+    watcher = build_watcher(rules, db_path)
+
+    started = time.perf_counter()
+    watcher.__watch_proc__()
+    cold = time.perf_counter() - started
+
+    churn_count = max(1, int(size * churn))
+    latencies = []
+    lookups = []
+    for _ in range(cycles):
+        table.churn(churn_count)
+        table.reset_lookups()
+        started = time.perf_counter()
+        watcher.__watch_proc__()
+        latencies.append(time.perf_counter() - started)
+        lookups.append(table.total_lookups)
+
+    def run_cycle():
+        table.churn(churn_count)
+        watcher.__watch_proc__()
+
+    alloc = measure_allocations(run_cycle)
+    return Result(f"proc_scan[{size},{rule_count}]", latencies, statistics.mean(lookups), alloc, cold)
+
+
+def bench_legacy_scan(size, rule_count, cycles):
+    table, rules = fakes.build_table(size, rule_count)
+    psutil = fakes.use_table(table)
+    latencies = []
+    lookups = []
+    for _ in range(cycles):
+        table.reset_lookups()
+        started = time.perf_counter()
+        legacy_watch_proc(psutil, rules)
+        latencies.append(time.perf_counter() - started)
+        lookups.append(table.total_lookups)
+    return Result(f"legacy_scan[{size},{rule_count}]", latencies, statistics.mean(lookups))
+
+
+def mixed_rules(rule_count):
+    """ rule_count rules mixing exact, glob, regex, cmdline and ancestor patterns """
+    rules = []
+    for index in range(rule_count):
+        kind = index % 4
+        if kind == 0:
+            rules.append({"name": f"exact{index}", "process": f"callhelper{index}", "parent": f"meetingapp{index}"})
+        elif kind == 1:
+            rules.append({"name": f"glob{index}", "process": f"conf{index}-*", "ancestor": f"glob:meetingapp{index}*"})
+        elif kind == 2:
+            rules.append({"name": f"regex{index}", "process": f"re:^webcall{index}(-helper)?$"})
+        else:
+            rules.append({"name": f"cmdline{index}", "process": f"browser{index}", "cmdline": f"re:--app=meet{index}"})
+    return rules
+
+
+def bench_rule_classify(rule_count, cycles, names=1000):
+    """ Classify names distinct process names, the cost per name should not grow with the rule count """
+    rules = mixed_rules(rule_count)
+    latencies = []
+    for cycle in range(cycles):
+        rule_set = RuleSet.from_config(rules)
+        started = time.perf_counter()
+        for index in range(names):
+            rule_set.classify_name(f"daemon{cycle}-{index}")
+        latencies.append(time.perf_counter() - started)
+    return Result(f"rule_classify[{rule_count}]", latencies, 0)
+
+
+def bench_cycle(size, rule_count, cycles, db_path, toggle_every=10):
+    """ Full watcher cycle, a meeting starts and ends every toggle_every cycles """
+    table, rules = fakes.build_table(size, rule_count)
+    fakes.use_table(table)
+    watcher = build_watcher(rules, db_path, mic=True)
+    zoom_pid = [pid for pid, info in table.procs.items() if info[0] == "zoom.us"][0]
+    state = {"cycle": 0, "meeting_pid": None}
+
+    async def run_cycles(count, latencies, lookups):
+        for _ in range(count):
+            state["cycle"] += 1
+            if state["cycle"] % toggle_every == 0:
+                if state["meeting_pid"] is None:
+                    state["meeting_pid"] = table.add("CptHost", zoom_pid)
+                else:
+                    table.remove(state["meeting_pid"])
+                    state["meeting_pid"] = None
+            table.reset_lookups()
+            started = time.perf_counter()
+            await watcher.__run_cycle__()
+            if latencies is not None:
+                latencies.append(time.perf_counter() - started)
+                lookups.append(table.total_lookups)
+
+    latencies = []
+    lookups = []
+    # The first cycle fills the scanner cache, it is measured by bench_proc_scan
+    asyncio.run(run_cycles(1, None, None))
+    asyncio.run(run_cycles(cycles, latencies, lookups))
+    alloc = measure_allocations(lambda: asyncio.run(run_cycles(1, None, None)))
+    watcher.engine.stop()
+    watcher.log_store.close()
+    return Result(f"cycle[{size},{rule_count}]", latencies, statistics.mean(lookups), alloc)
+
+
+def bench_log_store(rows, db_path):
+    """ Time the watcher-visible start/end calls and a first page query over rows meetings """
+    store = LogStore(db_path, setup_schema=True)
+    store.open()
+    store.flush()
+    conn = store.__connect__()
+    conn.executemany(
+        "INSERT INTO log (start_time, end_time, duration) VALUES (?, ?, ?)",
+        ((f"2020-01-01T00:00:{i % 60:02}", f"2020-01-{1 + i % 28:02}T01:00:{i % 60:02}", 3600.0) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+    latencies = []
+    for _ in range(50):
+        started = time.perf_counter()
+        entry = store.start_meeting()
+        store.end_meeting(entry)
+        latencies.append(time.perf_counter() - started)
+    store.flush()
+    write = Result("log_store.enqueue", latencies, 0)
+
+    latencies = []
+    for _ in range(20):
+        started = time.perf_counter()
+        store.page(limit=50)
+        latencies.append(time.perf_counter() - started)
+    page = Result(f"log_store.page[{rows}]", latencies, 0)
+    store.close()
+    return [write, page]
+
+
+def bench_reference(repeats=21):
+    """ Time a fixed pure Python loop, the measure of how fast this machine is right now """
+    names = [f"process-{i}" for i in range(2000)]
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        seen = {}
+        for name in names:
+            seen[name.lower()] = len(name)
+        sorted(seen)
+        latencies.append(time.perf_counter() - started)
+    return Result(REFERENCE, latencies, 0)
+
+
+def load_baselines():
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as baseline_file:
+            return json.load(baseline_file)
+    return {}
+
+
+def compare(results, baselines, reference):
+    """ Return the lookup regressions, which fail the run, and the latency warnings """
+    regressions = []
+    warnings = []
+    # Scale the stored latencies by how much slower or faster this run's reference loop was
+    stored_reference = baselines.get(REFERENCE)
+    scale = reference.p50 * 1000 / stored_reference["p50_ms"] if stored_reference else 1.0
+    for result in results:
+        baseline = baselines.get(result.name)
+        if not baseline:
+            continue
+        if result.lookups > baseline["lookups"]:
+            regressions.append(f"{result.name}: {result.lookups:.1f} lookups/cycle, baseline {baseline['lookups']:.1f}")
+        p50_ms = result.p50 * 1000
+        expected_ms = baseline["p50_ms"] * scale
+        if p50_ms > expected_ms * (1 + LATENCY_TOLERANCE) and p50_ms - expected_ms > LATENCY_FLOOR_MS:
+            warnings.append(f"{result.name}: p50 {p50_ms:.3f}ms, scaled baseline {expected_ms:.3f}ms")
+    return regressions, warnings
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Meeting Watcher detection benchmarks")
+    argparser.add_argument("--quick", help="only run the smallest tables", action="store_true")
+    argparser.add_argument("--cycles", help="measured cycles per case", type=int, default=50)
+    argparser.add_argument("--update-baseline", help="store these results as the new baselines", action="store_true")
+    args = argparser.parse_args()
+
+    reference = bench_reference()
+
+    sizes = [1000] if args.quick else [1000, 10000, 50000]
+    rule_counts = [1, 10] if args.quick else [1, 10, 50]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "log.db")
+        for size in sizes:
+            for rule_count in rule_counts:
+                results.append(bench_proc_scan(size, rule_count, args.cycles, db_path))
+            results.append(bench_legacy_scan(size, rule_counts[-1], 3))
+            results.append(bench_cycle(size, rule_counts[-1], args.cycles, db_path))
+        results.extend(bench_log_store(1000 if args.quick else 100000, os.path.join(tmp_dir, "store.db")))
+    for rule_count in [4, 40] if args.quick else [4, 40, 400]:
+        results.append(bench_rule_classify(rule_count, max(5, args.cycles // 5)))
+
+    print(f"{'case':<28} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'cold ms':>9} {'lookups':>9} {'alloc KiB':>9}")
+    for result in results + [reference]:
+        print(result.row())
+
+    baselines = load_baselines()
+    if args.update_baseline:
+        baselines.update({result.name: result.as_baseline() for result in results + [reference]})
+        with open(BASELINE_FILE, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Baselines written to {BASELINE_FILE}")
+        return 0
+
+    regressions, warnings = compare(results, baselines, reference)
+    for warning in warnings:
+        print(f"SLOWER {warning}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Synthetic stand-ins for psutil and paho used by the benchmarks.
+
+install() must be called before importing any of the watcher modules so
+that they bind to these fakes instead of the real packages.
+"""
+import sys
+import types
+import contextlib
+from collections import Counter
+
+
+class SyntheticProcessTable:
+    """ A process table with pid -> (name, ppid, create_time) and counted attribute lookups """
+    def __init__(self):
+        self.procs = {}
+        self.next_pid = 2
+        self.lookups = Counter()
+
+    def add(self, name, ppid=1):
+        pid = self.next_pid
+        self.next_pid += 1
+        self.procs[pid] = (name, ppid, float(pid))
+        return pid
+
+    def remove(self, pid):
+        self.procs.pop(pid, None)
+
+    def churn(self, count, name="churn"):
+        """ Replace the oldest count non-rule processes with new ones """
+        victims = [pid for pid, info in self.procs.items() if info[0].startswith(name)][:count]
+        for pid in victims:
+            self.remove(pid)
+        for _ in range(count):
+            self.add(name)
+
+    def reset_lookups(self):
+        self.lookups.clear()
+
+    @property
+    def total_lookups(self):
+        return sum(self.lookups.values())
+
+
+def build_table(size, rule_count, meeting=False):
+    """ Build a table of size processes with rule_count meeting apps running (but idle) """
+    table = SyntheticProcessTable()
+    table.procs[1] = ("launchd", 0, 0.0)
+    rules = {"zoom.us": ["CptHost", "aomhost"]}
+    for index in range(1, rule_count):
+        rules[f"meetingapp{index}"] = [f"callhelper{index}"]
+    for parent in rules:
+        parent_pid = table.add(parent)
+        table.add(f"{parent}-renderer", parent_pid)
+    if meeting:
+        zoom_pid = [pid for pid, info in table.procs.items() if info[0] == "zoom.us"][0]
+        table.add("CptHost", zoom_pid)
+    while len(table.procs) < size:
+        table.add("churn" if len(table.procs) % 10 == 0 else f"daemon{len(table.procs) % 700}")
+    return table, rules
+
+
+def fake_psutil(table):
+    """ Build a psutil-like module backed by a SyntheticProcessTable """
+    module = types.ModuleType("psutil")
+
+    class Error(Exception):
+        pass
+
+    class NoSuchProcess(Error):
+        pass
+
+    class ZombieProcess(NoSuchProcess):
+        pass
+
+    class AccessDenied(Error):
+        pass
+
+    class TimeoutExpired(Error):
+        pass
+
+    class Process:
+        def __init__(self, pid):
+            table.lookups["Process"] += 1
+            if pid not in table.procs:
+                raise NoSuchProcess(pid)
+            self.pid = pid
+
+        def __info__(self, attr, index):
+            table.lookups[attr] += 1
+            info = table.procs.get(self.pid)
+            if info is None:
+                raise NoSuchProcess(self.pid)
+            return info[index]
+
+        def oneshot(self):
+            return contextlib.nullcontext()
+
+        def name(self):
+            return self.__info__("name", 0)
+
+        def ppid(self):
+            return self.__info__("ppid", 1)
+
+        def create_time(self):
+            return self.__info__("create_time", 2)
+
+        def exe(self):
+            return f"/usr/bin/{self.__info__('exe', 0)}"
+
+        def cmdline(self):
+            return [self.exe(), "--synthetic"]
+
+        def children(self):
+            table.lookups["children"] += 1
+            return [Process(pid) for pid, info in list(table.procs.items()) if info[1] == self.pid]
+
+        def wait(self, timeout=None):
+            raise TimeoutExpired(self.pid)
+
+    def pids():
+        table.lookups["pids"] += 1
+        return list(table.procs)
+
+    def process_iter():
+        table.lookups["process_iter"] += 1
+        for pid in list(table.procs):
+            yield Process(pid)
+
+    module.Error = Error
+    module.NoSuchProcess = NoSuchProcess
+    module.ZombieProcess = ZombieProcess
+    module.AccessDenied = AccessDenied
+    module.TimeoutExpired = TimeoutExpired
+    module.Process = Process
+    module.pids = pids
+    module.process_iter = process_iter
+    module.table = table
+    return module
+
+
+class FakeReasonCode:
+    is_failure = False
+
+    def __str__(self):
+        return "Success"
+
+
+class FakeMessageInfo:
+    def __init__(self, mid):
+        self.rc = 0
+        self.mid = mid
+
+
+class FakeMqttClient:
+    """ paho Client stand-in that is always connected and records publishes """
+    def __init__(self, *args, **kwargs):
+        self.published = []
+        self.mid = 0
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_publish = None
+        self.on_message = None
+
+    def username_pw_set(self, user, password):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def max_queued_messages_set(self, queue_size):
+        pass
+
+    def connect_async(self, host, port, keepalive):
+        pass
+
+    def loop_start(self):
+        if self.on_connect:
+            self.on_connect(self, None, None, FakeReasonCode(), None)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def subscribe(self, topic):
+        pass
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.mid += 1
+        self.published.append((topic, payload))
+        if self.on_publish:
+            self.on_publish(self, None, self.mid, FakeReasonCode(), None)
+        return FakeMessageInfo(self.mid)
+
+
+def fake_paho():
+    paho = types.ModuleType("paho")
+    paho_mqtt = types.ModuleType("paho.mqtt")
+    client = types.ModuleType("paho.mqtt.client")
+    client.Client = FakeMqttClient
+    client.CallbackAPIVersion = types.SimpleNamespace(VERSION2=2)
+    client.MQTT_ERR_SUCCESS = 0
+    client.MQTT_ERR_NO_CONN = 4
+    client.topic_matches_sub = lambda sub, topic: sub == topic
+    paho.mqtt = paho_mqtt
+    paho_mqtt.client = client
+    return {"paho": paho, "paho.mqtt": paho_mqtt, "paho.mqtt.client": client}
+
+
+def install(table):
+    """ Replace psutil and paho in sys.modules, returns the fake psutil module """
+    psutil = fake_psutil(table)
+    sys.modules["psutil"] = psutil
+    sys.modules.update(fake_paho())
+    return psutil
+
+
+def use_table(table):
+    """ Point the already installed fake psutil at another table """
+    psutil = fake_psutil(table)
+    sys.modules["psutil"] = psutil
+    for module_name in ("scanner", "procevents"):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            module.psutil = psutil
+    return psutil
@@ -0,0 +1,110 @@
+"""
+Load generator for the fleet aggregator.
+
+Simulates many watchers flipping their meeting state on
+meeting/{floor}/{room}/{desk} topics. With --local it starts the
+in-process fake broker and an aggregator, then reports how many
+messages per second the aggregator kept up with.
+
+Usage:
+    python benchmarks/loadgen.py --local [--desks 2000] [--rate 5000] [--duration 10]
+    python benchmarks/loadgen.py --host broker.local --port 1883 --rate 1000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import paho.mqtt.client as mqtt  # noqa: E402
+
+
+def desk_topics(desks, floors=10, rooms_per_floor=20, prefix="meeting"):
+    return [
+        f"{prefix}/floor{index % floors}/room{(index // floors) % rooms_per_floor}/desk{index}"
+        for index in range(desks)
+    ]
+
+
+def generate(host, port, topics, rate, duration, seed=0):
+    """ Publish random 0/1 states at rate messages per second, returns the number sent """
+    rng = random.Random(seed)
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.max_queued_messages_set(0)
+    client.connect(host, port)
+    client.loop_start()
+    sent = 0
+    # Publish in 10ms batches to hold the rate without a sleep per message
+    batch = max(1, int(rate / 100))
+    started = time.perf_counter()
+    deadline = started + duration
+    try:
+        while time.perf_counter() < deadline:
+            for _ in range(batch):
+                client.publish(rng.choice(topics), rng.choice(("0", "1")))
+            sent += batch
+            ahead = started + sent / rate - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+    finally:
+        client.disconnect()
+        client.loop_stop()
+    return sent
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Meeting aggregator load generator")
+    argparser.add_argument("--host", default="127.0.0.1")
+    argparser.add_argument("--port", type=int, default=1883)
+    argparser.add_argument("--local", help="run against the fake broker and an in-process aggregator",
+                           action="store_true")
+    argparser.add_argument("--desks", type=int, default=2000)
+    argparser.add_argument("--rate", help="messages per second", type=int, default=5000)
+    argparser.add_argument("--duration", help="seconds", type=float, default=10)
+    args = argparser.parse_args()
+
+    topics = desk_topics(args.desks)
+    if not args.local:
+        sent = generate(args.host, args.port, topics, args.rate, args.duration)
+        print(f"Sent {sent} messages ({sent / args.duration:.0f}/s)")
+        return 0
+
+    from fakebroker import FakeBroker
+    from publisher import MqttPublisher
+    from aggregator import Aggregator, TopicLayout
+
+    broker = FakeBroker()
+    port = broker.start()
+    aggregator = Aggregator(MqttPublisher("127.0.0.1", port), TopicLayout("meeting/{floor}/{room}/{desk}"),
+                            interval=0.5)
+    aggregator.start()
+    while not aggregator.publisher.connected:
+        time.sleep(0.05)
+    # Give the subscription time to reach the broker
+    time.sleep(0.2)
+
+    started = time.perf_counter()
+    sent = generate("127.0.0.1", port, topics, args.rate, args.duration)
+    # Wait for the aggregator to drain what the broker has queued
+    previous = -1
+    while aggregator.stats["messages"] != previous and aggregator.stats["messages"] < sent:
+        previous = aggregator.stats["messages"]
+        time.sleep(0.5)
+    elapsed = time.perf_counter() - started
+    aggregator.stop()
+    broker.stop()
+
+    stats = aggregator.stats
+    summaries = [topic for topic, _, _ in broker.received if topic == aggregator.summary_topic]
+    print(f"Sent {sent} messages over {args.desks} desks in {args.duration:.1f}s ({sent / args.duration:.0f}/s)")
+    print(f"Aggregated {stats['messages']} messages ({stats['messages'] / elapsed:.0f}/s), "
+          f"{stats['changes']} state changes, {stats['desks']} desks, {len(aggregator.rooms)} rooms")
+    print(f"Published {len(summaries)} summaries ({len(summaries) / elapsed:.1f}/s)")
+    return 0 if stats["messages"] >= sent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,5 @@
 import os
-from pydoc import ispath
-
-import yaml
 import shutil
-import sqlite3
 
 class AppConfig():
     def __init__(self):
@@ -24,6 +20,8 @@ class AppConfig():
         self.user_config_path = f"{os.path.expanduser('~')}/.config/meeting_watcher"
         self.user_config_file = None
         self.user_config = UserConfig()
+        # Set by --record, the watcher then writes its detector inputs there for the replay command
+        self.record_file = None
 
         self.user_config_files =  [
             f"{self.user_config_path}/config.yaml",
@@ -31,36 +29,37 @@ class AppConfig():
             "config.yaml"
         ]
         self.log_db_file = f"{self.user_config_path}{os.sep}log.db"
-
-        # Check if the user config directory exists and create it if it doesn't
-        if not os.path.exists(f"{self.user_config_path}"):
-            os.makedirs(f"{self.user_config_path}")
-            shutil.copyfile("config-default.yaml", f"{self.user_config_path}/config.yaml")
-
-        # Initialize the log database
-        log_db_conn = sqlite3.connect(f"{self.log_db_file}")
-        log_db_cursor = log_db_conn.cursor()
-        log_db_cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS log (
-                       id INTEGER PRIMARY KEY,
-                       start_time DATETIME,
-                       end_time DATETIME,
-                       duration FLOAT
-                   )
-                               """)
-
-        log_db_conn.commit()
-        log_db_conn.close()
+        self._log_store = None
 
         # Set the icon path if running from source
         if os.path.isdir(f"{self.app_path}/resources"):
             for icon in self.icons:
                 self.icons[icon] = f"{self.app_path}/resources/{self.icons[icon]}"
 
+    @property
+    def log_store(self):
+        """ The watcher's meeting log, its schema is set up and open rows recovered by the writer thread on first use
+
+        Commands that only read the log open it read-only instead.
+        """
+        if self._log_store is None:
+            from logger import LogStore
+            self._log_store = LogStore(self.log_db_file, setup_schema=True)
+        return self._log_store
+
+    def __create_user_config__(self):
+        """ Create the user config directory with the default config if it doesn't exist """
+        if not os.path.exists(f"{self.user_config_path}"):
+            os.makedirs(f"{self.user_config_path}")
+            default_config = f"{self.app_path}/config-default.yaml"
+            if not os.path.exists(default_config):
+                default_config = "config-default.yaml"
+            shutil.copyfile(default_config, f"{self.user_config_path}/config.yaml")
+
     def get_user_config(self, user_file=None, verbose=False):
         """ Load the user config file """
         self.verbose = verbose
-
+        self.__create_user_config__()
 
         # If a config file is provided in args, add it to the list
         if user_file:
@@ -78,9 +77,19 @@ class AppConfig():
         if self.user_config_file:
             self.user_config.load(self.user_config_file)
 
+    def reload_user_config(self):
+        """ Load the config file again, the current config is kept unless the new one is valid """
+        user_config = UserConfig()
+        user_config.load(self.user_config_file)
+        if user_config.ready:
+            self.user_config = user_config
+        return user_config
 
 
 class UserConfig():
+    # Top level sections of config.yaml
+    sections = ("mqtt", "watch", "proc", "options", "sinks", "metrics", "aggregate")
+
     def __init__(self):
         self.ready = False
         self.error = None
@@ -100,8 +109,13 @@ class UserConfig():
             "watch_interval": 5
         }
         self.proc = {}
+        self.sinks = []
+        self.metrics = {}
+        self.aggregate = {}
 
     def load(self, user_config_file):
+        import yaml
+        config = None
         try:
             with open(f"{user_config_file}", "r") as config_file:
                 config = yaml.safe_load(config_file)
@@ -113,12 +127,58 @@ class UserConfig():
             self.error = f"Error reading config file: {e}"
 
         if config:
+            # An empty section loads as None and keeps the defaults
             if "mqtt" in config:
-                self.mqtt = config["mqtt"]
+                self.mqtt = config["mqtt"] or self.mqtt
             if "watch" in config:
-                self.watch = config["watch"]
+                self.watch = config["watch"] or self.watch
             if "proc" in config:
-                self.proc = config["proc"]
+                self.proc = config["proc"] or {}
             if "options" in config:
-                self.options = config["options"]
-            self.ready = True
+                self.options = config["options"] or self.options
+            if "sinks" in config:
+                self.sinks = config["sinks"] or []
+            if "metrics" in config:
+                self.metrics = config["metrics"] or {}
+            if "aggregate" in config:
+                self.aggregate = config["aggregate"] or {}
+            self.ready = self.validate()
+
+    def validate(self):
+        """ Check the types the watcher relies on, sets error and returns False if the config is unusable """
+        for section, expected in (("mqtt", dict), ("watch", dict), ("proc", (dict, list)), ("options", dict),
+                                  ("sinks", list), ("metrics", dict), ("aggregate", dict)):
+            if not isinstance(getattr(self, section), expected):
+                self.error = f"Config section {section} must be a {'list' if expected is list else 'mapping'}"
+                return False
+        if not isinstance(self.mqtt.get("host"), str):
+            self.error = "mqtt host must be a string"
+            return False
+        if not isinstance(self.mqtt.get("port", 1883), int):
+            self.error = "mqtt port must be a number"
+            return False
+        interval = self.options.get("watch_interval")
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+            self.error = "options watch_interval must be a positive number"
+            return False
+        if isinstance(self.proc, dict):
+            for parent, children in self.proc.items():
+                if children is not None and not isinstance(children, list):
+                    self.error = f"proc {parent} must be a list of child process names"
+                    return False
+        from rules import parse_rules
+        try:
+            parse_rules(self.proc)
+        except (ValueError, TypeError, AttributeError) as e:
+            # re.error is a ValueError
+            self.error = f"Invalid proc rule: {e}"
+            return False
+        for sink in self.sinks:
+            if not isinstance(sink, dict):
+                self.error = "sinks entries must be mappings"
+                return False
+        return True
+
+    def diff(self, other):
+        """ Return the names of the sections that differ from another UserConfig """
+        return {section for section in self.sections if getattr(self, section) != getattr(other, section)}
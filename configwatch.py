@@ -0,0 +1,149 @@
+import os
+import sys
+import errno
+import select
+import struct
+import threading
+
+# linux/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Editors usually write a temporary file and rename it over the config, so the directory is watched
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB
+
+INOTIFY_EVENT = struct.Struct("=iIII")
+
+
+class Inotify:
+    """ Minimal ctypes binding for inotify, raises OSError where it is not available """
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.get_errno = ctypes.get_errno
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = self.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read(self):
+        """ Return the names of the files in the events read, empty if nothing is pending """
+        try:
+            data = os.read(self.fd, 4096)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        names = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class ConfigWatcher:
+    """ Call callback when the config file changes, using inotify on Linux and mtime polling elsewhere """
+    def __init__(self, path, callback, interval=2, settle=0.25, verbose=False):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.interval = interval
+        # Wait for a burst of writes to finish before reloading
+        self.settle = settle
+        self.verbose = verbose
+        self.inotify = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.signature = self.__signature__()
+        self.stats = {"changes": 0, "backend": None}
+
+    def __signature__(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def start(self):
+        if self.thread:
+            return
+        self.stop_event.clear()
+        if sys.platform.startswith("linux"):
+            try:
+                self.inotify = Inotify()
+                self.inotify.add_watch(os.path.dirname(self.path), WATCH_MASK)
+            except (OSError, AttributeError) as e:
+                if self.verbose:
+                    print(f"inotify unavailable, polling the config file: {e}")
+                if self.inotify:
+                    self.inotify.close()
+                self.inotify = None
+        self.stats["backend"] = "inotify" if self.inotify else "poll"
+        self.thread = threading.Thread(target=self.__watch_thread__, name="config-watch", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        thread = self.thread
+        if thread and thread is not threading.current_thread():
+            thread.join(self.interval + 1)
+        self.thread = None
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def __wait_inotify__(self):
+        """ Block until an event names the config file or the watcher is stopped """
+        name = os.path.basename(self.path)
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select([self.inotify.fd], [], [], 1)
+            if readable and name in self.inotify.read():
+                return True
+        return False
+
+    def __check__(self):
+        """ Compare the file signature, the inotify event alone may be a no-op touch """
+        signature = self.__signature__()
+        if signature == self.signature or signature is None:
+            return
+        self.signature = signature
+        self.stats["changes"] += 1
+        if self.verbose:
+            print(f"Config file changed: {self.path}")
+        try:
+            self.callback()
+        except Exception as e:
+            print(f"Error reloading config: {e}", file=sys.stderr)
+
+    def __watch_thread__(self):
+        while not self.stop_event.is_set():
+            if self.inotify:
+                if not self.__wait_inotify__():
+                    break
+                if self.stop_event.wait(self.settle):
+                    break
+                # Drain the events of the rest of the write
+                self.inotify.read()
+            elif self.stop_event.wait(self.interval):
+                break
+            self.__check__()
@@ -0,0 +1,115 @@
+import os
+import sys
+import signal
+import threading
+import startup
+from watch import MeetingWatcher
+
+
+class HeadlessApp:
+    """ Run the MeetingWatcher without a menu bar, e.g. as a systemd service """
+    def __init__(self, app_config, pidfile=None):
+        self.app_config = app_config
+        self.verbose = app_config.verbose
+        self.pidfile = pidfile
+        self.status = False
+        self.state = False
+        self.stop_event = threading.Event()
+        self.reload_requested = False
+        self.meeting_watcher = None
+
+    def status_callback(self, status):
+        if status != self.status and self.verbose:
+            print(f"Watching: {status}")
+        self.status = status
+
+    def state_callback(self, state):
+        if state != self.state:
+            print("Meeting in Progress" if state else "Meeting Completed", flush=True)
+        self.state = state
+
+    def __write_pidfile__(self):
+        """ Create the pidfile, refusing to start if another watcher owns it """
+        if os.path.exists(self.pidfile):
+            try:
+                with open(self.pidfile, "r") as pid_file:
+                    pid = int(pid_file.read().strip())
+                os.kill(pid, 0)
+            except (ValueError, ProcessLookupError):
+                # Stale pidfile left by a crash
+                os.remove(self.pidfile)
+            except PermissionError:
+                raise RuntimeError(f"{self.pidfile} belongs to a running process")
+            else:
+                raise RuntimeError(f"Meeting Watcher is already running with pid {pid}")
+        fd = os.open(self.pidfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        with os.fdopen(fd, "w") as pid_file:
+            pid_file.write(f"{os.getpid()}\n")
+
+    def __remove_pidfile__(self):
+        try:
+            os.remove(self.pidfile)
+        except FileNotFoundError:
+            pass
+
+    def __handle_stop__(self, sig, frame):
+        if self.verbose:
+            print(f"Received {signal.Signals(sig).name}, stopping")
+        self.stop_event.set()
+
+    def __handle_hup__(self, sig, frame):
+        if self.verbose:
+            print("Received SIGHUP, reloading the config")
+        self.reload_requested = True
+        self.stop_event.set()
+
+    def __handle_usr1__(self, sig, frame):
+        if self.meeting_watcher:
+            path = self.meeting_watcher.dump_history()
+            print(f"Detector history written to {path}", flush=True)
+
+    def run(self):
+        """ Block until SIGTERM or SIGINT, returns the process exit code """
+        if not self.app_config.user_config.ready:
+            print(f"User config not ready. {self.app_config.user_config.error}", file=sys.stderr)
+            return 1
+        if self.pidfile:
+            try:
+                self.__write_pidfile__()
+            except (RuntimeError, OSError) as e:
+                print(f"Error writing pidfile: {e}", file=sys.stderr)
+                return 1
+
+        signal.signal(signal.SIGTERM, self.__handle_stop__)
+        signal.signal(signal.SIGINT, self.__handle_stop__)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.__handle_hup__)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.__handle_usr1__)
+
+        try:
+            self.meeting_watcher = MeetingWatcher(app_config=self.app_config,
+                                                  status_callback=self.status_callback,
+                                                  state_callback=self.state_callback
+                                                  )
+            self.meeting_watcher.publish("0")
+            self.meeting_watcher.start()
+            startup.mark("watcher started")
+            startup.report()
+            while True:
+                # Signal handlers run on the main thread while it waits here
+                self.stop_event.wait()
+                self.stop_event.clear()
+                if not self.reload_requested:
+                    break
+                self.reload_requested = False
+                # Applied by the watch loop between two cycles, a meeting in progress carries on
+                self.meeting_watcher.reload_config()
+        finally:
+            if self.meeting_watcher:
+                self.meeting_watcher.shutdown()
+            if self.pidfile:
+                self.__remove_pidfile__()
+        if self.verbose:
+            print("Exiting")
+        return 0
@@ -0,0 +1,403 @@
+import os
+import sys
+import glob
+import time
+
+# Registered detector classes by name
+DETECTORS = {}
+
+# Config names that resolve to a platform specific detector
+DETECTOR_ALIASES = {
+    "microphone": "coreaudio" if sys.platform == "darwin" else "alsa",
+}
+
+
+def register_detector(name):
+    """ Class decorator registering a detector under a config name """
+    def decorator(cls):
+        cls.name = name
+        DETECTORS[name] = cls
+        return cls
+    return decorator
+
+
+class Detector:
+    """ Base class for meeting detectors """
+    name = None
+    # The kind of signal the detector watches, e.g. microphone or proc
+    source = None
+    # Set when the detector sees a hint that a meeting may start soon
+    candidate = False
+    # Seconds the detector expects no meeting to start, lets the scheduler poll less often.
+    # 0 keeps polling at the minimum interval, e.g. around a scheduled meeting.
+    quiet_for = None
+    # Replaced by the watcher's clock, so a replay or test sees its virtual time
+    wall_clock = staticmethod(time.time)
+
+    def __init__(self, user_config, options=None, notify=None, verbose=False):
+        self.user_config = user_config
+        self.options = options or {}
+        self.notify = notify
+        self.verbose = verbose
+
+    @classmethod
+    def available(cls):
+        """ Return False if the detector cannot run on this platform """
+        return True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def reconfigure(self, user_config):
+        """ Pick up a reloaded config that kept this detector's options """
+        self.user_config = user_config
+
+    def invalidate(self):
+        """ Drop cached state so the next detect() looks again from scratch """
+        pass
+
+    def detect(self):
+        """ Return True if a meeting is detected """
+        raise NotImplementedError
+
+
+@register_detector("proc")
+class ProcessDetector(Detector):
+    """ Detect meeting processes using the proc parent/child rules """
+    source = "proc"
+
+    def __init__(self, user_config, options=None, notify=None, verbose=False):
+        super().__init__(user_config, options, notify, verbose)
+        # psutil is only imported when process watching is enabled
+        from scanner import ProcessScanner
+        if "proc_events" in user_config.options:
+            self.proc_events_backend = user_config.options["proc_events"]
+        else:
+            # Same default as config-default.yaml
+            self.proc_events_backend = "auto"
+        self.scanner = ProcessScanner(user_config.proc, verbose=verbose)
+        self.proc_events = None
+        self.match = None
+        self.rescan = True
+
+    def set_rules(self, rules):
+        """ Swap the proc rules, the cached process table is kept and matched again next cycle """
+        self.scanner.set_rules(rules)
+        self.rescan = True
+
+    def reconfigure(self, user_config):
+        if user_config.proc != self.user_config.proc:
+            self.set_rules(user_config.proc)
+        super().reconfigure(user_config)
+
+    def invalidate(self):
+        self.rescan = True
+
+    def start(self):
+        from procevents import create_proc_events
+        if self.proc_events is None:
+            self.proc_events = create_proc_events(self.proc_events_backend, self.scanner,
+                                                  self.notify or (lambda: None), verbose=self.verbose)
+
+    def stop(self):
+        if self.proc_events:
+            self.proc_events.stop()
+            self.proc_events = None
+
+    def detect(self):
+        # Event backends only ask for a scan when the process set changed
+        if self.proc_events is None or self.proc_events.consume() or self.rescan:
+            self.rescan = False
+            self.scanner.scan()
+            if self.verbose:
+                print(f"Process scan inspected {self.scanner.stats['inspected']} of {self.scanner.stats['processes']} processes")
+            self.match = self.scanner.match()
+            self.candidate = self.scanner.candidate()
+            if self.match and self.proc_events:
+                self.proc_events.watch_pid(self.match[2])
+        if self.match:
+            if self.verbose:
+                print(f"Found {self.match[1]} process ({self.match[0]}) running")
+            return True
+        return False
+
+
+@register_detector("coreaudio")
+class CoreAudioDetector(Detector):
+    """ Detect a microphone in use on macOS through CoreAudio """
+    source = "microphone"
+
+    def __init__(self, user_config, options=None, notify=None, verbose=False):
+        super().__init__(user_config, options, notify, verbose)
+        if "rescan_interval" in self.options:
+            self.rescan_interval = self.options["rescan_interval"]
+        else:
+            self.rescan_interval = 60
+        self.mic_ids = {}
+        self.scanned_at = None
+        self.AVFoundation = None
+        self.CoreAudio = None
+        self.opa = None
+
+    @classmethod
+    def available(cls):
+        return sys.platform == "darwin"
+
+    def start(self):
+        if self.CoreAudio is None:
+            import AVFoundation
+            import CoreAudio
+            self.AVFoundation = AVFoundation
+            self.CoreAudio = CoreAudio
+            self.opa = CoreAudio.AudioObjectPropertyAddress(
+                CoreAudio.kAudioDevicePropertyDeviceIsRunningSomewhere,
+                CoreAudio.kAudioObjectPropertyScopeGlobal,
+                CoreAudio.kAudioObjectPropertyElementMaster
+            )
+
+    def __enumerate__(self):
+        """ Refresh the cached capture device list """
+        self.mic_ids = {
+            mic.connectionID(): mic
+            for mic in self.AVFoundation.AVCaptureDevice.devicesWithMediaType_(
+                self.AVFoundation.AVMediaTypeAudio
+            )
+        }
+        self.scanned_at = time.monotonic()
+
+    def invalidate(self):
+        self.scanned_at = None
+
+    def detect(self):
+        import struct
+        self.start()
+        if self.scanned_at is None or time.monotonic() - self.scanned_at >= self.rescan_interval:
+            self.__enumerate__()
+        for mic_id in self.mic_ids:
+            try:
+                response = self.CoreAudio.AudioObjectGetPropertyData(mic_id, self.opa, 0, [], 4, None)
+                running = bool(struct.unpack('I', response[2])[0])
+            except Exception:
+                # The device was unplugged, re-enumerate on the next cycle
+                self.scanned_at = None
+                continue
+            if running:
+                if self.verbose:
+                    print(f"Microphone {self.mic_ids[mic_id]} is active")
+                return True
+        return False
+
+
+@register_detector("alsa")
+class AlsaCaptureDetector(Detector):
+    """ Detect an open capture stream on Linux through /proc/asound """
+    source = "microphone"
+
+    def __init__(self, user_config, options=None, notify=None, verbose=False):
+        super().__init__(user_config, options, notify, verbose)
+        if "proc_root" in self.options:
+            self.proc_root = self.options["proc_root"]
+        else:
+            self.proc_root = "/proc"
+        if "active_states" in self.options:
+            self.active_states = set(self.options["active_states"])
+        else:
+            self.active_states = {"RUNNING"}
+        self.cards = None
+        self.status_files = []
+        self.stats = {"enumerations": 0, "reads": 0}
+
+    @classmethod
+    def available(cls):
+        return sys.platform.startswith("linux")
+
+    def __read__(self, path):
+        self.stats["reads"] += 1
+        try:
+            with open(path, "r") as status_file:
+                return status_file.read()
+        except OSError:
+            return None
+
+    def __enumerate__(self):
+        """ Refresh the cached list of capture substream status files """
+        pattern = os.path.join(self.proc_root, "asound", "card*", "pcm*c", "sub*", "status")
+        self.status_files = sorted(glob.glob(pattern))
+        self.stats["enumerations"] += 1
+
+    def invalidate(self):
+        self.cards = None
+
+    def detect(self):
+        # The card list only changes on hotplug, re-enumerate the devices when it does
+        cards = self.__read__(os.path.join(self.proc_root, "asound", "cards"))
+        if cards != self.cards:
+            self.cards = cards
+            self.__enumerate__()
+        for status_file in self.status_files:
+            status = self.__read__(status_file)
+            if status is None:
+                # A device disappeared between cycles
+                self.cards = None
+                continue
+            for line in status.splitlines():
+                if line.startswith("state:") and line.split(":", 1)[1].strip() in self.active_states:
+                    if self.verbose:
+                        print(f"Capture stream {status_file} is active")
+                    return True
+        return False
+
+
+@register_detector("network")
+class NetworkDetector(Detector):
+    """ Detect a call from the UDP media flows of the meeting processes on Linux """
+    source = "network"
+
+    def __init__(self, user_config, options=None, notify=None, verbose=False):
+        super().__init__(user_config, options, notify, verbose)
+        from netdetect import NetworkMonitor, IGNORE_PORTS
+        if "proc_root" in self.options:
+            proc_root = self.options["proc_root"]
+        else:
+            proc_root = "/proc"
+        if "min_flows" in self.options:
+            self.min_flows = self.options["min_flows"]
+        else:
+            self.min_flows = 1
+        self.monitor = NetworkMonitor(
+            self.__rules__(user_config),
+            proc_root=proc_root,
+            ignore_ports=self.options.get("ignore_ports", IGNORE_PORTS),
+            unconnected=self.options.get("unconnected", False)
+        )
+
+    @classmethod
+    def available(cls):
+        return sys.platform.startswith("linux")
+
+    def __rules__(self, user_config):
+        """ The processes option, or the processes of the proc rules """
+        from rules import RuleSet
+        from netdetect import watch_rules
+        if "processes" in self.options:
+            return watch_rules(self.options["processes"])
+        return RuleSet.from_config(user_config.proc)
+
+    def reconfigure(self, user_config):
+        if "processes" not in self.options and user_config.proc != self.user_config.proc:
+            self.monitor.set_rules(self.__rules__(user_config))
+        super().reconfigure(user_config)
+
+    def invalidate(self):
+        self.monitor.set_rules(self.monitor.rules)
+
+    def detect(self):
+        flows = self.monitor.flows()
+        # A meeting app holding no media flows may still start a call
+        self.candidate = bool(self.monitor.watched)
+        if len(flows) >= self.min_flows:
+            if self.verbose:
+                print(f"{len(flows)} UDP media flows held by pids {', '.join(str(pid) for pid in sorted(set(flows.values())))}")
+            return True
+        return False
+
+
+@register_detector("calendar")
+class CalendarDetector(Detector):
+    """ Poll quickly around the meetings of a local ICS calendar and slowly in between
+
+    The calendar alone never reports a meeting, it only steers the adaptive scheduler.
+    """
+    source = "calendar"
+
+    def __init__(self, user_config, options=None, notify=None, verbose=False):
+        super().__init__(user_config, options, notify, verbose)
+        from icscal import CalendarIndex
+        if "path" not in self.options:
+            raise ValueError("The calendar detector needs a path to an .ics file")
+        self.calendar = CalendarIndex(self.options["path"], horizon=self.options.get("horizon_days", 14) * 86400,
+                                      verbose=verbose)
+        # Seconds before a meeting starts and after it ends to keep polling quickly
+        if "lead" in self.options:
+            self.lead = self.options["lead"]
+        else:
+            self.lead = 300
+        if "after" in self.options:
+            self.after = self.options["after"]
+        else:
+            self.after = 600
+        if "check_interval" in self.options:
+            self.check_interval = self.options["check_interval"]
+        else:
+            self.check_interval = 30
+        self.checked_at = None
+
+    def __refresh__(self, now):
+        if self.checked_at is None or now - self.checked_at >= self.check_interval:
+            self.checked_at = now
+            self.calendar.refresh(now)
+            if self.calendar.error and self.verbose:
+                print(self.calendar.error)
+
+    def invalidate(self):
+        self.checked_at = None
+        self.calendar.signature = None
+
+    def detect(self):
+        now = self.wall_clock()
+        # Loads run on the engine's executor, including the first one. If it outlasts the detector deadline the
+        # engine skips this detector until it finishes, the index stays empty meanwhile
+        self.__refresh__(now)
+        index = self.calendar.index
+        self.candidate = index.covers(now, self.lead, self.after)
+        if self.candidate:
+            # The scheduler only polls quickly for a while after a candidate appears, keep it fast for the whole meeting
+            self.quiet_for = 0.0
+        else:
+            # Nothing scheduled before the next meeting, or before the end of the indexed window
+            horizon = index.next_start(now)
+            if horizon is None and self.calendar.window:
+                horizon = self.calendar.window[1]
+            self.quiet_for = max(0.0, horizon - self.lead - now) if horizon is not None else None
+        return False
+
+
+def create_detectors(user_config, notify=None, verbose=False, wall_clock=None):
+    """ Build the enabled detectors from the watch section of the user config """
+    watch = dict(user_config.watch or {})
+    # The microphone was watched by default before detectors were configurable
+    watch.setdefault("microphone", True)
+    detectors = []
+    for config_name, value in watch.items():
+        if isinstance(value, dict):
+            options = value
+            enabled = value.get("enabled", True)
+        else:
+            options = {}
+            enabled = bool(value)
+        if not enabled:
+            continue
+        name = DETECTOR_ALIASES.get(config_name, config_name)
+        if name not in DETECTORS:
+            if verbose:
+                print(f"Unknown detector: {config_name}")
+            continue
+        detector_class = DETECTORS[name]
+        if not detector_class.available():
+            if verbose:
+                print(f"Detector {name} is not available on {sys.platform}")
+            continue
+        if verbose:
+            print(f"Watching {config_name} ({name})")
+        try:
+            detector = detector_class(user_config, options=options, notify=notify, verbose=verbose)
+        except ValueError as e:
+            print(f"Detector {config_name} not started: {e}", file=sys.stderr)
+            continue
+        if wall_clock is not None:
+            detector.wall_clock = wall_clock
+        detectors.append(detector)
+    return detectors
@@ -0,0 +1,148 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import REGISTRY
+
+DETECTOR_SECONDS = REGISTRY.histogram("meeting_watcher_detector_seconds", "Detector call latency", labels=("detector",))
+DETECTOR_TIMEOUTS = REGISTRY.counter("meeting_watcher_detector_timeouts_total", "Detector calls over the deadline",
+                                     labels=("detector",))
+DETECTOR_ERRORS = REGISTRY.counter("meeting_watcher_detector_errors_total", "Detector calls that raised",
+                                   labels=("detector",))
+
+
+class DetectionEngine:
+    """ Run the detectors concurrently with a deadline per detector """
+    def __init__(self, detectors, timeout=2.0, max_workers=None, threshold=1.0, verbose=False):
+        self.detectors = detectors
+        self.timeout = timeout
+        # Summed weight of the positive detectors needed to call it a meeting
+        self.threshold = threshold
+        self.verbose = verbose
+        self.max_workers = max_workers or max(2, len(detectors) + 1)
+        self.executor = None
+        # Detectors whose previous call is still stuck in a worker thread
+        self.busy = set()
+        self.lock = threading.Lock()
+        self.stats = {}
+        for detector in detectors:
+            self.__detector_stats__(detector)
+
+    def __detector_stats__(self, detector):
+        if detector.name not in self.stats:
+            self.stats[detector.name] = {
+                "calls": 0,
+                "timeouts": 0,
+                "errors": 0,
+                "skipped": 0,
+                "last_latency": None,
+                "max_latency": 0.0,
+                "total_latency": 0.0,
+            }
+        return self.stats[detector.name]
+
+    def set_detectors(self, detectors):
+        """ Swap the detector list between cycles """
+        self.detectors = detectors
+        for detector in detectors:
+            self.__detector_stats__(detector)
+        if self.max_workers < len(detectors) + 1:
+            self.max_workers = len(detectors) + 1
+            # The pool is recreated with more workers on the next cycle
+            self.stop()
+
+    def __timeout__(self, detector):
+        if "timeout" in detector.options:
+            return detector.options["timeout"]
+        return self.timeout
+
+    @staticmethod
+    def weight(detector):
+        return detector.options.get("weight", 1.0)
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="detector")
+
+    def stop(self):
+        if self.executor:
+            # Do not wait for detectors stuck in a blocking call
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def __call_blocking__(self, detector):
+        try:
+            return detector.detect()
+        finally:
+            with self.lock:
+                self.busy.discard(detector)
+
+    async def __run_detector__(self, detector):
+        """ Run one detector, returns (detector, result) where result is None on failure """
+        stats = self.__detector_stats__(detector)
+        blocking = not asyncio.iscoroutinefunction(detector.detect)
+        if blocking:
+            with self.lock:
+                if detector in self.busy:
+                    stats["skipped"] += 1
+                    if self.verbose:
+                        print(f"Detector {detector.name} is still busy, skipping")
+                    return detector, None
+                self.busy.add(detector)
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        result = None
+        try:
+            if blocking:
+                future = loop.run_in_executor(self.executor, self.__call_blocking__, detector)
+                result = await asyncio.wait_for(future, self.__timeout__(detector))
+            else:
+                result = await asyncio.wait_for(detector.detect(), self.__timeout__(detector))
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            DETECTOR_TIMEOUTS.inc(detector=detector.name)
+            if self.verbose:
+                print(f"Detector {detector.name} timed out after {self.__timeout__(detector)}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats["errors"] += 1
+            DETECTOR_ERRORS.inc(detector=detector.name)
+            if self.verbose:
+                print(f"Detector {detector.name} failed: {e}")
+        latency = time.perf_counter() - started
+        stats["calls"] += 1
+        stats["last_latency"] = latency
+        stats["total_latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        DETECTOR_SECONDS.observe(latency, detector=detector.name)
+        return detector, result
+
+    async def run_cycle(self):
+        """ Run all detectors, returning (in_meeting, {name: result}) as soon as the positive weight reaches the threshold """
+        self.start()
+        results = {}
+        in_meeting = False
+        score = 0.0
+        tasks = [asyncio.ensure_future(self.__run_detector__(detector)) for detector in self.detectors]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                detector, result = await next_done
+                results[detector.name] = result
+                if result:
+                    score += self.weight(detector)
+                    if score >= self.threshold:
+                        in_meeting = True
+                        break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        if self.verbose:
+            latencies = ", ".join(
+                f"{name}={self.stats[name]['last_latency'] * 1000:.1f}ms"
+                for name in results if self.stats[name]["last_latency"] is not None
+            )
+            print(f"Detector latency: {latencies}")
+        return in_meeting, results
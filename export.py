@@ -0,0 +1,200 @@
+import os
+import sys
+import csv
+import json
+import sqlite3
+
+EXPORT_COLUMNS = ("id", "start_time", "end_time", "duration", "last_seen")
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+SQL_EXPORT = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM log WHERE end_time IS NOT NULL"
+# Meetings still running are left for the next incremental export, and so is everything after them
+SQL_EXPORT_FINISHED = " AND id < COALESCE((SELECT MIN(id) FROM log WHERE end_time IS NULL), 9223372036854775807)"
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_query(since=None, start=None, end=None):
+    """ Build the export query, date ranges walk the end_time index and everything else the primary key """
+    sql = SQL_EXPORT
+    params = []
+    if since is not None:
+        sql += " AND id > ?" + SQL_EXPORT_FINISHED
+        params.append(since)
+    if start is not None:
+        sql += " AND end_time >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND end_time < ?"
+        params.append(end)
+    if start is not None or end is not None:
+        sql += " ORDER BY end_time, id"
+    else:
+        sql += " ORDER BY id"
+    return sql, params
+
+
+class CsvWriter:
+    def __init__(self, output, header=True):
+        self.writer = csv.writer(output)
+        if header:
+            self.writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class NdjsonWriter:
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, rows):
+        self.output.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows)
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """ Each fetched batch becomes a row group, pyarrow is only needed for this format """
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ("id", pyarrow.int64()),
+            ("start_time", pyarrow.string()),
+            ("end_time", pyarrow.string()),
+            ("duration", pyarrow.float64()),
+            ("last_seen", pyarrow.string()),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+def load_mark(mark_file, key):
+    try:
+        with open(mark_file, "r") as marks:
+            return json.load(marks).get(key)
+    except (OSError, ValueError):
+        return None
+
+
+def save_mark(mark_file, key, last_id):
+    """ Store the highest exported id for an output, replacing the file atomically """
+    try:
+        with open(mark_file, "r") as marks:
+            saved = json.load(marks)
+    except (OSError, ValueError):
+        saved = {}
+    saved[key] = last_id
+    tmp_path = f"{mark_file}.tmp"
+    with open(tmp_path, "w") as marks:
+        json.dump(saved, marks, indent=2, sort_keys=True)
+    os.replace(tmp_path, mark_file)
+
+
+def export_log(db_path, output, fmt, since=None, start=None, end=None, batch_size=1000, header=True):
+    """ Stream the finished meetings to output, returns (rows exported, highest id exported)
+
+    output is a text file object for csv and ndjson and a path for parquet. Rows are fetched
+    batch_size at a time, so memory does not grow with the size of the log.
+    """
+    if not os.path.exists(db_path):
+        raise ExportError(f"Meeting log not found: {db_path}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sql, params = export_query(since, start, end)
+        try:
+            cursor = conn.execute(sql, params)
+        except sqlite3.Error as e:
+            raise ExportError(f"Error reading meeting log: {e}")
+        if fmt == "parquet":
+            writer = ParquetWriter(output)
+        elif fmt == "ndjson":
+            writer = NdjsonWriter(output)
+        else:
+            writer = CsvWriter(output, header)
+        count = 0
+        last_id = since
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                writer.write(rows)
+                count += len(rows)
+                batch_last = max(row[0] for row in rows)
+                last_id = batch_last if last_id is None else max(last_id, batch_last)
+        finally:
+            writer.close()
+        return count, last_id
+    finally:
+        conn.close()
+
+
+def run(app_config, args):
+    """ The export command, returns the process exit code """
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.output or "")[1].lstrip(".").lower()
+        fmt = {"json": "ndjson", "jsonl": "ndjson", "pq": "parquet"}.get(extension, extension)
+        if fmt not in EXPORT_FORMATS:
+            fmt = "csv"
+    if fmt == "parquet" and not args.output:
+        print("Parquet export needs --output", file=sys.stderr)
+        return 1
+
+    mark_file = args.mark_file or os.path.join(app_config.user_config_path, "export-marks.json")
+    mark_key = os.path.abspath(args.output) if args.output else "-"
+    since = args.since
+    if since == "saved":
+        since = load_mark(mark_file, mark_key) or 0
+    elif since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            print(f"--since takes a meeting id, got {since}", file=sys.stderr)
+            return 1
+
+    # Incremental text exports are appended to the previous one
+    append = args.since is not None and fmt != "parquet" and bool(args.output) and os.path.exists(args.output)
+    output = None
+    try:
+        if fmt == "parquet":
+            output = args.output
+        elif args.output:
+            output = open(args.output, "a" if append else "w", newline="")
+        else:
+            output = sys.stdout
+        count, last_id = export_log(app_config.log_db_file, output, fmt, since=since, start=args.start,
+                                    end=args.end, batch_size=args.batch_size, header=not append)
+    except (ExportError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        if output is not None and output is not sys.stdout and not isinstance(output, str):
+            output.close()
+
+    if args.since is not None and last_id is not None:
+        save_mark(mark_file, mark_key, last_id)
+    if app_config.verbose:
+        print(f"Exported {count} meetings as {fmt}" + (f", up to id {last_id}" if last_id is not None else ""),
+              file=sys.stderr)
+    return 0
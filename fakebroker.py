@@ -0,0 +1,187 @@
+"""
+Minimal in-process MQTT 3.1.1 broker for exercising the publisher without a real broker.
+
+Usage:
+    broker = FakeBroker()
+    port = broker.start()
+    ...
+    broker.stop()
+"""
+import asyncio
+import struct
+import threading
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def topic_matches(subscription, topic):
+    """ Match a topic against a subscription filter with + and # wildcards """
+    sub_parts = subscription.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(sub_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(sub_parts) == len(topic_parts)
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value):
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + encode_length(len(body)) + body
+
+
+class FakeBroker:
+    """ Accepts connections on localhost and routes QoS 0/1 publishes to subscribers at QoS 0 """
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.clients = {}
+        self.retained = {}
+        # (topic, payload, retain) for every publish received
+        self.received = []
+        self.started = threading.Event()
+        self.stopping = None
+
+    async def __read_packet__(self, reader):
+        header = await reader.readexactly(1)
+        multiplier = 1
+        length = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def __deliver__(self, topic, payload, retain=False):
+        message = packet(PUBLISH, 1 if retain else 0, encode_string(topic) + payload)
+        for writer, subscriptions in list(self.clients.items()):
+            if any(topic_matches(subscription, topic) for subscription in subscriptions):
+                writer.write(message)
+
+    def __handle_publish__(self, writer, flags, body):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        topic_length = struct.unpack_from("!H", body)[0]
+        topic = body[2:2 + topic_length].decode()
+        offset = 2 + topic_length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            writer.write(packet(PUBACK, 0, packet_id))
+        payload = body[offset:]
+        self.received.append((topic, payload, retain))
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        self.__deliver__(topic, payload)
+
+    def __handle_subscribe__(self, writer, body):
+        packet_id = body[:2]
+        offset = 2
+        granted = bytearray()
+        while offset < len(body):
+            topic_length = struct.unpack_from("!H", body, offset)[0]
+            subscription = body[offset + 2:offset + 2 + topic_length].decode()
+            offset += 2 + topic_length + 1
+            self.clients[writer].add(subscription)
+            granted.append(0)
+            for topic, payload in self.retained.items():
+                if topic_matches(subscription, topic):
+                    writer.write(packet(PUBLISH, 1, encode_string(topic) + payload))
+        writer.write(packet(SUBACK, 0, packet_id + bytes(granted)))
+
+    async def __handle_client__(self, reader, writer):
+        self.clients[writer] = set()
+        try:
+            while True:
+                packet_type, flags, body = await self.__read_packet__(reader)
+                if packet_type == CONNECT:
+                    writer.write(packet(CONNACK, 0, b"\x00\x00"))
+                elif packet_type == PUBLISH:
+                    self.__handle_publish__(writer, flags, body)
+                elif packet_type == SUBSCRIBE:
+                    self.__handle_subscribe__(writer, body)
+                elif packet_type == UNSUBSCRIBE:
+                    writer.write(packet(UNSUBACK, 0, body[:2]))
+                elif packet_type == PINGREQ:
+                    writer.write(packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def __serve__(self):
+        self.stopping = asyncio.Event()
+        self.server = await asyncio.start_server(self.__handle_client__, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        await self.stopping.wait()
+        self.server.close()
+        for writer in list(self.clients):
+            writer.close()
+        # Let the client handlers see the closed connections and exit
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    def __run_thread__(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.__serve__())
+        finally:
+            self.loop.close()
+
+    def start(self):
+        """ Start the broker in a background thread and return the port it listens on """
+        self.started.clear()
+        self.thread = threading.Thread(target=self.__run_thread__, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self.port
+
+    def stop(self):
+        """ Stop the broker and drop every client connection, the port is reused on the next start """
+        if self.loop and self.thread:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.thread.join()
+            self.thread = None
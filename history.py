@@ -0,0 +1,182 @@
+import json
+import math
+from array import array
+from collections import deque
+
+# Up to 7 detectors share the flag bits with the meeting state
+MAX_DETECTORS = 7
+# Two bits per detector result
+RESULT_NOT_RUN = 0
+RESULT_FALSE = 1
+RESULT_TRUE = 2
+RESULT_FAILED = 3
+RESULT_VALUES = {RESULT_NOT_RUN: "skipped", RESULT_FALSE: False, RESULT_TRUE: True, RESULT_FAILED: None}
+# Cycle latency is kept as a power of two bucket, 0 is under 1/16 ms and 15 is over a second
+LATENCY_BUCKETS = 16
+MAX_DELTA = 0xFFFF
+MAX_SYMBOLS = 256
+
+
+def latency_bucket(seconds):
+    milliseconds = seconds * 1000
+    if milliseconds <= 1 / 16:
+        return 0
+    return min(LATENCY_BUCKETS - 1, max(0, math.ceil(math.log2(milliseconds)) + 4))
+
+
+def bucket_latency(bucket):
+    """ Upper bound of a latency bucket in milliseconds """
+    return 2 ** (bucket - 4)
+
+
+class HistoryBlock:
+    """ Samples stored as one byte symbols, each symbol is a (time delta, latency bucket, flags) key """
+    __slots__ = ("start", "last", "keys", "symbols", "samples")
+
+    def __init__(self, start):
+        self.start = start
+        # Reconstructed time of the last sample, deltas are taken from it so rounding does not drift
+        self.last = start
+        self.keys = array("I")
+        # key -> symbol, only kept while the block is written to
+        self.symbols = {}
+        self.samples = bytearray()
+
+    @property
+    def nbytes(self):
+        return len(self.samples) + self.keys.itemsize * len(self.keys)
+
+    def add(self, key):
+        """ Append a sample, returns False if the symbol table is full """
+        symbol = self.symbols.get(key)
+        if symbol is None:
+            if len(self.keys) >= MAX_SYMBOLS:
+                return False
+            symbol = self.symbols[key] = len(self.keys)
+            self.keys.append(key)
+        self.samples.append(symbol)
+        return True
+
+    def close(self):
+        self.symbols = None
+
+
+class SampleHistory:
+    """ Bounded record of every detection cycle in about a byte per sample
+
+    Timestamps are stored as decisecond deltas and the meeting state, detector results
+    and latency bucket are bit-packed into a key. A block maps its distinct keys to one
+    byte symbols, a steady watch loop only produces a few dozen of them.
+    """
+    def __init__(self, max_samples=7 * 24 * 3600, block_size=65536):
+        self.max_samples = max_samples
+        self.block_size = block_size
+        self.blocks = deque()
+        self.detectors = []
+        self.count = 0
+        self.stats = {"recorded": 0, "dropped": 0, "blocks": 0}
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.blocks)
+
+    def __detector_index__(self, name):
+        if name in self.detectors:
+            return self.detectors.index(name)
+        if len(self.detectors) >= MAX_DETECTORS:
+            return None
+        self.detectors.append(name)
+        return len(self.detectors) - 1
+
+    def __flags__(self, in_meeting, results):
+        flags = 1 if in_meeting else 0
+        for name, result in results.items():
+            index = self.__detector_index__(name)
+            if index is None:
+                continue
+            value = RESULT_FAILED if result is None else RESULT_TRUE if result else RESULT_FALSE
+            flags |= value << (1 + 2 * index)
+        return flags
+
+    def __new_block__(self, timestamp):
+        if self.blocks:
+            self.blocks[-1].close()
+        block = HistoryBlock(timestamp)
+        self.blocks.append(block)
+        self.stats["blocks"] += 1
+        # Drop whole blocks once the oldest one is no longer needed to hold max_samples
+        while len(self.blocks) > 1 and self.count - len(self.blocks[0].samples) >= self.max_samples:
+            dropped = self.blocks.popleft()
+            self.count -= len(dropped.samples)
+            self.stats["dropped"] += len(dropped.samples)
+        return block
+
+    def record(self, timestamp, in_meeting, results, latency):
+        """ Record one cycle: results maps detector name -> True, False or None when it failed """
+        flags = self.__flags__(in_meeting, results)
+        bucket = latency_bucket(latency)
+        block = self.blocks[-1] if self.blocks else None
+        delta = round((timestamp - block.last) * 10) if block else None
+        if block is None or len(block.samples) >= self.block_size or not 0 <= delta <= MAX_DELTA:
+            # A new block also starts after a gap too long for a delta, e.g. while the watcher was stopped
+            block = self.__new_block__(timestamp)
+            delta = 0
+        key = (delta << 20) | (bucket << 16) | flags
+        if not block.add(key):
+            block = self.__new_block__(timestamp)
+            delta = 0
+            block.add((bucket << 16) | flags)
+        block.last += delta / 10
+        self.count += 1
+        self.stats["recorded"] += 1
+
+    def __decode__(self, timestamp, key):
+        flags = key & 0xFFFF
+        return {
+            "timestamp": round(timestamp, 1),
+            "in_meeting": bool(flags & 1),
+            "latency_ms": bucket_latency((key >> 16) & 0x0F),
+            "detectors": {
+                name: RESULT_VALUES[(flags >> (1 + 2 * index)) & 0x03]
+                for index, name in enumerate(self.detectors)
+                if (flags >> (1 + 2 * index)) & 0x03 != RESULT_NOT_RUN
+            },
+        }
+
+    def __block_samples__(self, block, skip=0, since=None):
+        """ Decode a block, the first skip samples only advance the clock """
+        timestamp = block.start
+        keys = block.keys
+        for index, symbol in enumerate(bytes(block.samples)):
+            key = keys[symbol]
+            timestamp += (key >> 20) / 10
+            if index >= skip and (since is None or timestamp > since):
+                yield self.__decode__(timestamp, key)
+
+    def samples(self, since=None):
+        """ Yield the recorded samples oldest first, optionally only those after the since timestamp """
+        for block in list(self.blocks):
+            yield from self.__block_samples__(block, since=since)
+
+    def recent(self, count=50):
+        """ The last count samples, newest first """
+        recent = []
+        for block in reversed(list(self.blocks)):
+            needed = count - len(recent)
+            if needed <= 0:
+                break
+            skip = max(0, len(block.samples) - needed)
+            recent.extend(reversed(list(self.__block_samples__(block, skip))))
+        return recent
+
+    def dump(self, path):
+        """ Write every sample as NDJSON, returns the number written """
+        count = 0
+        with open(path, "w") as dump_file:
+            for sample in self.samples():
+                dump_file.write(json.dumps(sample) + "\n")
+                count += 1
+        return count
@@ -0,0 +1,407 @@
+import os
+import re
+import calendar
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+DURATION = re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+# Occurrences are only expanded this far from the window, bounding work on rules without an end
+MAX_OCCURRENCES = 10000
+
+
+def unfold(text):
+    """ Join folded content lines, a line starting with a space or tab continues the previous one """
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+def parse_property(line):
+    """ Split NAME;PARAM=VALUE:value into (name, {param: value}, value) """
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            break
+    else:
+        return None
+    head, value = line[:index], line[index + 1:]
+    parts = head.split(";")
+    params = {}
+    for part in parts[1:]:
+        key, _, param = part.partition("=")
+        params[key.upper()] = param.strip('"')
+    return parts[0].upper(), params, value
+
+
+def parse_duration(value):
+    match = DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration {value}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    delta = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                      minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -delta if sign == "-" else delta
+
+
+def parse_datetime(value, params):
+    """ Return an aware datetime, or None for an all-day DATE value """
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or "T" not in value:
+        return None
+    if value.endswith("Z"):
+        return datetime.strptime(value[:-1], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+    moment = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    return moment.replace(tzinfo=zone(params.get("TZID")))
+
+
+def parse_until(value, tzinfo):
+    """ The end of an RRULE, a DATE value includes the whole day in the event's zone """
+    value = value.strip()
+    if "T" in value:
+        return parse_datetime(value, {})
+    day = datetime.strptime(value, "%Y%m%d").replace(tzinfo=tzinfo)
+    return day + timedelta(days=1, microseconds=-1)
+
+
+def zone(tzid):
+    """ The zone for a TZID, floating times and unknown (e.g. Windows) zone names use the local zone """
+    if tzid:
+        try:
+            from zoneinfo import ZoneInfo
+            return ZoneInfo(tzid)
+        except (ImportError, ValueError, KeyError, OSError):
+            pass
+    return datetime.now().astimezone().tzinfo
+
+
+def parse_rrule(value):
+    rule = {}
+    for part in value.split(";"):
+        key, _, item = part.partition("=")
+        rule[key.upper()] = item
+    return rule
+
+
+class Event:
+    """ One VEVENT, with its recurrence rule if it has one """
+    __slots__ = ("uid", "start", "duration", "rrule", "exdates", "recurrence_id", "busy", "occurrences", "window",
+                 "counted")
+
+    def __init__(self, lines):
+        self.uid = None
+        self.start = None
+        self.duration = None
+        self.rrule = None
+        self.exdates = set()
+        self.recurrence_id = None
+        self.busy = True
+        # Expanded (start, end) timestamps for window
+        self.occurrences = None
+        self.window = None
+        # Every start of a rule with a COUNT, it has to be walked from the first start anyway
+        self.counted = None
+        end = None
+        for line in lines:
+            parsed = parse_property(line)
+            if parsed is None:
+                continue
+            name, params, value = parsed
+            if name == "UID":
+                self.uid = value
+            elif name == "DTSTART":
+                self.start = parse_datetime(value, params)
+            elif name == "DTEND":
+                end = parse_datetime(value, params)
+            elif name == "DURATION":
+                self.duration = parse_duration(value)
+            elif name == "RRULE":
+                self.rrule = parse_rrule(value)
+            elif name == "EXDATE":
+                for item in value.split(","):
+                    excluded = parse_datetime(item, params)
+                    if excluded is not None:
+                        self.exdates.add(excluded.timestamp())
+            elif name == "RECURRENCE-ID":
+                recurrence_id = parse_datetime(value, params)
+                self.recurrence_id = recurrence_id.timestamp() if recurrence_id else None
+            elif name == "STATUS" and value.upper() == "CANCELLED":
+                self.busy = False
+            elif name == "TRANSP" and value.upper() == "TRANSPARENT":
+                self.busy = False
+        if self.duration is None:
+            self.duration = end - self.start if end is not None and self.start is not None else timedelta()
+
+    @property
+    def schedulable(self):
+        """ All-day and free events are not meetings """
+        return self.start is not None
+
+    def __periods_since__(self, frequency, moment):
+        """ Whole periods between the first start and moment """
+        start = self.start
+        if frequency == "DAILY":
+            return (moment - start).days
+        if frequency == "WEEKLY":
+            return (moment - start).days // 7
+        if frequency == "MONTHLY":
+            return (moment.year - start.year) * 12 + moment.month - start.month
+        return moment.year - start.year
+
+    def __starts__(self, until, since=None):
+        """ Yield the recurrence start datetimes up to until, in the event's own zone
+
+        Without a COUNT the periods before since are skipped instead of walked.
+        """
+        rule = self.rrule
+        frequency = rule.get("FREQ")
+        if frequency not in FREQUENCIES:
+            yield self.start
+            return
+        interval = max(1, int(rule.get("INTERVAL", 1) or 1))
+        count = int(rule["COUNT"]) if "COUNT" in rule else None
+        rule_until = parse_until(rule["UNTIL"], self.start.tzinfo) if "UNTIL" in rule else None
+        if rule_until is not None:
+            until = min(until, rule_until)
+        byday = [item.strip() for item in rule.get("BYDAY", "").split(",") if item.strip()]
+        bymonthday = [int(item) for item in rule.get("BYMONTHDAY", "").split(",") if item.strip()]
+        emitted = 0
+        first = 0
+        if count is None and since is not None and since > self.start:
+            first = max(0, self.__periods_since__(frequency, since) // interval - 1)
+        for period in range(first, first + MAX_OCCURRENCES):
+            for start in self.__period__(frequency, interval * period, byday, bymonthday):
+                if start < self.start:
+                    continue
+                if start > until or (count is not None and emitted >= count):
+                    return
+                emitted += 1
+                yield start
+            if self.__period_start__(frequency, interval * period) > until:
+                return
+
+    def __period_start__(self, frequency, offset):
+        start = self.start
+        if frequency == "DAILY":
+            return start + timedelta(days=offset)
+        if frequency == "WEEKLY":
+            return start + timedelta(weeks=offset)
+        months = start.month - 1 + (offset if frequency == "MONTHLY" else offset * 12)
+        year, month = start.year + months // 12, months % 12 + 1
+        return start.replace(year=year, month=month, day=1)
+
+    def __period__(self, frequency, offset, byday, bymonthday):
+        """ The starts in one period of the rule, sorted """
+        start = self.start
+        period = self.__period_start__(frequency, offset)
+        if frequency == "DAILY":
+            if byday and not any(period.weekday() == WEEKDAYS.get(day[-2:]) for day in byday):
+                return []
+            return [period]
+        if frequency == "WEEKLY":
+            if not byday:
+                return [period]
+            week = period - timedelta(days=period.weekday())
+            return sorted(week + timedelta(days=WEEKDAYS[day[-2:]]) for day in byday if day[-2:] in WEEKDAYS)
+        if frequency == "YEARLY":
+            period = period.replace(month=start.month)
+        days_in_month = calendar.monthrange(period.year, period.month)[1]
+        days = []
+        for day in bymonthday:
+            day = day if day > 0 else days_in_month + day + 1
+            if 1 <= day <= days_in_month:
+                days.append(day)
+        for item in byday:
+            weekday = WEEKDAYS.get(item[-2:])
+            if weekday is None:
+                continue
+            matching = [day for day in range(1, days_in_month + 1)
+                        if calendar.weekday(period.year, period.month, day) == weekday]
+            ordinal = item[:-2]
+            if ordinal and ordinal not in ("+", "-"):
+                index = int(ordinal)
+                if -len(matching) <= index <= len(matching) and index != 0:
+                    days.append(matching[index - 1 if index > 0 else index])
+            else:
+                days.extend(matching)
+        if not bymonthday and not byday:
+            days = [start.day] if start.day <= days_in_month else []
+        return [period.replace(day=day) for day in sorted(set(days))]
+
+    def expand(self, window_start, window_end):
+        """ Return the (start, end) timestamps overlapping the window, cached per window """
+        if self.window == (window_start, window_end):
+            return self.occurrences
+        occurrences = []
+        seconds = self.duration.total_seconds()
+        if self.rrule is None:
+            start = self.start.timestamp()
+            if start + seconds >= window_start and start <= window_end:
+                occurrences.append((start, start + seconds))
+        else:
+            if "COUNT" in self.rrule:
+                if self.counted is None:
+                    self.counted = array("d", (start.timestamp() for start in self.__starts__(datetime.max.replace(
+                        tzinfo=timezone.utc))))
+                starts = self.counted[bisect_right(self.counted, window_start - seconds):
+                                      bisect_right(self.counted, window_end)]
+            else:
+                until = datetime.fromtimestamp(window_end, tz=self.start.tzinfo)
+                since = datetime.fromtimestamp(window_start - seconds, tz=self.start.tzinfo)
+                starts = (start.timestamp() for start in self.__starts__(until, since))
+            for start in starts:
+                if start + seconds >= window_start and start not in self.exdates:
+                    occurrences.append((start, start + seconds))
+        self.occurrences = occurrences
+        self.window = (window_start, window_end)
+        return occurrences
+
+
+def parse_events(text):
+    """ Split a calendar into its VEVENT blocks, returns [(block text, lines)] """
+    events = []
+    lines = None
+    for line in unfold(text):
+        upper = line.upper()
+        if upper == "BEGIN:VEVENT":
+            lines = []
+        elif upper == "END:VEVENT":
+            if lines is not None:
+                events.append(("\n".join(lines), lines))
+            lines = None
+        elif lines is not None and not upper.startswith("BEGIN:VALARM"):
+            lines.append(line)
+    return events
+
+
+class IntervalIndex:
+    """ Intervals sorted by start with the running maximum of their ends
+
+    Finding an interval that covers a time is a bisect on the starts and one look at the
+    running maximum, the next start is a bisect too.
+    """
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = array("d", (start for start, _ in intervals))
+        self.ends = array("d", (end for _, end in intervals))
+        self.max_ends = array("d")
+        running = float("-inf")
+        for end in self.ends:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def covers(self, moment, before=0, after=0):
+        """ True if an interval, widened by before and after, contains moment """
+        index = bisect_right(self.starts, moment + before) - 1
+        return index >= 0 and self.max_ends[index] + after >= moment
+
+    def next_start(self, moment):
+        """ The first start after moment, or None """
+        index = bisect_right(self.starts, moment)
+        return self.starts[index] if index < len(self.starts) else None
+
+
+class CalendarIndex:
+    """ The busy times of an ICS file over a rolling window, re-indexed when the file changes """
+    def __init__(self, path, horizon=14 * 86400, verbose=False):
+        self.path = os.path.expanduser(path)
+        self.horizon = horizon
+        self.verbose = verbose
+        # event text -> Event, so an unchanged event is neither parsed nor expanded again
+        self.events = {}
+        self.signature = None
+        self.window = None
+        self.index = IntervalIndex()
+        self.error = None
+        self.stats = {"loads": 0, "parsed": 0, "reused": 0, "expansions": 0, "intervals": 0}
+
+    def __signature__(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def __load__(self):
+        try:
+            with open(self.path, "r", encoding="utf-8", errors="replace") as ics_file:
+                text = ics_file.read()
+        except OSError as e:
+            self.error = f"Error reading calendar {self.path}: {e}"
+            return False
+        events = {}
+        for block, lines in parse_events(text):
+            event = self.events.get(block)
+            if event is None:
+                try:
+                    event = Event(lines)
+                except (ValueError, TypeError, OverflowError) as e:
+                    if self.verbose:
+                        print(f"Skipping calendar event: {e}")
+                    continue
+                self.stats["parsed"] += 1
+            else:
+                self.stats["reused"] += 1
+            events[block] = event
+        self.events = events
+        self.stats["loads"] += 1
+        self.error = None
+        return True
+
+    def __build__(self):
+        window_start, window_end = self.window
+        events = [event for event in self.events.values() if event.schedulable]
+        # Moved or cancelled instances replace the occurrence of their recurring event
+        overridden = {(event.uid, event.recurrence_id) for event in events if event.recurrence_id is not None}
+        intervals = []
+        for event in events:
+            if event.window != self.window:
+                self.stats["expansions"] += 1
+            try:
+                occurrences = event.expand(window_start, window_end)
+            except (ValueError, TypeError, OverflowError) as e:
+                # e.g. a rule running past the supported date range
+                if self.verbose:
+                    print(f"Skipping calendar event {event.uid}: {e}")
+                continue
+            if not event.busy:
+                continue
+            if event.rrule is not None and overridden:
+                occurrences = [occurrence for occurrence in occurrences
+                               if (event.uid, occurrence[0]) not in overridden]
+            intervals.extend(occurrences)
+        self.index = IntervalIndex(intervals)
+        self.stats["intervals"] = len(self.index)
+
+    def refresh(self, now):
+        """ Reload the file if it changed and roll the window forward, returns True if re-indexed """
+        signature = self.__signature__()
+        reload = signature != self.signature
+        # The window is rolled once half of the horizon has passed
+        roll = self.window is None or now > self.window[0] + 86400 + self.horizon / 2
+        if not reload and not roll:
+            return False
+        if reload:
+            self.signature = signature
+            if signature is None:
+                self.error = f"Calendar not found: {self.path}"
+                self.events = {}
+            elif not self.__load__():
+                return False
+        if roll:
+            self.window = (now - 86400, now + self.horizon)
+        self.__build__()
+        if self.verbose:
+            print(f"Calendar indexed {self.stats['intervals']} meetings from {len(self.events)} events")
+        return True
@@ -1,13 +1,361 @@
+import time
+import queue
+import atexit
 import sqlite3
+import threading
 from datetime import datetime, timedelta
+from metrics import REGISTRY
+
+LOG_WRITE_SECONDS = REGISTRY.histogram("meeting_watcher_log_write_seconds", "Meeting log write and commit time",
+                                       labels=("op",))
+
+SQL_CREATE_LOG = """
+    CREATE TABLE IF NOT EXISTS log (
+        id INTEGER PRIMARY KEY,
+        start_time DATETIME,
+        end_time DATETIME,
+        duration FLOAT,
+        last_seen DATETIME
+    )
+"""
+SQL_CREATE_END_INDEX = "CREATE INDEX IF NOT EXISTS log_end_time ON log (end_time)"
+SQL_LOG_COLUMNS = "PRAGMA table_info(log)"
+SQL_ADD_LAST_SEEN = "ALTER TABLE log ADD COLUMN last_seen DATETIME"
+# Close meetings left open by a crash at the last time the watcher saw them running
+SQL_RECOVER = """
+    UPDATE log
+    SET end_time = COALESCE(last_seen, start_time),
+        duration = (julianday(COALESCE(last_seen, start_time)) - julianday(start_time)) * 86400
+    WHERE end_time IS NULL
+"""
+# Rollups of the finished meetings for the report command, kept current by triggers on log.
+# A meeting counts for the day and hour it started in, every rollup is kept per day so
+# the report can limit all of its figures to a date range.
+SQL_ROLLUP_TABLES = {
+    "log_daily": """
+        CREATE TABLE log_daily (
+            day TEXT PRIMARY KEY,
+            meetings INTEGER NOT NULL,
+            seconds REAL NOT NULL
+        )
+    """,
+    "log_hourly": """
+        CREATE TABLE log_hourly (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            meetings INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            PRIMARY KEY (day, hour)
+        )
+    """,
+    "log_durations": """
+        CREATE TABLE log_durations (
+            day TEXT NOT NULL,
+            minutes INTEGER NOT NULL,
+            meetings INTEGER NOT NULL,
+            PRIMARY KEY (day, minutes)
+        )
+    """,
+}
+# Rollup tables with other columns were created by an older version and are rebuilt
+ROLLUP_COLUMNS = {
+    "log_daily": ["day", "meetings", "seconds"],
+    "log_hourly": ["day", "hour", "meetings", "seconds"],
+    "log_durations": ["day", "minutes", "meetings"],
+}
+SQL_ROLLUP_COLUMNS = "SELECT name FROM pragma_table_info(?)"
+SQL_DROP_ROLLUP = "DROP TABLE {table}"
+SQL_ROLLUP_BACKFILL = {
+    "log_daily": """
+        INSERT INTO log_daily (day, meetings, seconds)
+        SELECT date(start_time), COUNT(*), SUM(COALESCE(duration, 0)) FROM log
+        WHERE start_time IS NOT NULL AND end_time IS NOT NULL GROUP BY 1
+    """,
+    "log_hourly": """
+        INSERT INTO log_hourly (day, hour, meetings, seconds)
+        SELECT date(start_time), CAST(strftime('%H', start_time) AS INTEGER),
+            COUNT(*), SUM(COALESCE(duration, 0)) FROM log
+        WHERE start_time IS NOT NULL AND end_time IS NOT NULL GROUP BY 1, 2
+    """,
+    "log_durations": """
+        INSERT INTO log_durations (day, minutes, meetings)
+        SELECT date(start_time), CAST(COALESCE(duration, 0) / 60 AS INTEGER), COUNT(*) FROM log
+        WHERE start_time IS NOT NULL AND end_time IS NOT NULL GROUP BY 1, 2
+    """,
+}
+
+
+def rollup_statements(row, sign):
+    """ Trigger statements adding (sign 1) or removing (sign -1) the row NEW or OLD from the rollups """
+    duration = f"COALESCE({row}.duration, 0)"
+    return f"""
+        INSERT INTO log_daily (day, meetings, seconds) VALUES (date({row}.start_time), {sign}, {sign} * {duration})
+            ON CONFLICT (day) DO UPDATE SET meetings = meetings + excluded.meetings,
+                                            seconds = seconds + excluded.seconds;
+        INSERT INTO log_hourly (day, hour, meetings, seconds)
+            VALUES (date({row}.start_time), CAST(strftime('%H', {row}.start_time) AS INTEGER),
+                    {sign}, {sign} * {duration})
+            ON CONFLICT (day, hour) DO UPDATE SET meetings = meetings + excluded.meetings,
+                                                  seconds = seconds + excluded.seconds;
+        INSERT INTO log_durations (day, minutes, meetings)
+            VALUES (date({row}.start_time), CAST({duration} / 60 AS INTEGER), {sign})
+            ON CONFLICT (day, minutes) DO UPDATE SET meetings = meetings + excluded.meetings;
+    """
+
+
+SQL_ROLLUP_FINISHED = "{row}.start_time IS NOT NULL AND {row}.end_time IS NOT NULL"
+ROLLUP_TRIGGERS = ("log_rollup_insert", "log_rollup_update_old", "log_rollup_update_new", "log_rollup_delete")
+# Recreated on every setup so they always match the rollup tables
+SQL_DROP_TRIGGER = "DROP TRIGGER IF EXISTS {trigger}"
+SQL_CREATE_ROLLUP_TRIGGERS = [
+    f"""CREATE TRIGGER log_rollup_insert AFTER INSERT ON log
+        WHEN {SQL_ROLLUP_FINISHED.format(row="NEW")}
+        BEGIN {rollup_statements("NEW", 1)} END""",
+    # Ending a meeting (or recovering one) updates end_time, touch only changes last_seen
+    f"""CREATE TRIGGER log_rollup_update_old AFTER UPDATE OF start_time, end_time, duration ON log
+        WHEN {SQL_ROLLUP_FINISHED.format(row="OLD")}
+        BEGIN {rollup_statements("OLD", -1)} END""",
+    f"""CREATE TRIGGER log_rollup_update_new AFTER UPDATE OF start_time, end_time, duration ON log
+        WHEN {SQL_ROLLUP_FINISHED.format(row="NEW")}
+        BEGIN {rollup_statements("NEW", 1)} END""",
+    f"""CREATE TRIGGER log_rollup_delete AFTER DELETE ON log
+        WHEN {SQL_ROLLUP_FINISHED.format(row="OLD")}
+        BEGIN {rollup_statements("OLD", -1)} END""",
+]
+
+SQL_INSERT_START = "INSERT INTO log (start_time, last_seen) VALUES (?, ?)"
+SQL_INSERT_FULL = "INSERT INTO log (start_time, end_time, duration, last_seen) VALUES (?, ?, ?, ?)"
+SQL_TOUCH = "UPDATE log SET last_seen = ? WHERE id = ?"
+SQL_END = "UPDATE log SET end_time = ?, duration = ?, last_seen = ? WHERE id = ?"
+SQL_SELECT_ID = "SELECT id, start_time, end_time, duration FROM log WHERE id = ?"
+# Newest finished meetings first, formatted as "Mon. DD, YYYY — H:MM:SS" by sqlite.
+# Keyset pagination on (end_time, id) walks the end_time index instead of sorting the table.
+SQL_PAGE_COLUMNS = """
+    SELECT id, end_time,
+        substr('JanFebMarAprMayJunJulAugSepOctNovDec', (strftime('%m', end_time) - 1) * 3 + 1, 3)
+            || '. ' || strftime('%d, %Y', end_time)
+            || ' — ' || printf('%d:%02d:%02d', CAST(duration AS INTEGER) / 3600,
+                               CAST(duration AS INTEGER) % 3600 / 60, CAST(duration AS INTEGER) % 60)
+    FROM log
+"""
+SQL_PAGE_FIRST = SQL_PAGE_COLUMNS + """
+    WHERE end_time IS NOT NULL AND start_time IS NOT NULL
+    ORDER BY end_time DESC, id DESC LIMIT ?
+"""
+SQL_PAGE_AFTER = SQL_PAGE_COLUMNS + """
+    WHERE end_time IS NOT NULL AND start_time IS NOT NULL AND (end_time, id) < (?, ?)
+    ORDER BY end_time DESC, id DESC LIMIT ?
+"""
+
+
+class LogStore:
+    """ Single long lived connection to the meeting log with a write-behind queue
+
+    Only the store of the watcher sets setup_schema, other readers must not migrate the
+    schema or close the meeting the watcher is still logging.
+    """
+    def __init__(self, db_path, verbose=False, clock=datetime.now, setup_schema=False):
+        self.db_path = db_path
+        self.verbose = verbose
+        self.clock = clock
+        self.setup_schema = setup_schema
+        self.queue = queue.Queue()
+        self.thread = None
+        self.read_conn = None
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.error = None
+        self.stats = {"writes": 0, "errors": 0, "recovered": 0}
+        # Incremented whenever a finished meeting is written, used to invalidate cached views
+        self.generation = 0
+
+    def __connect__(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def __setup__(self, conn):
+        """ Create or migrate the schema and close rows left open by a crash """
+        conn.execute(SQL_CREATE_LOG)
+        conn.execute(SQL_CREATE_END_INDEX)
+        columns = [row[1] for row in conn.execute(SQL_LOG_COLUMNS)]
+        if "last_seen" not in columns:
+            conn.execute(SQL_ADD_LAST_SEEN)
+        for trigger in ROLLUP_TRIGGERS:
+            conn.execute(SQL_DROP_TRIGGER.format(trigger=trigger))
+        for table, sql in SQL_ROLLUP_TABLES.items():
+            columns = [row[0] for row in conn.execute(SQL_ROLLUP_COLUMNS, (table,))]
+            if columns != ROLLUP_COLUMNS[table]:
+                if columns:
+                    conn.execute(SQL_DROP_ROLLUP.format(table=table))
+                # New rollups start from the meetings already in the log
+                conn.execute(sql)
+                conn.execute(SQL_ROLLUP_BACKFILL[table])
+        for sql in SQL_CREATE_ROLLUP_TRIGGERS:
+            conn.execute(sql)
+        self.stats["recovered"] = conn.execute(SQL_RECOVER).rowcount
+        conn.commit()
+        if self.stats["recovered"]:
+            self.generation += 1
+        if self.verbose and self.stats["recovered"]:
+            print(f"Closed {self.stats['recovered']} meeting log entries left open")
+
+    def open(self):
+        """ Start the writer thread, the schema is set up by the writer """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__writer_thread__, name="log-writer", daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+
+    def close(self):
+        """ Flush pending writes and stop the writer thread """
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+            if self.read_conn:
+                self.read_conn.close()
+                self.read_conn = None
+        if thread:
+            self.queue.put(None)
+            thread.join()
+
+    def flush(self):
+        """ Block until every queued write has been committed """
+        if self.thread:
+            self.ready.wait()
+            self.queue.join()
+
+    def __write__(self, conn, op, entry):
+        started = time.perf_counter()
+        if op == "start":
+            cursor = conn.execute(SQL_INSERT_START, (entry.start_time.isoformat(), entry.start_time.isoformat()))
+            entry.id = cursor.lastrowid
+        elif op == "touch":
+            if entry.id is not None:
+                conn.execute(SQL_TOUCH, (entry.last_seen.isoformat(), entry.id))
+        elif op == "end":
+            end_time = entry.end_time.isoformat()
+            if entry.id is None:
+                cursor = conn.execute(SQL_INSERT_FULL, (entry.start_time.isoformat(), end_time, entry.duration, end_time))
+                entry.id = cursor.lastrowid
+            else:
+                conn.execute(SQL_END, (end_time, entry.duration, end_time, entry.id))
+        conn.commit()
+        LOG_WRITE_SECONDS.observe(time.perf_counter() - started, op=op)
+        self.stats["writes"] += 1
+        if op == "end":
+            self.generation += 1
+
+    def __writer_thread__(self):
+        conn = None
+        try:
+            conn = self.__connect__()
+            if self.setup_schema:
+                self.__setup__(conn)
+        except sqlite3.Error as e:
+            self.error = e
+            if self.verbose:
+                print(f"Error opening meeting log {self.db_path}: {e}")
+        self.ready.set()
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                if conn is not None:
+                    self.__write__(conn, *item)
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                if self.verbose:
+                    print(f"Error writing meeting log: {e}")
+            finally:
+                self.queue.task_done()
+        if conn is not None:
+            conn.close()
+
+    def __enqueue__(self, op, entry):
+        self.open()
+        self.queue.put((op, entry))
+
+    def start_meeting(self):
+        """ Record the start of a meeting, the row is inserted in the background """
+        entry = LogEntry(store=self)
+        entry.start_time = self.clock()
+        entry.last_seen = entry.start_time
+        self.__enqueue__("start", entry)
+        return entry
+
+    def touch(self, entry):
+        """ Record that a meeting is still running, used to close it after a crash """
+        entry.last_seen = self.clock()
+        self.__enqueue__("touch", entry)
+
+    def end_meeting(self, entry):
+        """ Record the end of a meeting """
+        entry.end_time = self.clock()
+        entry.duration = (entry.end_time - entry.start_time).total_seconds()
+        self.__enqueue__("end", entry)
+
+    def query(self, sql, params=()):
+        """ Run a read query on the shared read connection """
+        self.open()
+        self.ready.wait()
+        with self.lock:
+            if self.read_conn is None:
+                self.read_conn = self.__connect__()
+            return self.read_conn.execute(sql, params).fetchall()
+
+    def page(self, after=None, limit=50):
+        """ Return up to limit (id, end_time, text) rows older than the (end_time, id) key after """
+        if after is None:
+            return self.query(SQL_PAGE_FIRST, (limit,))
+        return self.query(SQL_PAGE_AFTER, (after[0], after[1], limit))
+
+
+class LogView:
+    """ Paginated rendering of the meeting log, cached until a new row is written """
+    def __init__(self, store, page_size=50):
+        self.store = store
+        self.page_size = page_size
+        self.generation = None
+        self.lines = []
+        self.last_key = None
+        self.more = False
+
+    def __load_page__(self):
+        rows = self.store.page(self.last_key, self.page_size + 1)
+        self.more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.lines.extend(row[2] for row in rows)
+        if rows:
+            self.last_key = (rows[-1][1], rows[-1][0])
+
+    def text(self):
+        """ Return the rendered pages loaded so far, reloading the first page if the log changed """
+        if self.generation != self.store.generation:
+            self.generation = self.store.generation
+            self.lines = []
+            self.last_key = None
+            self.__load_page__()
+        return "\n".join(self.lines) + ("\n" if self.lines else "")
+
+    def load_more(self):
+        """ Append the next page of older meetings """
+        if self.more:
+            self.__load_page__()
+
 
 class LogEntry:
-    def __init__(self, row_id=None, db_path="example.db", auto_start=False):
+    def __init__(self, row_id=None, db_path="example.db", auto_start=False, store=None):
         self.db_path = db_path
+        self.store = store
         self.id = row_id
         self.start_time = None
         self.end_time = None
         self.duration = None
+        self.last_seen = None
 
         if row_id and isinstance(row_id, int):
             self._load_from_db(row_id)
@@ -23,11 +371,15 @@ class LogEntry:
         return sqlite3.connect(self.db_path)
 
     def _load_from_db(self, row_id):
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, start_time, end_time, duration FROM log WHERE id = ?", (row_id,))
-        row = cursor.fetchone()
-        conn.close()
+        if self.store:
+            rows = self.store.query(SQL_SELECT_ID, (row_id,))
+            row = rows[0] if rows else None
+        else:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute(SQL_SELECT_ID, (row_id,))
+            row = cursor.fetchone()
+            conn.close()
 
         if row:
             self.id = row[0]
@@ -42,6 +394,10 @@ class LogEntry:
         if not self.start_time:
             raise ValueError("start() must be called before end()")
 
+        if self.store:
+            self.store.end_meeting(self)
+            return
+
         self.end_time = datetime.now()
         self.duration = (self.end_time - self.start_time).total_seconds()
 
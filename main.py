@@ -1,8 +1,14 @@
 import sys
+
+# Profiling has to start before anything else is imported
+if "--profile-startup" in sys.argv:
+    import startup
+    startup.enable()
+
 import signal
 import argparse
+import startup
 from config import AppConfig
-from ui import StatusBarApp
 
 app_config = AppConfig()
 
@@ -12,9 +18,41 @@ argparser.add_argument("-c", "--config", help="config file to use", default=None
 argparser.add_argument("--version", help="show version", action="version",
                        version=f"{app_config.name} v{app_config.version}")
 argparser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+argparser.add_argument("--headless", help="run without the menu bar, e.g. as a service", action="store_true")
+argparser.add_argument("--pidfile", help="pidfile to write in headless mode", default=None)
+argparser.add_argument("--profile-startup", help="print import and startup timings", action="store_true")
+argparser.add_argument("--record", help="record the detector inputs to a file for the replay command",
+                       default=None, metavar="FILE")
+# Without a command the menu bar app (or --headless watcher) runs
+commands = argparser.add_subparsers(dest="command", metavar="command")
+commands.add_parser("aggregate", help="roll the meeting state of many watchers up into room and floor summaries")
+export_parser = commands.add_parser("export", help="export the meeting log as csv, ndjson or parquet")
+export_parser.add_argument("-f", "--format", choices=["csv", "ndjson", "parquet"], default=None,
+                           help="output format, guessed from the output file name by default")
+export_parser.add_argument("-o", "--output", help="output file, stdout by default", default=None)
+export_parser.add_argument("--since", nargs="?", const="saved", default=None, metavar="ID",
+                           help="only meetings after this id, or after the last export to the same output")
+export_parser.add_argument("--from", dest="start", help="meetings ending on or after this date (YYYY-MM-DD)")
+export_parser.add_argument("--to", dest="end", help="meetings ending before this date (YYYY-MM-DD)")
+export_parser.add_argument("--mark-file", help="where --since keeps the last exported id", default=None)
+export_parser.add_argument("--batch-size", help="rows fetched at a time", type=int, default=1000)
+replay_parser = commands.add_parser("replay", help="feed a --record file through the watcher with a virtual clock")
+replay_parser.add_argument("recording", help="file written by --record")
+replay_parser.add_argument("--with-config", help="replay with the rules and options of this config file instead "
+                           "of the recorded ones", default=None, metavar="FILE")
+replay_parser.add_argument("--db", help="meeting log to write, a temporary one by default", default=None)
+replay_parser.add_argument("--timeline", help="print every state published", action="store_true")
+report_parser = commands.add_parser("report", help="meeting totals, lengths, streaks and a weekday/hour heatmap")
+report_parser.add_argument("--from", dest="start", help="days on or after this date (YYYY-MM-DD)")
+report_parser.add_argument("--to", dest="end", help="days before this date (YYYY-MM-DD)")
+report_parser.add_argument("--days", help="number of days listed", type=int, default=14)
+report_parser.add_argument("--weeks", help="number of weeks listed", type=int, default=8)
+report_parser.add_argument("--json", help="print the report as JSON", action="store_true")
 args = argparser.parse_args()
+app_config.record_file = args.record
 
 app_config.get_user_config(args.config, args.verbose)
+startup.mark("config loaded")
 app = None
 
 # from pprint import pprint
@@ -32,6 +70,25 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 if __name__ == "__main__":
+    if args.command == "aggregate":
+        import aggregator
+        sys.exit(aggregator.run(app_config))
+    if args.command == "export":
+        import export
+        sys.exit(export.run(app_config, args))
+    if args.command == "report":
+        import report
+        sys.exit(report.run(app_config, args))
+    if args.command == "replay":
+        import replay
+        sys.exit(replay.run(app_config, args))
+
+    if args.headless:
+        # Only the watcher is loaded, rumps and AppKit are never imported
+        from daemon import HeadlessApp
+        sys.exit(HeadlessApp(app_config=app_config, pidfile=args.pidfile).run())
+
+    from ui import StatusBarApp
     signal.signal(signal.SIGINT, signal_handler)
     app = StatusBarApp(app_config=app_config)
     app.run()
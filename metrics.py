@@ -0,0 +1,234 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def __key__(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self):
+        """ Return (suffix, label_values, extra_label, value) tuples """
+        with self.lock:
+            return [("", key, None, value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.label_names, key, extra)} {value}")
+        return "\n".join(lines)
+
+    def snapshot(self):
+        """ Plain values for the JSON metrics topic """
+        with self.lock:
+            if not self.label_names:
+                return self.values.get((), 0)
+            return {",".join(key): value for key, value in self.values.items()}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.__key__(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.__key__(labels)] = value
+
+    def __collect__(self):
+        if self.callback is None:
+            return
+        try:
+            value = self.callback()
+        except Exception:
+            return
+        if value is not None:
+            self.set(value)
+
+    def samples(self):
+        self.__collect__()
+        return super().samples()
+
+    def snapshot(self):
+        self.__collect__()
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.__key__(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(("_bucket", key, ("le", repr(bound)), cumulative))
+                samples.append(("_bucket", key, ("le", "+Inf"), count))
+                samples.append(("_sum", key, None, total))
+                samples.append(("_count", key, None, count))
+        return samples
+
+    def snapshot(self):
+        with self.lock:
+            values = {",".join(key): {"sum": state[1], "count": state[2]} for key, state in self.values.items()}
+        if not self.label_names:
+            return values.get("", {"sum": 0.0, "count": 0})
+        return values
+
+
+class MetricsRegistry:
+    """ Process wide collection of watcher metrics """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def __register__(self, metric_class, name, *args, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(name, *args, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help_text, labels=()):
+        return self.__register__(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=(), callback=None):
+        gauge = self.__register__(Gauge, name, help_text, labels)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.__register__(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        """ Render every metric in the Prometheus text exposition format """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """ Serve /metrics in the Prometheus text format from a background thread """
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9464, verbose=False):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        if self.verbose:
+            print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class MetricsPublisher:
+    """ Periodically publish a JSON snapshot of the metrics as a retained MQTT message """
+    def __init__(self, publisher, topic, interval=60, registry=REGISTRY):
+        self.publisher = publisher
+        self.topic = topic
+        self.interval = interval
+        self.registry = registry
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def __publish_thread__(self):
+        while not self.stop_event.wait(self.interval):
+            self.publisher.publish(self.topic, json.dumps(self.registry.snapshot()), retain=True)
+
+    def start(self):
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.__publish_thread__, name="metrics-mqtt", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.stop_event.set()
+            self.thread = None
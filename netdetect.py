@@ -0,0 +1,160 @@
+import os
+from rules import Rule, RuleSet
+
+UDP_TABLES = ("udp", "udp6")
+# DNS, NTP, SSDP and mDNS sockets are never call media
+IGNORE_PORTS = (53, 123, 1900, 5353)
+
+
+def parse_udp_table(text):
+    """ Yield (inode, local port, remote port) for each socket of a /proc/net/udp or udp6 table """
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 10:
+            continue
+        try:
+            local_port = int(fields[1].rsplit(":", 1)[1], 16)
+            remote_port = int(fields[2].rsplit(":", 1)[1], 16)
+            inode = int(fields[9])
+        except (IndexError, ValueError):
+            continue
+        if inode:
+            yield inode, local_port, remote_port
+
+
+class SocketIndex:
+    """ Socket inode -> pid for the watched processes, kept up to date without walking every fd each cycle
+
+    A pid's fd directory is read once when it starts being watched. After that it is only
+    read again when the socket table shows an inode nobody is known to own.
+    """
+    def __init__(self, proc_root="/proc"):
+        self.proc_root = proc_root
+        # socket inode -> pid, only for sockets seen in the tables
+        self.owners = {}
+        # inodes already looked up that belong to processes not watched
+        self.unowned = set()
+        self.pids = set()
+        self.stats = {"refreshes": 0, "fd_reads": 0}
+
+    def __sockets__(self, pid):
+        """ Socket inodes held by a pid, an empty set if it exited or its fds are not readable """
+        fd_dir = os.path.join(self.proc_root, str(pid), "fd")
+        inodes = set()
+        self.stats["fd_reads"] += 1
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            return inodes
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                inodes.add(int(target[8:-1]))
+        return inodes
+
+    def __index_pid__(self, pid, inodes):
+        for inode in self.__sockets__(pid) & inodes:
+            self.owners[inode] = pid
+            self.unowned.discard(inode)
+
+    def add_pid(self, pid, inodes):
+        self.pids.add(pid)
+        self.__index_pid__(pid, inodes)
+
+    def remove_pid(self, pid):
+        self.pids.discard(pid)
+        self.owners = {inode: owner for inode, owner in self.owners.items() if owner != pid}
+
+    def resolve(self, inodes):
+        """ Return {inode: pid} for the inodes owned by a watched pid """
+        missing = inodes - self.owners.keys() - self.unowned
+        if missing and self.pids:
+            # A socket opened since the last cycle, the fd of a watched pid may have been reused
+            self.stats["refreshes"] += 1
+            for pid in self.pids:
+                self.__index_pid__(pid, missing)
+        self.unowned |= missing - self.owners.keys()
+        # Closed sockets leave the tables, forget them
+        self.unowned &= inodes
+        if len(self.owners) > len(inodes):
+            self.owners = {inode: pid for inode, pid in self.owners.items() if inode in inodes}
+        return {inode: self.owners[inode] for inode in inodes if inode in self.owners}
+
+
+class NetworkMonitor:
+    """ Count the UDP media flows held by the watched processes from the kernel socket tables """
+    def __init__(self, rules, proc_root="/proc", ignore_ports=IGNORE_PORTS, unconnected=False):
+        self.rules = rules
+        self.proc_root = proc_root
+        self.ignore_ports = frozenset(ignore_ports)
+        self.unconnected = unconnected
+        # pid -> comm, for every pid seen so the comm is only read once
+        self.procs = {}
+        self.index = SocketIndex(proc_root)
+        self.stats = {"cycles": 0, "sockets": 0, "flows": 0}
+
+    @property
+    def watched(self):
+        return self.index.pids
+
+    def __read__(self, path):
+        try:
+            with open(path, "r") as table:
+                return table.read()
+        except OSError:
+            return ""
+
+    def sockets(self):
+        """ The (inode, local port, remote port) UDP sockets that may carry media """
+        sockets = []
+        for table in UDP_TABLES:
+            for inode, local_port, remote_port in parse_udp_table(self.__read__(os.path.join(self.proc_root, "net", table))):
+                if remote_port:
+                    if remote_port in self.ignore_ports:
+                        continue
+                elif not self.unconnected or not local_port or local_port in self.ignore_ports:
+                    continue
+                sockets.append((inode, local_port, remote_port))
+        return sockets
+
+    def __update_procs__(self, inodes):
+        """ Follow process starts and exits, only new pids have their comm read """
+        try:
+            pids = {int(entry) for entry in os.listdir(self.proc_root) if entry.isdigit()}
+        except OSError:
+            return
+        for pid in self.procs.keys() - pids:
+            del self.procs[pid]
+            if pid in self.index.pids:
+                self.index.remove_pid(pid)
+        for pid in pids - self.procs.keys():
+            comm = self.__read__(os.path.join(self.proc_root, str(pid), "comm")).strip()
+            self.procs[pid] = comm
+            if comm and self.rules.relevant(comm):
+                self.index.add_pid(pid, inodes)
+
+    def set_rules(self, rules):
+        self.rules = rules
+        for pid in list(self.index.pids):
+            self.index.remove_pid(pid)
+        self.index.unowned = set()
+        self.procs = {}
+
+    def flows(self):
+        """ Return the media sockets owned by watched processes as {inode: pid} """
+        self.stats["cycles"] += 1
+        sockets = self.sockets()
+        inodes = {socket[0] for socket in sockets}
+        self.__update_procs__(inodes)
+        owned = self.index.resolve(inodes)
+        self.stats["sockets"] = len(sockets)
+        self.stats["flows"] = len(owned)
+        return owned
+
+
+def watch_rules(processes):
+    """ A RuleSet matching any of the process name patterns """
+    return RuleSet([Rule(rule_id, str(process), process=process) for rule_id, process in enumerate(processes)])
@@ -0,0 +1,247 @@
+import os
+import sys
+import select
+import socket
+import struct
+import threading
+import psutil
+
+# Linux proc connector constants (linux/connector.h, linux/cn_proc.h)
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+NLMSG_DONE = 3
+PROC_CN_MCAST_LISTEN = 1
+PROC_CN_MCAST_IGNORE = 2
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+
+NLMSG_HEADER = struct.Struct("=IHHII")
+CN_MSG_HEADER = struct.Struct("=IIIIHH")
+PROC_EVENT_HEADER = struct.Struct("=IIQ")
+PROC_EVENT_PIDS = struct.Struct("=ii")
+
+
+class PollEvents:
+    """ Fallback backend: no notifications, the process table is scanned every cycle """
+    name = "poll"
+
+    def __init__(self, scanner, notify, verbose=False):
+        self.scanner = scanner
+        self.notify = notify
+        self.verbose = verbose
+        self.running = False
+        self.events = 0
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def consume(self):
+        """ Return True if the process table has to be scanned this cycle """
+        return True
+
+    def watch_pid(self, pid):
+        pass
+
+
+class PidWaitEvents(PollEvents):
+    """ Scan every cycle, but wake the watcher as soon as the matched process exits """
+    name = "pidwait"
+
+    def __init__(self, scanner, notify, verbose=False):
+        super().__init__(scanner, notify, verbose)
+        self.changed = threading.Event()
+        self.changed.set()
+        self.watched_pid = None
+        self.wait_thread = None
+
+    def stop(self):
+        super().stop()
+        self.watched_pid = None
+
+    def consume(self):
+        self.changed.clear()
+        return True
+
+    def __changed__(self):
+        self.events += 1
+        self.changed.set()
+        self.notify()
+
+    def __wait_pidfd__(self, pid):
+        fd = os.pidfd_open(pid)
+        try:
+            while self.running and self.watched_pid == pid:
+                readable, _, _ = select.select([fd], [], [], 1)
+                if readable:
+                    return True
+        finally:
+            os.close(fd)
+        return False
+
+    def __wait_psutil__(self, pid):
+        process = psutil.Process(pid)
+        while self.running and self.watched_pid == pid:
+            try:
+                process.wait(timeout=1)
+                return True
+            except psutil.TimeoutExpired:
+                continue
+        return False
+
+    def __wait_thread__(self, pid):
+        try:
+            if hasattr(os, "pidfd_open"):
+                exited = self.__wait_pidfd__(pid)
+            else:
+                exited = self.__wait_psutil__(pid)
+        except (OSError, psutil.Error):
+            # The process is already gone
+            exited = True
+        if exited and self.watched_pid == pid:
+            if self.verbose:
+                print(f"Process {pid} exited")
+            self.watched_pid = None
+            self.__changed__()
+
+    def watch_pid(self, pid):
+        """ Wait for a matched process to exit in the background """
+        if not self.running or pid is None or pid == self.watched_pid:
+            return
+        self.watched_pid = pid
+        self.wait_thread = threading.Thread(target=self.__wait_thread__, args=(pid,), daemon=True)
+        self.wait_thread.start()
+
+
+class ConnectorEvents(PidWaitEvents):
+    """ Linux proc connector backend: only scan when a relevant process starts or exits """
+    name = "connector"
+
+    def __init__(self, scanner, notify, verbose=False):
+        super().__init__(scanner, notify, verbose)
+        self.sock = None
+        self.listen_thread = None
+
+    def __send_op__(self, op):
+        payload = struct.pack("=I", op)
+        cn_msg = CN_MSG_HEADER.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(payload), 0)
+        message = cn_msg + payload
+        header = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(message), NLMSG_DONE, 0, 0, self.sock.getsockname()[0])
+        self.sock.send(header + message)
+
+    def start(self):
+        """ Subscribe to the proc connector, raises OSError when not permitted """
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            # Let the kernel pick the port id so a restarted backend does not collide with the old socket
+            self.sock.bind((0, CN_IDX_PROC))
+            self.__send_op__(PROC_CN_MCAST_LISTEN)
+            # Wake up regularly so stop() does not depend on an event arriving
+            self.sock.settimeout(1)
+        except OSError:
+            self.sock.close()
+            self.sock = None
+            raise
+        super().start()
+        self.listen_thread = threading.Thread(target=self.__listen_thread__, daemon=True)
+        self.listen_thread.start()
+
+    def stop(self):
+        super().stop()
+        if self.sock:
+            try:
+                self.__send_op__(PROC_CN_MCAST_IGNORE)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def consume(self):
+        if self.changed.is_set():
+            self.changed.clear()
+            return True
+        return False
+
+    def __handle_event__(self, data):
+        offset = NLMSG_HEADER.size + CN_MSG_HEADER.size
+        if len(data) < offset + PROC_EVENT_HEADER.size + PROC_EVENT_PIDS.size:
+            return
+        what, _, _ = PROC_EVENT_HEADER.unpack_from(data, offset)
+        offset += PROC_EVENT_HEADER.size
+        if what == PROC_EVENT_EXEC:
+            pid, tgid = PROC_EVENT_PIDS.unpack_from(data, offset)
+            try:
+                with open(f"/proc/{tgid}/comm", "r") as comm:
+                    name = comm.read().strip().lower()
+            except OSError:
+                return
+            # The scanner cached the pid under its name before the exec, have it look again
+            if self.scanner.rules.relevant(name) or tgid in self.scanner.roles:
+                self.scanner.refresh(tgid)
+                self.__changed__()
+        elif what == PROC_EVENT_EXIT:
+            pid, tgid = PROC_EVENT_PIDS.unpack_from(data, offset)
+            if pid != tgid:
+                # A thread exited, not a process
+                return
+            # Only processes that take part in a rule change the result
+            if tgid in self.scanner.roles:
+                self.__changed__()
+
+    def __listen_thread__(self):
+        while self.running and self.sock:
+            sock = self.sock
+            if sock is None:
+                break
+            try:
+                data = sock.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if not self.running:
+                    break
+                # Events were dropped (ENOBUFS), the cache may be stale
+                if self.verbose:
+                    print(f"Proc connector error: {e}")
+                self.__changed__()
+                continue
+            self.__handle_event__(data)
+
+
+PROC_EVENT_BACKENDS = {
+    "poll": PollEvents,
+    "pidwait": PidWaitEvents,
+    "connector": ConnectorEvents,
+}
+
+
+def create_proc_events(backend, scanner, notify, verbose=False):
+    """ Create and start the configured process event backend, falling back to polling """
+    if backend == "auto":
+        candidates = ["connector", "pidwait"] if sys.platform.startswith("linux") else ["pidwait"]
+    elif backend in PROC_EVENT_BACKENDS:
+        candidates = [backend]
+    else:
+        if verbose:
+            print(f"Unknown proc_events backend: {backend}, using poll")
+        candidates = []
+
+    for name in candidates:
+        events = PROC_EVENT_BACKENDS[name](scanner, notify, verbose=verbose)
+        try:
+            events.start()
+        except (OSError, AttributeError) as e:
+            if verbose:
+                print(f"Process event backend {name} unavailable: {e}")
+            continue
+        if verbose:
+            print(f"Using process event backend: {name}")
+        return events
+
+    events = PollEvents(scanner, notify, verbose=verbose)
+    events.start()
+    return events
@@ -0,0 +1,201 @@
+import time
+import threading
+from collections import OrderedDict
+import paho.mqtt.client as mqtt
+from metrics import REGISTRY
+
+PUBLISH_SECONDS = REGISTRY.histogram("meeting_watcher_publish_seconds", "Time from publish to broker acknowledgement",
+                                     labels=("broker",))
+RECONNECTS = REGISTRY.counter("meeting_watcher_mqtt_reconnects_total", "MQTT reconnections", labels=("broker",))
+QUEUE_DEPTH = REGISTRY.gauge("meeting_watcher_mqtt_queue_depth", "Messages queued while offline", labels=("broker",))
+
+
+class MqttPublisher:
+    """ MQTT client that reconnects with backoff and queues state changes while offline
+
+    Messages of any QoS published while offline are queued here, coalesced per topic. paho
+    only keeps QoS 1 and 2 messages that raced a disconnect, bounded by the same queue_size.
+    Messages are handed to paho under the lock, so a state published while the queue is
+    being drained is always sent after the queued ones.
+    """
+    def __init__(self, host, port=1883, user=None, password=None, qos=0, retain=False,
+                 keepalive=10, reconnect_min=1, reconnect_max=60, queue_size=100, verbose=False):
+        self.host = host
+        self.port = port
+        self.qos = qos
+        self.retain = retain
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.verbose = verbose
+        self.connected = False
+        self.started = False
+        # Reentrant, paho may report a disconnect from inside client.publish()
+        self.lock = threading.RLock()
+        # topic -> (payload, qos, retain), only the latest payload per topic is kept
+        self.queue = OrderedDict()
+        self.subscriptions = {}
+        # mid -> send time (None for messages buffered by paho while offline),
+        # and acknowledgements that arrived before publish() returned the mid
+        self.pending = {}
+        self.early_acks = set()
+        self.pending_lock = threading.Lock()
+        self.broker = f"{host}:{port}"
+        self.stats = {
+            "published": 0,
+            "queued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "connects": 0,
+            "reconnects": 0,
+            "last_latency": None,
+            "max_latency": 0.0,
+        }
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.username_pw_set(user, password)
+        # paho retries the connection from its network thread, doubling the delay up to reconnect_max
+        self.client.reconnect_delay_set(min_delay=reconnect_min, max_delay=reconnect_max)
+        # paho's own queue of unsent QoS 1/2 messages is unbounded by default
+        self.client.max_queued_messages_set(queue_size)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+        self.client.on_message = self.on_message
+
+    @property
+    def queue_depth(self):
+        return len(self.queue)
+
+    def start(self):
+        """ Connect in the background, never blocks on an unreachable broker """
+        if self.started:
+            return
+        self.started = True
+        self.client.connect_async(self.host, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.connected = False
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if self.verbose:
+            print(f"MQTT Connected to {self.host}:{self.port} with result code: {reason_code}")
+        if reason_code.is_failure:
+            return
+        self.stats["connects"] += 1
+        if self.stats["connects"] > 1:
+            self.stats["reconnects"] += 1
+            RECONNECTS.inc(broker=self.broker)
+        for topic in self.subscriptions:
+            self.client.subscribe(topic)
+        with self.lock:
+            queued = list(self.queue.items())
+            self.queue.clear()
+            QUEUE_DEPTH.set(0, broker=self.broker)
+            for topic, (payload, qos, retain) in queued:
+                if self.verbose:
+                    print(f"MQTT Sending queued message {topic}: {payload}")
+                self.__send__(topic, payload, qos, retain)
+            # Only now may publish() send directly, a newer state must not overtake the queued ones
+            self.connected = True
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        if self.verbose:
+            print(f"MQTT Disconnected from {self.host}:{self.port}: {reason_code}")
+        with self.lock:
+            self.connected = False
+
+    def __observe_latency__(self, sent_at):
+        latency = time.perf_counter() - sent_at
+        self.stats["last_latency"] = latency
+        self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+        PUBLISH_SECONDS.observe(latency, broker=self.broker)
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        with self.pending_lock:
+            if mid not in self.pending:
+                self.early_acks.add(mid)
+                return
+            sent_at = self.pending.pop(mid)
+        if sent_at is not None:
+            self.__observe_latency__(sent_at)
+
+    def on_message(self, client, userdata, msg):
+        for topic, callback in self.subscriptions.items():
+            if mqtt.topic_matches_sub(topic, msg.topic):
+                callback(client, userdata, msg)
+
+    def subscribe(self, topic, callback):
+        """ Subscribe to a topic, re-subscribed on every reconnect """
+        self.subscriptions[topic] = callback
+        if self.connected:
+            self.client.subscribe(topic)
+
+    def unsubscribe(self, topic):
+        if self.subscriptions.pop(topic, None) and self.connected:
+            self.client.unsubscribe(topic)
+
+    def configure(self, qos=None, retain=None, reconnect_min=None, reconnect_max=None, queue_size=None):
+        """ Change the settings that do not need a new connection """
+        if qos is not None:
+            self.qos = qos
+        if retain is not None:
+            self.retain = retain
+        if reconnect_min is not None and reconnect_max is not None:
+            self.client.reconnect_delay_set(min_delay=reconnect_min, max_delay=reconnect_max)
+        if queue_size is not None:
+            self.queue_size = queue_size
+            self.client.max_queued_messages_set(queue_size)
+
+    def __enqueue__(self, topic, payload, qos, retain):
+        if topic in self.queue:
+            # Only the latest state matters once the broker is back
+            self.stats["coalesced"] += 1
+            del self.queue[topic]
+        elif len(self.queue) >= self.queue_size:
+            self.queue.popitem(last=False)
+            self.stats["dropped"] += 1
+        self.queue[topic] = (payload, qos, retain)
+        self.stats["queued"] += 1
+        QUEUE_DEPTH.set(len(self.queue), broker=self.broker)
+
+    def __send__(self, topic, payload, qos, retain):
+        """ Hand a message to paho, called with the lock held """
+        sent_at = time.perf_counter()
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        # A QoS 1 or 2 message sent just as the connection dropped is kept by paho and sent after reconnecting
+        buffered = info.rc == mqtt.MQTT_ERR_NO_CONN and qos > 0
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and not buffered:
+            self.__enqueue__(topic, payload, qos, retain)
+            return False
+        with self.pending_lock:
+            acked = info.mid in self.early_acks
+            if acked:
+                self.early_acks.discard(info.mid)
+            else:
+                # Time spent offline is not publish latency
+                self.pending[info.mid] = None if buffered else sent_at
+        if buffered:
+            self.stats["queued"] += 1
+            return False
+        if acked:
+            self.__observe_latency__(sent_at)
+        self.stats["published"] += 1
+        return True
+
+    def publish(self, topic, payload, qos=None, retain=None):
+        """ Publish now if connected, otherwise queue the latest payload for the topic """
+        qos = self.qos if qos is None else qos
+        retain = self.retain if retain is None else retain
+        with self.lock:
+            if not self.connected:
+                self.__enqueue__(topic, payload, qos, retain)
+                if self.verbose:
+                    print(f"MQTT offline, queued {topic}: {payload} ({len(self.queue)} queued)")
+                return False
+            return self.__send__(topic, payload, qos, retain)
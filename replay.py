@@ -0,0 +1,355 @@
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from types import SimpleNamespace
+from datetime import datetime
+from detectors import Detector
+
+RECORD_VERSION = 1
+# Seconds between flushes of the recording, a crash loses at most this much
+FLUSH_INTERVAL = 60
+
+
+class Recorder:
+    """ Write the watcher's detector inputs to a gzipped NDJSON file
+
+    The first line holds the config, then one line per cycle with the detector results
+    and, when the proc detector scanned, the changes to its process table. Commands are
+    recorded as they are received, from the MQTT or UI thread.
+    """
+    def __init__(self, path, watcher):
+        self.path = path
+        self.watcher = watcher
+        self.file = gzip.open(path, "wt")
+        # Cycles are written by the watch loop, commands by whichever thread received them
+        self.lock = threading.Lock()
+        # pid -> (name, ppid) as of the last recorded scan
+        self.procs = {}
+        self.scans = None
+        self.flushed_at = time.monotonic()
+        self.stats = {"cycles": 0, "commands": 0}
+        user_config = watcher.user_config
+        self.__write__({
+            "version": RECORD_VERSION,
+            "started": watcher.wall_clock(),
+            "watch": user_config.watch,
+            "options": user_config.options,
+            "proc": user_config.proc,
+        })
+
+    def __write__(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line)
+            now = time.monotonic()
+            if now - self.flushed_at >= FLUSH_INTERVAL:
+                self.flushed_at = now
+                self.file.flush()
+
+    def __proc_changes__(self, results):
+        """ Changes to the proc detector's process table since the last recorded scan, or None """
+        detector = self.watcher.__detector__("proc")
+        # Only read the table of a scan that finished, a cancelled one may still be running
+        if detector is None or results.get("proc") is None:
+            return None
+        scanner = detector.scanner
+        if scanner.stats["cycles"] == self.scans:
+            return None
+        self.scans = scanner.stats["cycles"]
+        procs = {pid: (info[0], info[1]) for pid, info in scanner.procs.items()}
+        added = [[pid, name, ppid] for pid, (name, ppid) in procs.items() if self.procs.get(pid) != (name, ppid)]
+        removed = [pid for pid in self.procs if pid not in procs]
+        self.procs = procs
+        if not added and not removed:
+            return None
+        return {"add": added, "del": removed}
+
+    def cycle(self, results):
+        record = {
+            "t": round(self.watcher.wall_clock(), 3),
+            "m": round(self.watcher.clock(), 3),
+            "r": {name: None if result is None else bool(result) for name, result in results.items()},
+        }
+        changes = self.__proc_changes__(results)
+        if changes:
+            record["p"] = changes
+        self.__write__(record)
+        self.stats["cycles"] += 1
+
+    def command(self, command, minutes=None):
+        self.__write__({
+            "t": round(self.watcher.wall_clock(), 3),
+            "m": round(self.watcher.clock(), 3),
+            "c": command,
+            "n": minutes,
+        })
+        self.stats["commands"] += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_recording(path):
+    """ Return (header, iterator over the records) """
+    records = gzip.open(path, "rt")
+    try:
+        header = json.loads(records.readline())
+    except ValueError:
+        records.close()
+        raise ValueError(f"{path} is not a watcher recording")
+    if header.get("version") != RECORD_VERSION:
+        records.close()
+        raise ValueError(f"{path} has recording version {header.get('version')}, expected {RECORD_VERSION}")
+
+    def iterate():
+        with records:
+            for line in records:
+                if line.strip():
+                    yield json.loads(line)
+    return header, iterate()
+
+
+class VirtualClock:
+    """ Time as of the record being replayed """
+    def __init__(self):
+        self.wall = 0.0
+        self.mono = 0.0
+
+    def set(self, record):
+        self.wall = record["t"]
+        self.mono = record["m"]
+
+    def monotonic(self):
+        return self.mono
+
+    def time(self):
+        return self.wall
+
+    def now(self):
+        return datetime.fromtimestamp(self.wall)
+
+
+class ReplayPublisher:
+    """ Stands in for MqttPublisher and keeps what would have been published """
+    def __init__(self, host, port, user=None, password=None, **kwargs):
+        self.host = host
+        self.port = port
+        self.connected = True
+        self.clock = None
+        self.published = []
+
+    def publish(self, topic, payload, qos=None, retain=None):
+        self.published.append((self.clock() if self.clock else None, topic, payload))
+        return True
+
+    def subscribe(self, topic, callback):
+        pass
+
+    def unsubscribe(self, topic):
+        pass
+
+    def configure(self, **kwargs):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class ReplayDetector(Detector):
+    """ Returns the recorded result of a detector """
+    def __init__(self, name, options=None):
+        super().__init__(None, options)
+        self.name = name
+        self.result = None
+
+    async def detect(self):
+        return self.result
+
+
+class ReplayProcessDetector(Detector):
+    """ Matches the proc rules against the recorded process table
+
+    Only names and parents were recorded, so rules with exe or cmdline patterns never match.
+    """
+    name = "proc"
+    source = "proc"
+
+    def __init__(self, proc_config, options=None):
+        super().__init__(None, options)
+        from rules import RuleSet
+        self.rules = RuleSet.from_config(proc_config)
+        # pid -> (name, ppid)
+        self.procs = {}
+        # pid -> target rule ids
+        self.targets = {}
+        self.parents = set()
+
+    def apply(self, changes):
+        for pid in changes.get("del", ()):
+            self.procs.pop(pid, None)
+            self.targets.pop(pid, None)
+            self.parents.discard(pid)
+        for pid, name, ppid in changes.get("add", ()):
+            self.procs[pid] = (name, ppid)
+            targets, parents = self.rules.classify_name(name)
+            targets = self.rules.classify_details(targets, None, [])
+            if targets:
+                self.targets[pid] = targets
+            else:
+                self.targets.pop(pid, None)
+            if parents:
+                self.parents.add(pid)
+            else:
+                self.parents.discard(pid)
+
+    async def detect(self):
+        self.candidate = bool(self.parents)
+        for pid, targets in self.targets.items():
+            ppid = self.procs[pid][1]
+            for rule_id in targets:
+                if self.rules.related(rule_id, ppid, self.procs):
+                    return True
+        return False
+
+
+def replay_user_config(header, user_config=None):
+    """ The config to replay with: the recorded one, or the watch, options and proc of another config """
+    source = user_config or SimpleNamespace(**{section: header[section] for section in ("watch", "options", "proc")})
+    options = dict(source.options)
+    options["reload_config"] = False
+    return SimpleNamespace(
+        mqtt={"host": "replay"},
+        # The replay detectors are added after the watcher is built, no real detector may start
+        watch={"microphone": False},
+        options=options,
+        proc=source.proc,
+        sinks=[],
+        metrics={},
+    ), dict(source.watch or {})
+
+
+def detector_options(watch, name):
+    value = watch.get(name)
+    return value if isinstance(value, dict) else {}
+
+
+async def replay(header, records, user_config=None, db_path=None, verbose=False):
+    """ Feed a recording through a MeetingWatcher, returns (watcher, stats) """
+    from logger import LogStore
+    from watch import MeetingWatcher
+
+    clock = VirtualClock()
+
+    class ReplayWatcher(MeetingWatcher):
+        publisher_class = ReplayPublisher
+
+    ReplayWatcher.clock = staticmethod(clock.monotonic)
+    ReplayWatcher.wall_clock = staticmethod(clock.time)
+    config, watch = replay_user_config(header, user_config)
+    app_config = SimpleNamespace(
+        verbose=verbose,
+        user_config=config,
+        user_config_file=None,
+        user_config_path=os.path.dirname(db_path),
+        log_db_file=db_path,
+        log_store=LogStore(db_path, clock=clock.now, setup_schema=True),
+        record_file=None,
+    )
+    watcher = ReplayWatcher(app_config, status_callback=lambda status: None, state_callback=lambda state: None)
+    watcher.publisher.clock = clock.time
+    # Re-evaluate the proc rules from the process table when replaying with another config
+    proc_detector = ReplayProcessDetector(config.proc, detector_options(watch, "proc")) if user_config else None
+    detectors = {}
+    stats = {"cycles": 0, "commands": 0, "skipped": 0, "first": None, "last": None}
+    watcher.log_store.open()
+    for record in records:
+        clock.set(record)
+        if stats["first"] is None:
+            stats["first"] = clock.wall
+        stats["last"] = clock.wall
+        if "c" in record:
+            stats["commands"] += 1
+            watcher.command(record["c"], record.get("n"))
+            continue
+        if proc_detector and "p" in record:
+            proc_detector.apply(record["p"])
+        for name in record["r"]:
+            if name not in detectors:
+                if proc_detector and name == "proc":
+                    detectors[name] = proc_detector
+                else:
+                    detectors[name] = ReplayDetector(name, detector_options(watch, name))
+                watcher.detectors = list(detectors.values())
+                watcher.engine.set_detectors(watcher.detectors)
+        for name, detector in detectors.items():
+            if detector is not proc_detector:
+                detector.result = record["r"].get(name)
+        watcher.__check_pause__()
+        if watcher.mode != "auto":
+            stats["skipped"] += 1
+            continue
+        await watcher.__run_cycle__()
+        stats["cycles"] += 1
+    watcher.engine.stop()
+    watcher.log_store.flush()
+    return watcher, stats
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    return (f"{days}d " if days else "") + f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run(app_config, args):
+    """ The replay command, returns the process exit code """
+    try:
+        header, records = read_recording(args.recording)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    user_config = None
+    if args.with_config:
+        from config import UserConfig
+        user_config = UserConfig()
+        user_config.load(args.with_config)
+        if not user_config.ready:
+            print(f"Config not usable: {user_config.error}", file=sys.stderr)
+            return 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = args.db or os.path.join(tmp_dir, "replay.db")
+        started = time.perf_counter()
+        try:
+            watcher, stats = asyncio.run(replay(header, records, user_config, db_path, verbose=app_config.verbose))
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Error reading {args.recording}: {e}", file=sys.stderr)
+            return 1
+        elapsed = time.perf_counter() - started
+        rows = watcher.log_store.query("SELECT COUNT(*), COALESCE(SUM(duration), 0) FROM log")[0]
+        published = watcher.publisher.published
+        machine = watcher.state_machine.stats
+        watcher.log_store.close()
+
+    span = (stats["last"] - stats["first"]) if stats["first"] is not None else 0
+    if args.timeline:
+        for timestamp, topic, payload in published:
+            print(f"{datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S} {topic} {payload}")
+    print(f"Replayed {stats['cycles']} cycles and {stats['commands']} commands covering {format_duration(span)} "
+          f"in {elapsed:.2f}s")
+    print(f"Published {len(published)} messages "
+          f"({sum(1 for _, _, payload in published if payload == '1')} on), "
+          f"suppressed {machine['suppressed_on']} on and {machine['suppressed_off']} off")
+    print(f"Logged {rows[0]} meetings, {format_duration(rows[1])} in total")
+    return 0
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import sqlite3
+from datetime import date
+
+PERCENTILES = (50, 75, 90, 99)
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+# Heatmap cells from no meetings to the busiest hour
+SHADES = " .:-=+*#%@"
+SQL_DAILY = "SELECT day, meetings, seconds FROM log_daily WHERE meetings > 0"
+SQL_HOURLY = """
+    SELECT CAST(strftime('%w', day) AS INTEGER), hour, SUM(meetings), SUM(seconds) FROM log_hourly
+    WHERE meetings > 0
+"""
+SQL_DURATIONS = "SELECT minutes, SUM(meetings) FROM log_durations WHERE meetings > 0"
+
+
+class ReportError(Exception):
+    pass
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ReportError("The report command needs numpy (pip install numpy)")
+    return numpy
+
+
+def open_log(db_path):
+    """ Open the meeting log read-only, the running watcher owns the schema and the open meeting """
+    if not os.path.exists(db_path):
+        raise ReportError(f"Meeting log not found: {db_path}")
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def query(conn, sql, params=()):
+    try:
+        return conn.execute(sql, params).fetchall()
+    except sqlite3.Error as e:
+        # The rollups are created the next time the watcher opens the log
+        raise ReportError(f"Error reading meeting log: {e}")
+
+
+def range_query(sql, start=None, end=None, suffix=""):
+    """ Limit a rollup query to the days in [start, end) """
+    params = []
+    if start is not None:
+        sql += " AND day >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND day < ?"
+        params.append(end)
+    return sql + suffix, params
+
+
+def duration_percentiles(np, minutes, counts, percentiles=PERCENTILES):
+    """ Percentiles of the meeting length from the per-minute histogram, as the upper bound in minutes """
+    if not len(counts):
+        return {}
+    cumulative = np.cumsum(counts)
+    ranks = np.array(percentiles) / 100 * cumulative[-1]
+    indexes = np.searchsorted(cumulative, ranks, side="left")
+    return {f"p{percentile}": int(minutes[index]) + 1 for percentile, index in zip(percentiles, indexes)}
+
+
+def streaks(np, ordinals):
+    """ Longest runs of consecutive days with meetings and without, as (days, first day) """
+    if not len(ordinals):
+        return None, None
+    gaps = np.diff(ordinals)
+    # Runs of meeting days are split where the gap to the next day is more than one
+    breaks = np.flatnonzero(gaps != 1)
+    run_starts = np.concatenate(([0], breaks + 1))
+    run_ends = np.concatenate((breaks, [len(ordinals) - 1]))
+    lengths = ordinals[run_ends] - ordinals[run_starts] + 1
+    longest = int(np.argmax(lengths))
+    busy = (int(lengths[longest]), date.fromordinal(int(ordinals[run_starts[longest]])).isoformat())
+    if not len(gaps) or gaps.max() <= 1:
+        return busy, None
+    widest = int(np.argmax(gaps))
+    free = (int(gaps[widest]) - 1, date.fromordinal(int(ordinals[widest]) + 1).isoformat())
+    return busy, free
+
+
+def build_report(conn, start=None, end=None, days=14, weeks=8):
+    """ Aggregate the rollup tables, returns a JSON serialisable dict """
+    np = import_numpy()
+    daily = query(conn, *range_query(SQL_DAILY, start, end, " ORDER BY day"))
+    day_names = [row[0] for row in daily]
+    meetings = np.array([row[1] for row in daily], dtype=np.int64)
+    seconds = np.array([row[2] for row in daily], dtype=np.float64)
+    ordinals = np.array([date.fromisoformat(day).toordinal() for day in day_names], dtype=np.int64)
+
+    # ISO weeks as (year, week) keys, totals summed per unique week
+    weeks_of = [date.fromordinal(int(ordinal)).isocalendar()[:2] for ordinal in ordinals]
+    week_keys = np.array([year * 100 + week for year, week in weeks_of], dtype=np.int64)
+    unique_weeks, week_index = np.unique(week_keys, return_inverse=True)
+    week_meetings = np.bincount(week_index, weights=meetings, minlength=len(unique_weeks))
+    week_seconds = np.bincount(week_index, weights=seconds, minlength=len(unique_weeks))
+
+    heatmap = np.zeros((7, 24), dtype=np.float64)
+    heat_counts = np.zeros((7, 24), dtype=np.int64)
+    hourly = query(conn, *range_query(SQL_HOURLY, start, end, " GROUP BY 1, 2"))
+    if hourly:
+        cells = np.array(hourly, dtype=np.float64)
+        # sqlite weekdays start on Sunday
+        rows = (cells[:, 0].astype(np.int64) + 6) % 7
+        hours = cells[:, 1].astype(np.int64)
+        np.add.at(heat_counts, (rows, hours), cells[:, 2].astype(np.int64))
+        np.add.at(heatmap, (rows, hours), cells[:, 3])
+
+    durations = query(conn, *range_query(SQL_DURATIONS, start, end, " GROUP BY minutes ORDER BY minutes"))
+    duration_minutes = np.array([row[0] for row in durations], dtype=np.int64)
+    duration_counts = np.array([row[1] for row in durations], dtype=np.int64)
+    busy, free = streaks(np, ordinals)
+
+    first_day = max(0, len(day_names) - days)
+    first_week = max(0, len(unique_weeks) - weeks)
+    total_meetings = int(meetings.sum())
+    total_seconds = float(seconds.sum())
+    return {
+        "meetings": total_meetings,
+        "hours": round(total_seconds / 3600, 2),
+        "days_with_meetings": len(day_names),
+        "first_day": day_names[0] if day_names else None,
+        "last_day": day_names[-1] if day_names else None,
+        "average_minutes": round(total_seconds / 60 / total_meetings, 1) if total_meetings else None,
+        "hours_per_meeting_day": round(total_seconds / 3600 / len(day_names), 2) if day_names else None,
+        "duration_minutes": duration_percentiles(np, duration_minutes, duration_counts),
+        "longest_meeting_streak": {"days": busy[0], "from": busy[1]} if busy else None,
+        "longest_free_streak": {"days": free[0], "from": free[1]} if free else None,
+        "daily": [
+            {"day": day_names[index], "meetings": int(meetings[index]), "hours": round(float(seconds[index]) / 3600, 2)}
+            for index in range(first_day, len(day_names))
+        ],
+        "weekly": [
+            {"week": f"{unique_weeks[index] // 100}-W{unique_weeks[index] % 100:02d}",
+             "meetings": int(week_meetings[index]), "hours": round(float(week_seconds[index]) / 3600, 2)}
+            for index in range(first_week, len(unique_weeks))
+        ],
+        "heatmap": {
+            "meetings": heat_counts.tolist(),
+            "hours": np.round(heatmap / 3600, 2).tolist(),
+        },
+    }
+
+
+def format_heatmap(counts):
+    """ Weekday rows by hour columns, shaded by meetings started """
+    peak = max(max(row) for row in counts) or 1
+    lines = ["     " + "".join(f"{hour:<3d}" for hour in range(0, 24, 3)).rstrip()]
+    for name, row in zip(WEEKDAY_NAMES, counts):
+        cells = "".join(SHADES[0 if not count else 1 + (len(SHADES) - 2) * count // peak] for count in row)
+        lines.append(f"{name}  {cells}")
+    return "\n".join(lines)
+
+
+def format_text(report):
+    if not report["meetings"]:
+        return "No finished meetings in the log"
+    lines = [
+        f"{report['meetings']} meetings, {report['hours']:.1f} hours on {report['days_with_meetings']} days "
+        f"({report['first_day']} to {report['last_day']})",
+        f"Average {report['average_minutes']:.0f} minutes per meeting, "
+        f"{report['hours_per_meeting_day']:.1f} hours per day with meetings",
+        "Meeting length: " + ", ".join(f"{name} <= {minutes} min" for name, minutes in report["duration_minutes"].items()),
+    ]
+    if report["longest_meeting_streak"]:
+        streak = report["longest_meeting_streak"]
+        lines.append(f"Longest streak of days with meetings: {streak['days']} from {streak['from']}")
+    if report["longest_free_streak"]:
+        streak = report["longest_free_streak"]
+        lines.append(f"Longest break without meetings: {streak['days']} days from {streak['from']}")
+    lines.append("")
+    lines.append("Day          Meetings  Hours")
+    lines.extend(f"{row['day']}   {row['meetings']:8d}  {row['hours']:5.1f}" for row in report["daily"])
+    lines.append("")
+    lines.append("Week         Meetings  Hours")
+    lines.extend(f"{row['week']}     {row['meetings']:8d}  {row['hours']:5.1f}" for row in report["weekly"])
+    lines.append("")
+    lines.append("Meetings started by weekday and hour")
+    lines.append(format_heatmap(report["heatmap"]["meetings"]))
+    return "\n".join(lines)
+
+
+def run(app_config, args):
+    """ The report command, returns the process exit code """
+    try:
+        conn = open_log(app_config.log_db_file)
+        try:
+            report = build_report(conn, start=args.start, end=args.end, days=args.days, weeks=args.weeks)
+        finally:
+            conn.close()
+    except ReportError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_text(report))
+    return 0
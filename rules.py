@@ -0,0 +1,287 @@
+import re
+import fnmatch
+
+# Process names are cached with their classification, most tables repeat a few hundred names
+NAME_CACHE_SIZE = 4096
+# Parent chains deeper than this are not followed for ancestor rules
+MAX_ANCESTOR_DEPTH = 32
+# The kernel truncates process names in /proc/<pid>/comm to 15 characters
+TASK_COMM_LEN = 15
+# Patterns anchored on a literal prefix this long are bucketed by it
+PREFIX_LEN = 3
+REGEX_SPECIAL = set("\\.[]()*+?{}|^$")
+
+# Roles a process name can play for a rule
+TARGET = 0
+PARENT = 1
+
+
+def top_level_alternation(pattern):
+    """ True if a regex has a | outside any group, its branches need not share a prefix """
+    depth = 0
+    in_class = False
+    escaped = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+        elif char == "|" and depth == 0:
+            return True
+    return False
+
+
+class Pattern:
+    """ A compiled name, path or argument pattern: exact, glob:... / *?[ wildcards, or re:... """
+    def __init__(self, source):
+        source = str(source)
+        self.source = source
+        if source.startswith("re:"):
+            self.kind = "regex"
+            self.regex = re.compile(source[3:], re.IGNORECASE)
+            self.value = None
+        elif source.startswith("glob:") or any(char in source for char in "*?["):
+            self.kind = "glob"
+            self.value = source[5:] if source.startswith("glob:") else source
+            self.regex = re.compile(fnmatch.translate(self.value.lower()))
+        else:
+            self.kind = "exact"
+            self.value = source.lower()
+            self.regex = None
+
+    @property
+    def exact(self):
+        return self.kind == "exact"
+
+    def literal_prefix(self):
+        """ Lower-case literal text every match has to start with """
+        if self.kind == "glob":
+            source = self.value.lower()
+            end = len(source)
+            for index, char in enumerate(source):
+                if char in "*?[":
+                    end = index
+                    break
+            return source[:end]
+        if self.kind == "regex" and self.regex.pattern.startswith("^") \
+                and not top_level_alternation(self.regex.pattern):
+            prefix = []
+            for char in self.regex.pattern[1:]:
+                if char in REGEX_SPECIAL:
+                    if char in "*+?{" and prefix:
+                        # The previous character is optional or repeated
+                        prefix.pop()
+                    break
+                prefix.append(char)
+            return "".join(prefix).lower()
+        return ""
+
+    def expression(self):
+        """ Regular expression source used for the combined prefilter """
+        if self.kind == "regex":
+            return f"(?i:{self.regex.pattern})"
+        return self.regex.pattern
+
+    def match(self, value):
+        if value is None:
+            return False
+        if self.kind == "exact":
+            return value.lower() == self.value
+        if self.kind == "glob":
+            return self.regex.match(value.lower()) is not None
+        return self.regex.search(value) is not None
+
+    def match_any(self, values):
+        """ Match a single command line argument, or the joined command line for glob and regex """
+        if not values:
+            return False
+        if self.kind == "exact":
+            return any(value.lower() == self.value for value in values)
+        return self.match(" ".join(values))
+
+    def __repr__(self):
+        return f"Pattern({self.source!r})"
+
+
+class Rule:
+    """ One meeting process rule: a process matched by name, exe or cmdline, optionally under a parent or ancestor """
+    def __init__(self, rule_id, name, process=None, exe=None, cmdline=None, parent=None, ancestor=None):
+        self.id = rule_id
+        self.name = name
+        self.process = Pattern(process) if process is not None else None
+        self.exe = Pattern(exe) if exe is not None else None
+        self.cmdline = Pattern(cmdline) if cmdline is not None else None
+        self.parent = Pattern(parent) if parent is not None else None
+        self.ancestor = Pattern(ancestor) if ancestor is not None else None
+        if not (self.process or self.exe or self.cmdline):
+            raise ValueError(f"proc rule {name} needs a process, exe or cmdline pattern")
+
+    @property
+    def needs_details(self):
+        """ True if the exe or cmdline of the process has to be fetched """
+        return self.exe is not None or self.cmdline is not None
+
+    def match_details(self, exe, cmdline):
+        if self.exe and not self.exe.match(exe):
+            return False
+        if self.cmdline and not self.cmdline.match_any(cmdline):
+            return False
+        return True
+
+
+def parse_rules(proc_config):
+    """ Turn the proc config into Rules
+
+    The legacy mapping form, parent name -> list of child names, is kept. List entries may
+    also be rule mappings, and the proc section may be a list of rule mappings:
+
+        - name: teams
+          process: "re:^(ms-)?teams"
+          cmdline: "--type=renderer"
+          ancestor: "glob:*teams*"
+    """
+    rules = []
+    if isinstance(proc_config, dict):
+        for parent, children in proc_config.items():
+            for child in children or []:
+                if isinstance(child, dict):
+                    options = dict(child)
+                    options.setdefault("parent", parent)
+                    options.setdefault("name", f"{parent}->{options.get('process', options.get('exe'))}")
+                else:
+                    options = {"name": f"{parent}->{child}", "process": child, "parent": parent}
+                rules.append(options)
+    else:
+        for index, options in enumerate(proc_config or []):
+            options = dict(options)
+            options.setdefault("name", str(options.get("process", f"rule-{index}")))
+            rules.append(options)
+    return [
+        Rule(rule_id, options["name"], options.get("process"), options.get("exe"), options.get("cmdline"),
+             options.get("parent"), options.get("ancestor"))
+        for rule_id, options in enumerate(rules)
+    ]
+
+
+class RuleSet:
+    """ Rules compiled once into a hash of exact names and a single prefilter regex for the patterns """
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        # exact lower-case name -> ((rule id, role), ...)
+        self.exact = {}
+        # (pattern, rule id, role) for glob and regex names, only tried when their prefilter matches
+        self.patterns = []
+        # literal name prefix -> patterns, so a name only meets the patterns that can start like it
+        self.buckets = {}
+        # Rules without a process name pattern have to look at every process
+        self.unnamed = frozenset(rule.id for rule in self.rules if rule.process is None)
+        self.details = frozenset(rule.id for rule in self.rules if rule.needs_details)
+        for rule in self.rules:
+            for pattern, role in ((rule.process, TARGET), (rule.parent, PARENT), (rule.ancestor, PARENT)):
+                if pattern is None:
+                    continue
+                if pattern.exact:
+                    self.exact.setdefault(pattern.value, []).append((rule.id, role))
+                else:
+                    self.patterns.append((pattern, rule.id, role))
+        self.exact = {name: tuple(entries) for name, entries in self.exact.items()}
+        unanchored = []
+        for entry in self.patterns:
+            prefix = entry[0].literal_prefix()
+            if len(prefix) >= PREFIX_LEN:
+                self.buckets.setdefault(prefix[:PREFIX_LEN], []).append(entry)
+            else:
+                unanchored.append(entry)
+        self.buckets = {prefix: self.__compile_bucket__(entries) for prefix, entries in self.buckets.items()}
+        self.prefilter = self.__compile_bucket__(unanchored) if unanchored else None
+        self.cache = {}
+        self.stats = {"classified": 0, "cache_hits": 0, "pattern_tests": 0}
+
+    @staticmethod
+    def __compile_bucket__(entries):
+        """ One alternation over all the patterns of a bucket, the patterns are tested one by one on a hit """
+        prefilter = re.compile("|".join(f"(?:{pattern.expression()})" for pattern, _, _ in entries))
+        return prefilter, tuple(entries)
+
+    @classmethod
+    def from_config(cls, proc_config):
+        return cls(parse_rules(proc_config))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def classify_name(self, name):
+        """ Return (target rule ids, parent rule ids) for a process name """
+        if name is None:
+            return self.unnamed, frozenset()
+        cached = self.cache.get(name)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached
+        self.stats["classified"] += 1
+        targets = set(self.unnamed)
+        parents = set()
+        for rule_id, role in self.exact.get(name.lower(), ()):
+            (targets if role == TARGET else parents).add(rule_id)
+        lower = name.lower()
+        for bucket in (self.buckets.get(lower[:PREFIX_LEN]), self.prefilter):
+            if bucket is None or not bucket[0].search(lower):
+                continue
+            for pattern, rule_id, role in bucket[1]:
+                self.stats["pattern_tests"] += 1
+                if pattern.match(name):
+                    (targets if role == TARGET else parents).add(rule_id)
+        result = frozenset(targets), frozenset(parents)
+        if len(self.cache) >= NAME_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[name] = result
+        return result
+
+    def needs_details(self, targets):
+        return not self.details.isdisjoint(targets)
+
+    def classify_details(self, targets, exe, cmdline):
+        """ Drop the target rules whose exe or cmdline pattern does not match """
+        return frozenset(
+            rule_id for rule_id in targets
+            if rule_id not in self.details or self.rules[rule_id].match_details(exe, cmdline)
+        )
+
+    def related(self, rule_id, ppid, procs):
+        """ Check the parent and ancestor patterns of a rule against the cached process tree """
+        rule = self.rules[rule_id]
+        if rule.parent:
+            parent = procs.get(ppid)
+            if parent is None or not rule.parent.match(parent[0]):
+                return False
+        if rule.ancestor:
+            depth = 0
+            while ppid and depth < MAX_ANCESTOR_DEPTH:
+                ancestor = procs.get(ppid)
+                if ancestor is None:
+                    return False
+                if rule.ancestor.match(ancestor[0]):
+                    return True
+                ppid = ancestor[1]
+                depth += 1
+            return False
+        return True
+
+    def relevant(self, comm):
+        """ True if a process with this (possibly truncated) kernel comm name may match a rule """
+        if self.unnamed:
+            return True
+        if len(comm) < TASK_COMM_LEN:
+            return any(self.classify_name(comm))
+        # The name may have been truncated, compare prefixes for exact names and assume patterns may match
+        if self.patterns:
+            return True
+        return any(name[:TASK_COMM_LEN] == comm for name in self.exact)
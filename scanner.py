@@ -0,0 +1,185 @@
+import time
+import threading
+from collections import deque
+import psutil
+from rules import RuleSet
+
+# Seconds after a process starts during which its name is checked every scan, launchers
+# and shells usually exec the real program right after forking
+RECHECK_AGE = 60
+
+
+class ProcessScanner:
+    """ Incremental process table scanner used to answer the proc rules """
+    def __init__(self, rules=None, verbose=False, recheck_age=RECHECK_AGE):
+        self.verbose = verbose
+        self.recheck_age = recheck_age
+        # (create_time, pid) of the processes started in the last recheck_age seconds, oldest first
+        self.young = deque()
+        # pid -> (name, ppid, create_time)
+        self.procs = {}
+        # pid -> (target rule ids, parent rule ids), only for pids that play a part in a rule
+        self.roles = {}
+        # rule id -> pids matching the rule's process, exe and cmdline patterns
+        self.targets = {}
+        # rule id -> pids matching the rule's parent or ancestor pattern
+        self.parents = {}
+        # pids that exec'd since the last scan, re-inspected even though they are cached
+        self.refreshes = set()
+        self.refresh_lock = threading.Lock()
+        self.rules = RuleSet()
+        self.set_rules(rules)
+        self.stats = {
+            "cycles": 0,
+            "processes": 0,
+            "inspected": 0,
+            "exited": 0,
+            "inspected_total": 0,
+            "rechecked": 0,
+        }
+
+    def set_rules(self, rules):
+        """ Compile the proc config and classify the cached processes against it """
+        self.rules = rules if isinstance(rules, RuleSet) else RuleSet.from_config(rules)
+        self.roles = {}
+        self.targets = {}
+        self.parents = {}
+        for pid, (name, _, _) in self.procs.items():
+            if name is not None:
+                self.__classify__(pid, name)
+
+    def __classify__(self, pid, name, process=None):
+        """ Index the rules a process takes part in, exe and cmdline are only read when a rule needs them """
+        targets, parents = self.rules.classify_name(name)
+        if targets and self.rules.needs_details(targets):
+            try:
+                process = process or psutil.Process(pid)
+                exe, cmdline = process.exe(), process.cmdline()
+            except psutil.Error:
+                exe, cmdline = None, []
+            targets = self.rules.classify_details(targets, exe, cmdline)
+        if not targets and not parents:
+            return
+        self.roles[pid] = (targets, parents)
+        for rule_id in targets:
+            self.targets.setdefault(rule_id, set()).add(pid)
+        for rule_id in parents:
+            self.parents.setdefault(rule_id, set()).add(pid)
+
+    def __inspect__(self, pid):
+        """ Fetch and index the attributes the rules need for a single pid """
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                name = process.name().lower()
+                create_time = process.create_time()
+                self.__index_pid__(pid, (name, process.ppid(), create_time))
+                self.__classify__(pid, name, process)
+            if self.recheck_age and create_time > time.time() - self.recheck_age:
+                self.young.append((create_time, pid))
+        except (psutil.AccessDenied, psutil.ZombieProcess):
+            # Cache the pid anyway so it is not inspected again every cycle.
+            # ZombieProcess subclasses NoSuchProcess, so it has to be caught first.
+            self.__index_pid__(pid, (None, None, None))
+        except psutil.NoSuchProcess:
+            if pid in self.procs:
+                self.__drop_pid__(pid)
+
+    def __index_pid__(self, pid, info):
+        self.procs[pid] = info
+
+    def __unindex__(self, index, rule_ids, pid):
+        for rule_id in rule_ids:
+            pids = index.get(rule_id)
+            if pids is not None:
+                pids.discard(pid)
+                if not pids:
+                    del index[rule_id]
+
+    def __drop_pid__(self, pid):
+        self.procs.pop(pid)
+        roles = self.roles.pop(pid, None)
+        if roles is not None:
+            self.__unindex__(self.targets, roles[0], pid)
+            self.__unindex__(self.parents, roles[1], pid)
+
+    def refresh(self, pid):
+        """ Inspect a cached pid again on the next scan, e.g. after it exec'd another program
+
+        Thread safe, the proc connector calls it from its listener thread.
+        """
+        with self.refresh_lock:
+            self.refreshes.add(pid)
+
+    def __exec_changed__(self, now):
+        """ Young pids whose name changed since they were inspected, i.e. that exec'd another program """
+        while self.young and self.young[0][0] <= now - self.recheck_age:
+            self.young.popleft()
+        changed = set()
+        seen = set()
+        for create_time, pid in self.young:
+            info = self.procs.get(pid)
+            if pid in seen or info is None or info[2] != create_time:
+                continue
+            seen.add(pid)
+            try:
+                name = psutil.Process(pid).name().lower()
+            except psutil.Error:
+                continue
+            if name != info[0]:
+                changed.add(pid)
+        self.stats["rechecked"] = len(seen)
+        return changed
+
+    def scan(self):
+        """ Walk the process table once, only inspecting new pids """
+        current = set(psutil.pids())
+        known = self.procs.keys()
+        exited = known - current
+        new = current - known
+        for pid in exited:
+            self.__drop_pid__(pid)
+        with self.refresh_lock:
+            refreshes = self.refreshes
+            self.refreshes = set()
+        for pid in refreshes | self.__exec_changed__(time.time()):
+            if pid in self.procs and pid in current:
+                self.__drop_pid__(pid)
+                new.add(pid)
+        for pid in new:
+            self.__inspect__(pid)
+
+        self.stats["cycles"] += 1
+        self.stats["processes"] = len(self.procs)
+        self.stats["inspected"] = len(new)
+        self.stats["exited"] = len(exited)
+        self.stats["inspected_total"] += len(new)
+
+    def __verify__(self, pid):
+        """ Make sure a cached pid has not been reused by another process """
+        info = self.procs.get(pid)
+        if info is None:
+            return False
+        try:
+            if psutil.Process(pid).create_time() == info[2]:
+                return True
+        except psutil.Error:
+            pass
+        self.__drop_pid__(pid)
+        return False
+
+    def match(self):
+        """ Return the first (rule name, process name, pid) matching the rules, or None """
+        for rule_id, pids in tuple(self.targets.items()):
+            rule = self.rules.rules[rule_id]
+            for pid in tuple(pids):
+                info = self.procs.get(pid)
+                if info is None or not self.rules.related(rule_id, info[1], self.procs):
+                    continue
+                if self.__verify__(pid) and (rule.parent is None or self.__verify__(info[1])):
+                    return rule.name, info[0], pid
+        return None
+
+    def candidate(self):
+        """ Return True if a parent or ancestor process from the rules is running """
+        return bool(self.parents)
@@ -0,0 +1,88 @@
+import time
+from collections import deque
+
+
+class AdaptiveScheduler:
+    """ Pick the watch loop sleep interval from how recently the state changed """
+    def __init__(self, interval, min_interval=None, max_interval=None, backoff=1.5,
+                 stable_after=300, adaptive=True, quiet_interval=None, candidate_window=120, clock=time.monotonic):
+        self.base_interval = interval
+        self.min_interval = min_interval if min_interval is not None else max(1, interval / 5)
+        self.max_interval = max_interval if max_interval is not None else interval * 6
+        # Longest interval while a detector expects nothing to happen, e.g. no meeting on the calendar
+        self.quiet_interval = quiet_interval if quiet_interval is not None else self.max_interval * 10
+        self.backoff = backoff
+        self.stable_after = stable_after
+        # Seconds to poll quickly after a candidate appears, a meeting app may stay open all day
+        self.candidate_window = candidate_window
+        self.candidate_since = None
+        self.adaptive = adaptive
+        self.clock = clock
+        self.interval = interval
+        self.stable_since = clock()
+        self.polls = deque()
+        self.total_polls = 0
+
+    def __record_poll__(self, now):
+        self.total_polls += 1
+        self.polls.append(now)
+        while self.polls and now - self.polls[0] > 3600:
+            self.polls.popleft()
+
+    def update(self, in_meeting=False, transition=False, candidate=False, quiet_for=None):
+        """ Record a poll and return the interval to sleep before the next one
+
+        quiet_for is how many seconds nothing is expected to happen, it lets the interval grow
+        past max_interval but never past the end of the quiet time.
+        """
+        now = self.clock()
+        self.__record_poll__(now)
+        if not candidate:
+            self.candidate_since = None
+        elif self.candidate_since is None:
+            self.candidate_since = now
+        if not self.adaptive:
+            self.interval = self.base_interval
+            return self.interval
+
+        if transition:
+            # Poll quickly around a state change to confirm it
+            self.stable_since = now
+            self.interval = self.min_interval
+        elif candidate and not in_meeting and now - self.candidate_since < self.candidate_window:
+            # A meeting app just started, a meeting may start any moment
+            self.interval = self.min_interval
+        elif now - self.stable_since < self.stable_after:
+            # Recently changed, relax back to the configured interval
+            self.interval = min(self.base_interval, self.interval * self.backoff)
+        else:
+            ceiling = self.max_interval
+            if quiet_for is not None:
+                ceiling = max(ceiling, min(self.quiet_interval, quiet_for))
+            self.interval = min(ceiling, self.interval * self.backoff)
+
+        if quiet_for is not None:
+            # Wake up in time for the end of the quiet time
+            self.interval = min(self.interval, max(self.min_interval, quiet_for))
+        if in_meeting:
+            # Do not delay noticing the end of a meeting beyond the configured interval
+            self.interval = min(self.interval, self.base_interval)
+        return self.interval
+
+    @property
+    def polls_per_hour(self):
+        """ Number of polls in the last hour """
+        return len(self.polls)
+
+    @property
+    def fixed_polls_per_hour(self):
+        """ Number of polls per hour a fixed watch_interval would make """
+        return 3600 / self.base_interval
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "polls_per_hour": self.polls_per_hour,
+            "fixed_polls_per_hour": self.fixed_polls_per_hour,
+            "total_polls": self.total_polls,
+        }
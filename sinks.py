@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import queue
+import socket
+import threading
+import urllib.request
+from datetime import datetime
+from publisher import MqttPublisher
+
+# Registered sink classes by config type
+SINKS = {}
+
+
+def register_sink(name):
+    """ Class decorator registering a sink under a config type """
+    def decorator(cls):
+        cls.type = name
+        SINKS[name] = cls
+        return cls
+    return decorator
+
+
+class Sink:
+    """ Base class for meeting state outputs, each sink delivers from its own worker thread """
+    type = None
+
+    def __init__(self, config, verbose=False):
+        self.config = config
+        self.verbose = verbose
+        self.name = config.get("name", self.type)
+        self.template = config.get("template", "{state_int}")
+        self.queue = queue.Queue(maxsize=config.get("queue_size", 100))
+        self.thread = None
+        self.stats = {
+            "delivered": 0,
+            "failed": 0,
+            "dropped": 0,
+            "last_latency": None,
+            "max_latency": 0.0,
+        }
+
+    def render(self, state):
+        """ Format the payload template for a state """
+        return self.template.format(
+            state=state,
+            state_int=int(state),
+            state_str="on" if state else "off",
+            state_json=json.dumps(state),
+            timestamp=datetime.now().isoformat(),
+            hostname=socket.gethostname(),
+        )
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.__worker_thread__, name=f"sink-{self.name}", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def submit(self, state):
+        """ Queue a state for delivery without blocking the caller """
+        try:
+            self.queue.put_nowait(state)
+        except queue.Full:
+            # Drop the oldest state, the newest one is what matters
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.stats["dropped"] += 1
+            self.queue.put_nowait(state)
+
+    def __worker_thread__(self):
+        stopping = False
+        while not stopping:
+            state = self.queue.get()
+            if state is None:
+                break
+            # Skip states superseded while this one was waiting
+            while not self.queue.empty():
+                newer = self.queue.get_nowait()
+                if newer is None:
+                    # Deliver the last state, e.g. the off published on shutdown, before exiting
+                    stopping = True
+                    break
+                state = newer
+            started = time.perf_counter()
+            try:
+                self.deliver(self.render(state))
+            except Exception as e:
+                self.stats["failed"] += 1
+                if self.verbose:
+                    print(f"Sink {self.name} failed: {e}")
+                continue
+            latency = time.perf_counter() - started
+            self.stats["delivered"] += 1
+            self.stats["last_latency"] = latency
+            self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+
+    def deliver(self, payload):
+        raise NotImplementedError
+
+
+class PoolEntry:
+    """ A shared broker connection and the number of sinks using it """
+    def __init__(self, key, publisher, owned):
+        self.key = key
+        self.publisher = publisher
+        # Connections the pool opened are closed with their last sink, added ones belong to their owner
+        self.owned = owned
+        self.refs = 0
+
+
+@register_sink("mqtt")
+class MqttSink(Sink):
+    """ Publish to a topic, connections are shared between sinks on the same broker and credentials """
+    # (host, port, user, password) -> PoolEntry
+    pool = {}
+    pool_lock = threading.Lock()
+
+    def __init__(self, config, verbose=False):
+        super().__init__(config, verbose)
+        self.topic = config.get("topic", "meeting/watcher")
+        self.qos = config.get("qos")
+        self.retain = config.get("retain")
+        self.entry = self.acquire(config, verbose)
+        self.publisher = self.entry.publisher
+
+    @classmethod
+    def add_publisher(cls, publisher, user=None, password=None):
+        """ Make an existing publisher available to sinks on the same broker """
+        key = (publisher.host, publisher.port, user, password)
+        with cls.pool_lock:
+            cls.pool[key] = PoolEntry(key, publisher, owned=False)
+
+    @classmethod
+    def remove_publisher(cls, publisher, user=None, password=None):
+        key = (publisher.host, publisher.port, user, password)
+        with cls.pool_lock:
+            entry = cls.pool.get(key)
+            if entry is not None and entry.publisher is publisher:
+                del cls.pool[key]
+
+    @classmethod
+    def acquire(cls, config, verbose=False):
+        """ Return the pool entry for the sink's broker, connecting if no sink uses it yet """
+        key = (config.get("host", "localhost"), config.get("port", 1883), config.get("user"), config.get("password"))
+        with cls.pool_lock:
+            entry = cls.pool.get(key)
+            if entry is None:
+                publisher = MqttPublisher(
+                    key[0], key[1], key[2], key[3],
+                    qos=config.get("qos", 0),
+                    retain=config.get("retain", False),
+                    queue_size=config.get("queue_size", 100),
+                    verbose=verbose
+                )
+                publisher.start()
+                entry = cls.pool[key] = PoolEntry(key, publisher, owned=True)
+            entry.refs += 1
+            return entry
+
+    @classmethod
+    def release(cls, entry):
+        """ Drop a sink's use of a connection, stopping it when the last sink is gone """
+        with cls.pool_lock:
+            entry.refs -= 1
+            if entry.refs > 0 or not entry.owned:
+                return
+            if cls.pool.get(entry.key) is entry:
+                del cls.pool[entry.key]
+        entry.publisher.stop()
+
+    def stop(self):
+        super().stop()
+        if self.entry is not None:
+            self.release(self.entry)
+            self.entry = None
+
+    def deliver(self, payload):
+        self.publisher.publish(self.topic, payload, qos=self.qos, retain=self.retain)
+
+
+@register_sink("file")
+class FileSink(Sink):
+    """ Write the latest payload to a file, replaced atomically """
+    def __init__(self, config, verbose=False):
+        super().__init__(config, verbose)
+        self.path = os.path.expanduser(config["path"])
+
+    def deliver(self, payload):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as state_file:
+            state_file.write(payload)
+        os.replace(tmp_path, self.path)
+
+
+@register_sink("socket")
+class UnixSocketSink(Sink):
+    """ Send the payload as a datagram or line to a local unix socket """
+    def __init__(self, config, verbose=False):
+        super().__init__(config, verbose)
+        self.path = os.path.expanduser(config["path"])
+        self.datagram = config.get("datagram", False)
+        self.timeout = config.get("timeout", 2)
+
+    def deliver(self, payload):
+        kind = socket.SOCK_DGRAM if self.datagram else socket.SOCK_STREAM
+        with socket.socket(socket.AF_UNIX, kind) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall(payload.encode() + (b"" if self.datagram else b"\n"))
+
+
+@register_sink("http")
+class HttpSink(Sink):
+    """ POST the payload to a webhook """
+    def __init__(self, config, verbose=False):
+        super().__init__(config, verbose)
+        self.url = config["url"]
+        self.method = config.get("method", "POST")
+        self.timeout = config.get("timeout", 2)
+        self.headers = config.get("headers", {"Content-Type": "text/plain"})
+
+    def deliver(self, payload):
+        request = urllib.request.Request(self.url, data=payload.encode(), method=self.method, headers=self.headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SinkFanout:
+    """ Deliver every state change to all configured sinks concurrently """
+    def __init__(self, sinks=None, verbose=False):
+        self.sinks = sinks or []
+        self.verbose = verbose
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+
+    def stop(self):
+        for sink in self.sinks:
+            sink.stop()
+
+    def publish(self, state):
+        for sink in self.sinks:
+            sink.submit(state)
+
+    def stats(self):
+        return {sink.name: sink.stats for sink in self.sinks}
+
+
+def create_sinks(sink_configs, verbose=False, broker=None):
+    """ Build the sinks from the sinks section of the user config
+
+    mqtt sinks without a host publish to broker, the main connection's host, port, user and password.
+    """
+    sinks = []
+    for index, config in enumerate(sink_configs or []):
+        sink_type = config.get("type", "mqtt")
+        config = dict(config)
+        config.setdefault("name", f"{sink_type}-{index}")
+        if sink_type == "mqtt" and "host" not in config and broker:
+            for key in ("host", "port", "user", "password"):
+                config.setdefault(key, broker.get(key))
+        if sink_type not in SINKS:
+            if verbose:
+                print(f"Unknown sink type: {sink_type}")
+            continue
+        try:
+            sinks.append(SINKS[sink_type](config, verbose=verbose))
+        except KeyError as e:
+            if verbose:
+                print(f"Sink {sink_type} is missing option {e}")
+    return SinkFanout(sinks, verbose=verbose)
@@ -0,0 +1,76 @@
+import sys
+import time
+import builtins
+import threading
+
+PROFILE = None
+
+
+class StartupProfile:
+    """ Record module import times and startup milestones for --profile-startup """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = []
+        # (module name, seconds including nested imports, nesting depth)
+        self.imports = []
+        self.local = threading.local()
+        self.original_import = None
+        self.reported = False
+
+    def install(self):
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.__timed_import__
+
+    def uninstall(self):
+        if self.original_import:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def __timed_import__(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+        depth = getattr(self.local, "depth", 0)
+        self.local.depth = depth + 1
+        started = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.local.depth = depth
+            self.imports.append((name, time.perf_counter() - started, depth))
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter() - self.started))
+
+    def report(self, top=15):
+        """ Print the milestones and the slowest top level imports to stderr """
+        if self.reported:
+            return
+        self.reported = True
+        self.uninstall()
+        print("Startup profile:", file=sys.stderr)
+        for label, elapsed in self.marks:
+            print(f"  {elapsed * 1000:9.1f} ms  {label}", file=sys.stderr)
+        top_level = sorted((item for item in self.imports if item[2] == 0), key=lambda item: item[1], reverse=True)
+        total = sum(item[1] for item in top_level)
+        print(f"Imports: {total * 1000:.1f} ms in {len(top_level)} top level imports", file=sys.stderr)
+        for name, elapsed, _ in top_level[:top]:
+            print(f"  {elapsed * 1000:9.1f} ms  {name}", file=sys.stderr)
+
+
+def enable():
+    """ Start profiling, must run before the modules to measure are imported """
+    global PROFILE
+    PROFILE = StartupProfile()
+    PROFILE.install()
+    return PROFILE
+
+
+def mark(label):
+    """ Record a startup milestone, no-op unless profiling is enabled """
+    if PROFILE:
+        PROFILE.mark(label)
+
+
+def report():
+    if PROFILE:
+        PROFILE.report()
@@ -0,0 +1,67 @@
+import time
+from metrics import REGISTRY
+
+SUPPRESSED = REGISTRY.counter("meeting_watcher_suppressed_transitions_total",
+                              "Raw state changes the debounce did not turn into transitions", labels=("state",))
+
+
+class MeetingStateMachine:
+    """ Debounce the per-cycle detection into meeting transitions
+
+    A meeting starts after enter_samples consecutive positive cycles and ends once the
+    cycles have been negative for leave_after seconds. The defaults switch on the first
+    disagreeing cycle, like the watcher did before.
+    """
+    def __init__(self, enter_samples=1, leave_after=0, state=False, clock=time.monotonic):
+        self.enter_samples = max(1, enter_samples)
+        self.leave_after = leave_after
+        self.clock = clock
+        self.state = state
+        self.positives = 0
+        self.negative_since = None
+        self.stats = {"transitions": 0, "suppressed_on": 0, "suppressed_off": 0}
+
+    @property
+    def pending(self):
+        """ True while the raw detection disagrees with the state but has not been confirmed yet """
+        return self.positives > 0 or self.negative_since is not None
+
+    def reset(self, state):
+        """ Take over a state decided elsewhere, e.g. echoed back by the broker """
+        self.state = state
+        self.positives = 0
+        self.negative_since = None
+
+    def __suppressed__(self, state):
+        self.stats[f"suppressed_{state}"] += 1
+        SUPPRESSED.inc(state=state)
+
+    def update(self, in_meeting):
+        """ Feed one cycle's detection, returns True if the meeting state changed """
+        if not self.state:
+            if in_meeting:
+                self.positives += 1
+                if self.positives >= self.enter_samples:
+                    self.reset(True)
+                    self.stats["transitions"] += 1
+                    return True
+            elif self.positives:
+                # A positive streak too short to start a meeting
+                self.positives = 0
+                self.__suppressed__("on")
+            return False
+
+        if in_meeting:
+            if self.negative_since is not None:
+                # The negatives did not last long enough to end the meeting
+                self.negative_since = None
+                self.__suppressed__("off")
+            return False
+        now = self.clock()
+        if self.negative_since is None:
+            self.negative_since = now
+        if now - self.negative_since >= self.leave_after:
+            self.reset(False)
+            self.stats["transitions"] += 1
+            return True
+        return False
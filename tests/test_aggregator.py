@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregator import Aggregator, TopicLayout  # noqa: E402
+from fakebroker import FakeBroker  # noqa: E402
+from publisher import MqttPublisher  # noqa: E402
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class AggregatorTest(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.port = self.broker.start()
+        self.watchers = {}
+        self.aggregator = Aggregator(MqttPublisher("127.0.0.1", self.port), TopicLayout("meeting/{floor}/{room}/{desk}"),
+                                     interval=0.05, full_interval=3600)
+
+    def tearDown(self):
+        self.aggregator.stop()
+        for watcher in self.watchers.values():
+            watcher.stop()
+        self.broker.stop()
+
+    def watcher(self, topic, payload):
+        """ Publish a desk state the way a watcher does, retained """
+        if topic not in self.watchers:
+            self.watchers[topic] = MqttPublisher("127.0.0.1", self.port, retain=True)
+            self.watchers[topic].start()
+        self.watchers[topic].publish(topic, payload)
+
+    def summaries(self):
+        return [json.loads(payload) for topic, payload, _ in list(self.broker.received) if topic == "meeting/summary"]
+
+    def wait_for_summary(self, desks, in_meeting):
+        def matches():
+            summaries = self.summaries()
+            return summaries and summaries[-1]["desks"] == desks and summaries[-1]["in_meeting"] == in_meeting
+        self.assertTrue(wait_for(matches), f"last summary {self.summaries()[-1:]}")
+        return self.summaries()[-1]
+
+    def test_combined_state_and_stale_watchers(self):
+        # A watcher that published before the aggregator started is picked up from its retained state
+        self.watcher("meeting/1/a/desk1", "1")
+        self.assertTrue(wait_for(lambda: "meeting/1/a/desk1" in self.broker.retained))
+        self.aggregator.start()
+        self.watcher("meeting/1/a/desk2", "0")
+        self.watcher("meeting/2/b/desk3", "1")
+
+        summary = self.wait_for_summary(desks=3, in_meeting=2)
+        self.assertEqual(summary["floors"]["1"], {"desks": 2, "in_meeting": 1})
+        self.assertEqual(summary["floors"]["2"], {"desks": 1, "in_meeting": 1})
+
+        self.watcher("meeting/1/a/desk2", "1")
+        summary = self.wait_for_summary(desks=3, in_meeting=3)
+        # Only the room that changed is in a batch
+        self.assertEqual(summary["rooms"], {"1/a": {"desks": 2, "in_meeting": 2}})
+
+        # A watcher that went away clears its retained state, its desk no longer counts
+        self.watcher("meeting/2/b/desk3", "")
+        summary = self.wait_for_summary(desks=2, in_meeting=2)
+        self.assertEqual(summary["floors"]["2"], {"desks": 0, "in_meeting": 0})
+        self.assertEqual(summary["rooms"], {"2/b": {"desks": 0, "in_meeting": 0}})
+        self.assertNotIn("meeting/2/b/desk3", self.broker.retained)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detectors import AlsaCaptureDetector  # noqa: E402
+
+
+class FakeAsound:
+    """ A /proc/asound layout with cards, capture and playback substreams """
+    def __init__(self, root):
+        self.root = root
+        self.cards = []
+
+    def write(self, path, text):
+        path = os.path.join(self.root, "asound", path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as proc_file:
+            proc_file.write(text)
+
+    def add_card(self, index, name):
+        self.cards.append(f"{index:2} [{name:<15}]: USB-Audio - {name}\n")
+        self.write("cards", "".join(self.cards))
+        self.set_state(index, "closed")
+        self.write(f"card{index}/pcm0p/sub0/status", "state: RUNNING\n")
+
+    def set_state(self, card, state):
+        # A substream nobody opened only reads "closed"
+        status = "closed\n" if state == "closed" else f"state: {state}\nowner_pid   : 4242\n"
+        self.write(f"card{card}/pcm0c/sub0/status", status)
+
+
+class AlsaCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.proc_root = tempfile.mkdtemp()
+        self.asound = FakeAsound(self.proc_root)
+        self.asound.add_card(0, "Headset")
+        self.detector = AlsaCaptureDetector(SimpleNamespace(watch={}, proc={}, options={}),
+                                            options={"proc_root": self.proc_root})
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_root)
+
+    def test_capture_states(self):
+        # Playback streams are running, only the capture substream counts
+        self.assertFalse(self.detector.detect())
+        self.asound.set_state(0, "PREPARED")
+        self.assertFalse(self.detector.detect())
+        self.asound.set_state(0, "RUNNING")
+        self.assertTrue(self.detector.detect())
+
+    def test_devices_cached_between_cycles(self):
+        for _ in range(5):
+            self.detector.detect()
+        # One enumeration, then the cards file and the one capture status per cycle
+        self.assertEqual(self.detector.stats, {"enumerations": 1, "reads": 10})
+
+    def test_hotplug_enumerates_again(self):
+        self.detector.detect()
+        self.asound.add_card(1, "Webcam")
+        self.asound.set_state(1, "RUNNING")
+        self.assertTrue(self.detector.detect())
+        self.assertEqual(self.detector.stats["enumerations"], 2)
+        self.assertEqual(len(self.detector.status_files), 2)
+
+    def test_removed_device_enumerates_again(self):
+        self.detector.detect()
+        os.remove(os.path.join(self.proc_root, "asound", "card0", "pcm0c", "sub0", "status"))
+        self.assertFalse(self.detector.detect())
+        self.detector.detect()
+        self.assertEqual(self.detector.stats["enumerations"], 2)
+        self.assertEqual(self.detector.status_files, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import UserConfig  # noqa: E402
+
+
+class EmptySectionsTest(unittest.TestCase):
+    def load(self, text):
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as config_file:
+            config_file.write(text)
+        self.addCleanup(os.remove, config_file.name)
+        user_config = UserConfig()
+        user_config.load(config_file.name)
+        return user_config
+
+    def test_empty_sections_keep_the_defaults(self):
+        user_config = self.load("mqtt:\nwatch:\nproc:\noptions:\nsinks:\n")
+        self.assertTrue(user_config.ready, user_config.error)
+        self.assertEqual(user_config.proc, {})
+        self.assertEqual(user_config.options["watch_interval"], 5)
+        self.assertEqual(user_config.mqtt["host"], "localhost")
+
+    def test_wrong_section_type_is_rejected(self):
+        user_config = self.load("proc: 3\n")
+        self.assertFalse(user_config.ready)
+        self.assertIn("proc", user_config.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from icscal import CalendarIndex  # noqa: E402
+
+CALENDAR = """BEGIN:VCALENDAR
+VERSION:2.0
+BEGIN:VEVENT
+UID:standup
+DTSTART:20261201T090000Z
+DURATION:PT15M
+RRULE:FREQ=DAILY;UNTIL={until}
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def timestamp(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class UntilTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "calendar.ics")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def index(self, until):
+        with open(self.path, "w") as ics_file:
+            ics_file.write(CALENDAR.format(until=until))
+        calendar = CalendarIndex(self.path, horizon=60 * 86400)
+        calendar.refresh(timestamp(2026, 12, 1))
+        return calendar
+
+    def test_date_until_includes_its_day(self):
+        calendar = self.index("20261210")
+        # December 1st to 10th, the 10th included
+        self.assertEqual(calendar.stats["intervals"], 10)
+        self.assertTrue(calendar.index.covers(timestamp(2026, 12, 10, 9, 5)))
+        self.assertFalse(calendar.index.covers(timestamp(2026, 12, 11, 9, 5)))
+        self.assertIsNone(calendar.index.next_start(timestamp(2026, 12, 10, 10)))
+
+    def test_date_time_until(self):
+        calendar = self.index("20261205T085959Z")
+        self.assertEqual(calendar.stats["intervals"], 4)
+        self.assertFalse(calendar.index.covers(timestamp(2026, 12, 5, 9, 5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
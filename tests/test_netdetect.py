@@ -0,0 +1,107 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detectors import NetworkDetector  # noqa: E402
+
+UDP_HEADER = ("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode ref "
+              "pointer drops\n")
+
+
+class FakeProc:
+    """ A /proc tree with comm and fd links per pid and the UDP socket tables """
+    def __init__(self, root):
+        self.root = root
+        self.sockets = {}
+        os.makedirs(os.path.join(root, "net"))
+        self.write_tables()
+
+    def add_process(self, pid, comm):
+        os.makedirs(os.path.join(self.root, str(pid), "fd"))
+        with open(os.path.join(self.root, str(pid), "comm"), "w") as comm_file:
+            comm_file.write(f"{comm}\n")
+
+    def remove_process(self, pid):
+        shutil.rmtree(os.path.join(self.root, str(pid)))
+
+    def open_socket(self, pid, fd, inode, local_port, remote_port):
+        """ A UDP socket held by pid, remote_port 0 for an unconnected one """
+        os.symlink(f"socket:[{inode}]", os.path.join(self.root, str(pid), "fd", str(fd)))
+        self.sockets[inode] = (local_port, remote_port)
+        self.write_tables()
+
+    def write_tables(self):
+        rows = [f"{index:4}: 0100007F:{local:04X} {'0A000001' if remote else '00000000'}:{remote:04X} 01 "
+                f"00000000:00000000 00:00000000 00000000  1000        0 {inode} 2 0000000000000000 0\n"
+                for index, (inode, (local, remote)) in enumerate(sorted(self.sockets.items()))]
+        with open(os.path.join(self.root, "net", "udp"), "w") as table:
+            table.write(UDP_HEADER + "".join(rows))
+        with open(os.path.join(self.root, "net", "udp6"), "w") as table:
+            table.write(UDP_HEADER)
+
+
+class NetworkDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.proc_root = tempfile.mkdtemp()
+        self.proc = FakeProc(self.proc_root)
+        self.proc.add_process(100, "zoom")
+        self.proc.add_process(200, "firefox")
+        # DNS lookups of the meeting app are not media
+        self.proc.open_socket(100, 3, 5001, 40000, 53)
+        self.proc.open_socket(200, 3, 6001, 40001, 443)
+        self.detector = NetworkDetector(SimpleNamespace(watch={}, proc={}, options={}),
+                                        options={"processes": ["zoom"], "proc_root": self.proc_root})
+        self.stats = self.detector.monitor.index.stats
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_root)
+
+    def counts(self):
+        return self.stats["refreshes"], self.stats["fd_reads"]
+
+    def test_media_flow_of_a_watched_process(self):
+        self.assertFalse(self.detector.detect())
+        # The app is open, a call may start
+        self.assertTrue(self.detector.candidate)
+        self.proc.open_socket(100, 4, 5002, 40002, 8801)
+        self.assertTrue(self.detector.detect())
+        self.assertEqual(self.detector.monitor.flows(), {5002: 100})
+
+    def test_fds_read_once_per_watched_process(self):
+        self.proc.open_socket(100, 4, 5002, 40002, 8801)
+        self.assertTrue(self.detector.detect())
+        # The watched pid's fds are read when it is first seen, and once more for the other process's socket
+        self.assertEqual(self.counts(), (1, 2))
+        for _ in range(5):
+            self.assertTrue(self.detector.detect())
+        self.assertEqual(self.counts(), (1, 2))
+
+    def test_new_sockets_refresh_once(self):
+        self.detector.detect()
+        refreshes, fd_reads = self.counts()
+        self.proc.open_socket(100, 4, 5002, 40002, 8801)
+        self.assertTrue(self.detector.detect())
+        self.assertEqual(self.counts(), (refreshes + 1, fd_reads + 1))
+        # A socket of a process not watched is looked up once, then known to be someone else's
+        self.proc.open_socket(200, 4, 6002, 40003, 3478)
+        self.detector.detect()
+        self.detector.detect()
+        self.assertEqual(self.counts(), (refreshes + 2, fd_reads + 2))
+
+    def test_process_exit(self):
+        self.proc.open_socket(100, 4, 5002, 40002, 8801)
+        self.assertTrue(self.detector.detect())
+        self.proc.remove_process(100)
+        del self.proc.sockets[5001], self.proc.sockets[5002]
+        self.proc.write_tables()
+        self.assertFalse(self.detector.detect())
+        self.assertFalse(self.detector.candidate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from procevents import (ConnectorEvents, NLMSG_HEADER, CN_MSG_HEADER, PROC_EVENT_HEADER,  # noqa: E402
+                        PROC_EVENT_PIDS, PROC_EVENT_EXEC)
+from scanner import ProcessScanner  # noqa: E402
+
+
+def exec_event(pid):
+    """ A proc connector message reporting that pid exec'd """
+    event = PROC_EVENT_HEADER.pack(PROC_EVENT_EXEC, 0, 0) + PROC_EVENT_PIDS.pack(pid, pid)
+    message = CN_MSG_HEADER.pack(1, 1, 0, 0, len(event), 0) + event
+    return NLMSG_HEADER.pack(NLMSG_HEADER.size + len(message), 3, 0, 0, 0) + message
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "needs /proc")
+class ConnectorExecTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.binary = os.path.join(self.tmp_dir, "cpthost")
+        shutil.copy(shutil.which("sleep"), self.binary)
+        self.process = None
+
+    def tearDown(self):
+        if self.process:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_exec_into_a_meeting_binary_is_reclassified(self):
+        scanner = ProcessScanner([{"process": "cpthost"}])
+        self.process = subprocess.Popen(["sh", "-c", f"sleep 0.5; exec {self.binary} 5"])
+        time.sleep(0.2)
+        scanner.scan()
+        self.assertEqual(scanner.procs[self.process.pid][0], "sh")
+        self.assertIsNone(scanner.match())
+
+        time.sleep(0.6)
+        notified = []
+        events = ConnectorEvents(scanner, notify=lambda: notified.append(True))
+        events.__handle_event__(exec_event(self.process.pid))
+        self.assertTrue(notified)
+        self.assertTrue(events.consume())
+        scanner.scan()
+        self.assertEqual(scanner.match(), ("cpthost", "cpthost", self.process.pid))
+
+
+if __name__ == "__main__":
+    unittest.main()
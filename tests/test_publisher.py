@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakebroker import FakeBroker  # noqa: E402
+from publisher import MqttPublisher  # noqa: E402
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class OfflineQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.port = self.broker.start()
+        # Stopped until the test brings the broker back, the port is kept
+        self.broker.stop()
+        self.publisher = None
+
+    def tearDown(self):
+        if self.publisher:
+            self.publisher.stop()
+        self.broker.stop()
+
+    def check_coalesced(self, qos):
+        self.publisher = MqttPublisher("127.0.0.1", self.port, qos=qos, retain=True, queue_size=2,
+                                       reconnect_min=1, reconnect_max=1)
+        for payload in ("1", "0", "1", "0", "1"):
+            self.publisher.publish("meeting/watcher", payload)
+        self.assertEqual(self.publisher.queue_depth, 1)
+        self.assertEqual(self.publisher.stats["coalesced"], 4)
+
+        self.broker.start()
+        self.publisher.start()
+        self.assertTrue(wait_for(lambda: self.broker.received))
+        time.sleep(0.2)
+        self.assertEqual(self.broker.received, [("meeting/watcher", b"1", True)])
+        self.assertEqual(self.publisher.queue_depth, 0)
+
+    def test_qos0_offline_states_are_coalesced(self):
+        self.check_coalesced(0)
+
+    def test_qos1_offline_states_are_coalesced(self):
+        self.check_coalesced(1)
+
+    def test_queue_size_bounds_topics(self):
+        self.publisher = MqttPublisher("127.0.0.1", self.port, qos=1, queue_size=2)
+        for topic in ("a", "b", "c"):
+            self.publisher.publish(topic, "1")
+        self.assertEqual(list(self.publisher.queue), ["b", "c"])
+        self.assertEqual(self.publisher.stats["dropped"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules import Pattern, Rule, RuleSet  # noqa: E402
+
+
+class LiteralPrefixTest(unittest.TestCase):
+    def test_anchored_regex(self):
+        self.assertEqual(Pattern("re:^teams").literal_prefix(), "teams")
+        self.assertEqual(Pattern("re:^zoom(\\.us|x)?").literal_prefix(), "zoom")
+
+    def test_top_level_alternation_has_no_prefix(self):
+        self.assertEqual(Pattern("re:^teams|msteams").literal_prefix(), "")
+        self.assertEqual(Pattern("re:^(teams|msteams)").literal_prefix(), "")
+
+    def test_escaped_and_class_bars_are_literal(self):
+        self.assertEqual(Pattern("re:^abc\\|d").literal_prefix(), "abc")
+        self.assertEqual(Pattern("re:^abc[|]d").literal_prefix(), "abc")
+
+
+class ClassifyNameTest(unittest.TestCase):
+    def test_alternation_matches_every_branch(self):
+        rules = RuleSet([Rule(0, "teams", process="re:^teams|msteams"), Rule(1, "zoom", process="re:^zoom")])
+        for name in ("teams", "msteams", "ms-teams-msteams"):
+            self.assertEqual(Pattern("re:^teams|msteams").match(name), 0 in rules.classify_name(name)[0], name)
+        self.assertEqual(rules.classify_name("zoom.us")[0], {1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scanner import ProcessScanner  # noqa: E402
+
+
+class ExecTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.binary = os.path.join(self.tmp_dir, "cpthost")
+        shutil.copy(shutil.which("sleep"), self.binary)
+        self.process = None
+
+    def tearDown(self):
+        if self.process:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_exec_after_the_first_scan_is_noticed(self):
+        scanner = ProcessScanner([{"process": "cpthost"}])
+        self.process = subprocess.Popen(["sh", "-c", f"sleep 0.5; exec {self.binary} 5"])
+        time.sleep(0.2)
+        scanner.scan()
+        self.assertEqual(scanner.procs[self.process.pid][0], "sh")
+        self.assertIsNone(scanner.match())
+
+        time.sleep(0.6)
+        scanner.scan()
+        self.assertEqual(scanner.procs[self.process.pid][0], "cpthost")
+        self.assertEqual(scanner.match(), ("cpthost", "cpthost", self.process.pid))
+
+    def test_old_processes_are_not_rechecked(self):
+        scanner = ProcessScanner([{"process": "cpthost"}], recheck_age=0)
+        scanner.scan()
+        scanner.scan()
+        self.assertEqual(scanner.stats["rechecked"], 0)
+        self.assertFalse(scanner.young)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from publisher import MqttPublisher  # noqa: E402
+from sinks import MqttSink, create_sinks  # noqa: E402
+
+
+class MqttSinkPoolTest(unittest.TestCase):
+    def setUp(self):
+        # Never started, the sinks only need to find it in the pool
+        self.main = MqttPublisher("broker.lan", 1884, "watcher", "secret")
+        MqttSink.add_publisher(self.main, "watcher", "secret")
+        self.broker = {"host": "broker.lan", "port": 1884, "user": "watcher", "password": "secret"}
+
+    def tearDown(self):
+        MqttSink.remove_publisher(self.main, "watcher", "secret")
+
+    def test_sink_without_host_uses_main_broker(self):
+        fanout = create_sinks([{"type": "mqtt", "topic": "office/meeting"}], broker=self.broker)
+        sink = fanout.sinks[0]
+        self.assertIs(sink.publisher, self.main)
+        self.assertEqual(sink.entry.key, ("broker.lan", 1884, "watcher", "secret"))
+        fanout.stop()
+        # The main connection belongs to the watcher, releasing the sink keeps it in the pool
+        self.assertIs(MqttSink.pool[("broker.lan", 1884, "watcher", "secret")].publisher, self.main)
+
+
+if __name__ == "__main__":
+    unittest.main()
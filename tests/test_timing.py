@@ -0,0 +1,178 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import AdaptiveScheduler  # noqa: E402
+from statemachine import MeetingStateMachine  # noqa: E402
+from timer import ElapsedTimer  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class AdaptiveSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        # min_interval 2, max_interval 60, stable after 300s, candidates polled quickly for 120s
+        self.scheduler = AdaptiveScheduler(10, clock=self.clock)
+
+    def poll(self, count, **kwargs):
+        """ Update count times, sleeping each returned interval on the fake clock """
+        intervals = []
+        for _ in range(count):
+            interval = self.scheduler.update(**kwargs)
+            intervals.append(round(interval, 3))
+            self.clock.advance(interval)
+        return intervals
+
+    def settle(self):
+        self.clock.advance(self.scheduler.stable_after)
+
+    def test_backoff_after_stable(self):
+        # Within stable_after of the start the configured interval is kept
+        self.assertEqual(self.poll(3), [10, 10, 10])
+        self.settle()
+        self.assertEqual(self.poll(7), [15, 22.5, 33.75, 50.625, 60, 60, 60])
+
+    def test_transition_polls_quickly_then_relaxes(self):
+        self.settle()
+        self.poll(6)
+        self.assertEqual(self.poll(1, transition=True), [2])
+        self.assertEqual(self.poll(5), [3, 4.5, 6.75, 10, 10])
+
+    def test_candidate_window(self):
+        self.settle()
+        self.poll(6)
+        intervals = self.poll(61, candidate=True)
+        # Two second polls for the whole candidate window, then back off although the app stays open
+        self.assertEqual(intervals[:60], [2] * 60)
+        self.assertEqual(intervals[60], 3)
+        self.assertEqual(self.poll(3, candidate=True), [4.5, 6.75, 10.125])
+
+    def test_new_candidate_restarts_the_window(self):
+        self.settle()
+        self.poll(61, candidate=True)
+        self.poll(1)
+        self.assertEqual(self.poll(1, candidate=True), [2])
+
+    def test_quiet_time(self):
+        self.settle()
+        self.poll(6)
+        # Nothing on the calendar for an hour, the interval grows past max_interval up to quiet_interval
+        intervals = self.poll(6, quiet_for=3600)
+        self.assertEqual(intervals, [90, 135, 202.5, 303.75, 455.625, 600])
+        # but never sleeps past the end of the quiet time
+        self.assertEqual(self.poll(1, quiet_for=45), [45])
+
+    def test_meeting_caps_at_base_interval(self):
+        self.settle()
+        self.assertEqual(self.poll(5, in_meeting=True), [10, 10, 10, 10, 10])
+
+    def test_not_adaptive(self):
+        scheduler = AdaptiveScheduler(10, adaptive=False, clock=self.clock)
+        self.assertEqual(scheduler.update(transition=True), 10)
+        self.assertEqual(scheduler.update(candidate=True), 10)
+
+    def test_polls_per_hour(self):
+        self.settle()
+        self.poll(200)
+        # At 60s intervals the last hour holds about 60 polls
+        self.assertLessEqual(self.scheduler.polls_per_hour, 62)
+        self.assertEqual(self.scheduler.total_polls, 200)
+
+
+
+class DebounceTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.machine = MeetingStateMachine(enter_samples=3, leave_after=30, clock=self.clock)
+
+    def feed(self, *cycles, every=5):
+        changes = []
+        for in_meeting in cycles:
+            changes.append(self.machine.update(in_meeting))
+            self.clock.advance(every)
+        return changes
+
+    def test_enter_after_consecutive_positives(self):
+        self.assertEqual(self.feed(True, True, False), [False, False, False])
+        self.assertEqual(self.machine.stats["suppressed_on"], 1)
+        self.assertEqual(self.feed(True, True, True), [False, False, True])
+        self.assertTrue(self.machine.state)
+
+    def test_leave_after_quiet_seconds(self):
+        self.feed(True, True, True)
+        # Negative for 25 seconds, then a positive cycle keeps the meeting going
+        self.assertEqual(self.feed(False, False, False, False, False, False), [False] * 6)
+        self.assertTrue(self.machine.pending)
+        self.assertEqual(self.feed(True), [False])
+        self.assertEqual(self.machine.stats["suppressed_off"], 1)
+        self.assertFalse(self.machine.pending)
+        # The negative time starts again, the meeting ends 30 seconds after the first negative cycle
+        changes = self.feed(*[False] * 7)
+        self.assertEqual(changes, [False] * 6 + [True])
+        self.assertFalse(self.machine.state)
+
+    def test_leave_timing_follows_the_clock_not_the_cycles(self):
+        self.feed(True, True, True)
+        self.assertEqual(self.feed(False, False, every=29), [False, False])
+        self.assertEqual(self.feed(False), [True])
+
+    def test_defaults_switch_immediately(self):
+        machine = MeetingStateMachine(clock=self.clock)
+        self.assertTrue(machine.update(True))
+        self.assertTrue(machine.update(False))
+
+
+class ElapsedTimerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timer = ElapsedTimer(clock=self.clock)
+
+    def test_title_only_changes_when_displayed_string_does(self):
+        self.assertEqual(self.timer.tick(), (False, None))
+        self.timer.start()
+        self.assertEqual(self.timer.tick(), (True, "00:00:00"))
+        self.clock.advance(0.5)
+        self.assertEqual(self.timer.tick(), (False, "00:00:00"))
+        self.clock.advance(3664.5)
+        self.assertEqual(self.timer.tick(), (True, "01:01:05"))
+
+    def test_pause_and_resume(self):
+        self.timer.start()
+        self.clock.advance(30)
+        self.timer.stop()
+        self.clock.advance(600)
+        self.assertEqual(self.timer.elapsed, 30)
+        self.timer.start()
+        self.clock.advance(15)
+        self.assertEqual(self.timer.tick(), (True, "00:00:45"))
+        self.timer.stop(reset=True)
+        self.assertEqual(self.timer.elapsed, 0)
+        self.assertEqual(self.timer.tick(), (True, None))
+
+    def test_minute_resolution(self):
+        timer = ElapsedTimer(resolution="minutes", clock=self.clock)
+        self.assertEqual(timer.refresh_interval, 10)
+        timer.start()
+        changes = []
+        for _ in range(18):
+            changes.append(timer.tick()[0])
+            self.clock.advance(timer.refresh_interval)
+        # The first title, then one change per minute
+        self.assertEqual(changes.count(True), 3)
+        self.assertEqual(timer.tick(), (True, "00:03"))
+
+
+if __name__ == "__main__":
+    unittest.main()
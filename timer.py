@@ -0,0 +1,63 @@
+import time
+
+
+class ElapsedTimer:
+    """ Meeting elapsed time, rendered for the menu bar title without touching the UI """
+    def __init__(self, resolution="seconds", clock=time.monotonic):
+        self.resolution = resolution
+        self.clock = clock
+        self._start_time = None
+        self._elapsed = 0.0
+        self.displayed = None
+
+    def start(self):
+        """Start or resume the timer."""
+        if self._start_time is None:
+            self._start_time = self.clock()
+
+    def stop(self, reset=False):
+        """Stop/pause the timer and record elapsed time."""
+        if self._start_time is not None:
+            self._elapsed += self.clock() - self._start_time
+            self._start_time = None
+            if reset:
+                self.reset()
+
+    def reset(self):
+        """Reset the timer to zero (stopped)."""
+        self._start_time = None
+        self._elapsed = 0.0
+
+    @property
+    def elapsed(self):
+        """Return the total elapsed time in seconds."""
+        if self._start_time is not None:
+            return self._elapsed + (self.clock() - self._start_time)
+        return self._elapsed
+
+    @property
+    def running(self):
+        return self._start_time is not None
+
+    @property
+    def elapsed_str(self):
+        """Return elapsed time as HH:MM:SS, or HH:MM with minute resolution."""
+        total_seconds = int(self.elapsed)
+        hours, remainder = divmod(total_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        if self.resolution == "minutes":
+            return f"{hours:02}:{minutes:02}"
+        return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+    @property
+    def refresh_interval(self):
+        """ Seconds between ticks needed to keep the title current """
+        return 10 if self.resolution == "minutes" else 1
+
+    def tick(self):
+        """ Return (changed, title), changed is only True when the displayed title differs """
+        title = self.elapsed_str if self.running else None
+        if title == self.displayed:
+            return False, title
+        self.displayed = title
+        return True, title
@@ -1,67 +1,12 @@
 import rumps
-import sqlite3
-from watch import MeetingWatcher
-from logger import LogEntry
-import time
-import threading
-
-class Timer:
-    def __init__(self, app):
-        self.app = app
-        self._start_time = None
-        self._elapsed = 0.0
-        self.thread = None
-
-    def __update_app__(self):
-        while self.running and self.app.meeting_watcher.running:
-            self.app.title = self.elapsed_str
-            # print("updating timer")
-            time.sleep(1)
-
-
-    def start(self):
-        """Start or resume the timer."""
-        if self._start_time is None:
-            self._start_time = time.monotonic()
-            self.thread = threading.Thread(target=self.__update_app__)
-            self.thread.start()
-
-    def stop(self, reset=False):
-        """Stop/pause the timer and record elapsed time."""
-        if self._start_time is not None:
-            self._elapsed += time.monotonic() - self._start_time
-            self._start_time = None
-            self.thread = None
-            if reset:
-                self.reset()
-
-    def reset(self):
-        """Reset the timer to zero (stopped)."""
-        self._start_time = None
-        self._elapsed = 0.0
-
-    @property
-    def elapsed(self):
-        """Return the total elapsed time in seconds."""
-        if self._start_time is not None:
-            return self._elapsed + (time.monotonic() - self._start_time)
-        return self._elapsed
-
-    @property
-    def running(self):
-        return self._start_time is not None
-
-    @property
-    def elapsed_str(self):
-        """Return elapsed time as HH:MM:SS."""
-        total_seconds = int(self.elapsed)
-        hours, remainder = divmod(total_seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return f"{hours:02}:{minutes:02}:{seconds:02}"
-
+import startup
+from datetime import datetime
+from logger import LogView
+from timer import ElapsedTimer
 
 class StatusBarApp(rumps.App):
     def __init__(self, app_config):
+        self.app_config = app_config
         self.app_name = app_config.name
         self.app_version = app_config.version
         self.icon_manual = app_config.icons["manual"]
@@ -69,15 +14,28 @@ class StatusBarApp(rumps.App):
         self.icon_meeting = app_config.icons["meeting"]
         self.verbose = app_config.verbose
         self.log_db_file = app_config.log_db_file
-        self.log_entries = ""
+        self.log_store = app_config.log_store
+        if "log_page_size" in app_config.user_config.options:
+            log_page_size = app_config.user_config.options["log_page_size"]
+        else:
+            log_page_size = 50
+        self.log_view = LogView(self.log_store, page_size=log_page_size)
         self.notifications = app_config.user_config.options["notifications"]
         self.status = True
         self.state = False
-        self.meeting_timer = Timer(app=self)
+        if "timer_resolution" in app_config.user_config.options:
+            timer_resolution = app_config.user_config.options["timer_resolution"]
+        else:
+            timer_resolution = "seconds"
+        self.meeting_timer = ElapsedTimer(resolution=timer_resolution)
+        # A single tick on the main thread owns the elapsed time title
+        self.title_timer = rumps.Timer(self.__tick__, self.meeting_timer.refresh_interval)
 
         # Initialize the rumps.App
-        super(StatusBarApp, self).__init__(self.app_name, icon=self.icon_watching)
-        self.menu = ['Start Watching', 'Stop Watching', 'Toggle Light', 'Meeting Log', 'About']
+        # Quit is our own item so the watcher is shut down before the app exits
+        super(StatusBarApp, self).__init__(self.app_name, icon=self.icon_watching, quit_button=None)
+        self.menu = ['Start Watching', 'Stop Watching', 'Toggle Light', 'Meeting Log', 'Detector History', 'About',
+                     None, 'Quit']
         self.menu['Start Watching'].icon = self.icon_watching
         self.menu['Stop Watching'].icon = self.icon_manual
         self.menu['Toggle Light'].icon = self.icon_meeting
@@ -89,36 +47,40 @@ class StatusBarApp(rumps.App):
             rumps.alert(f"User config not ready. Exiting\nDetails:\n{app_config.user_config.error}")
             rumps.quit_application()
 
-        self.meeting_watcher = MeetingWatcher(app_config=app_config,
-                                              status_callback=self.status_callback,
-                                              state_callback=self.state_callback
-                                              )
-        if not self.meeting_watcher.connected:
-            rumps.alert(f"Error connecting to MQTT host: {self.meeting_watcher.mqtt_host}:{self.meeting_watcher.mqtt_port}")
-            rumps.quit_application()
+        # The watcher (psutil, paho, detectors) is created once the icon is up
+        self.meeting_watcher = None
+        self.startup_timer = rumps.Timer(self.__init_watcher__, 0.1)
 
         if self.verbose:
             print("StatusBarApp init")
             rumps.debug_mode(True)
 
         self.template = False
+        self.startup_timer.start()
+        self.title_timer.start()
+        startup.mark("status bar app created")
+
+    def __init_watcher__(self, timer):
+        timer.stop()
+        startup.mark("menu bar icon shown")
+        from watch import MeetingWatcher
+        self.meeting_watcher = MeetingWatcher(app_config=self.app_config,
+                                              status_callback=self.status_callback,
+                                              state_callback=self.state_callback
+                                              )
+        # The publisher connects in the background and queues state changes until the broker is reachable
         self.meeting_watcher.publish("0")
         self.start(True)
+        startup.mark("watcher started")
+        startup.report()
+
+    def __tick__(self, _):
+        changed, title = self.meeting_timer.tick()
+        if changed:
+            self.title = title
 
     def __get_log_entries__(self):
-        log_entries = ""
-        conn = sqlite3.connect(self.log_db_file)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, start_time, end_time, duration FROM log ORDER BY end_time DESC")
-        rows = cursor.fetchall()
-        conn.close()
-        for row in rows:
-            entry = LogEntry(row)
-            if entry.start_time is None:
-                continue
-            log_entries += f"{entry.meeting_date} — {entry.meeting_duration}\n"
-
-        return log_entries
+        return self.log_view.text()
 
     def __update_icon__(self):
         """ Update the icon based on the status and state """
@@ -130,10 +92,15 @@ class StatusBarApp(rumps.App):
             elif not self.status and self.icon != self.icon_manual:
                 self.icon = self.icon_manual
 
-    def stop(self, _):
-        rumps.quit_application()
+    @rumps.clicked("Quit")
+    def quit(self, _):
         self.meeting_timer.stop(reset=True)
         self.title = None
+        # Publish the final off, close an open meeting and flush the log before exiting
+        if self.meeting_watcher:
+            self.meeting_watcher.shutdown()
+            self.meeting_watcher = None
+        rumps.quit_application()
 
     def status_callback(self, status):
         self.status = status
@@ -167,16 +134,14 @@ class StatusBarApp(rumps.App):
 
     @rumps.clicked("Toggle Light")
     def toggle_light(self, _):
-        if self.meeting_watcher.manual_on:
-            self.meeting_watcher.publish("0")
-            self.meeting_watcher.manual_on = False
-        else:
-            self.meeting_watcher.publish("1")
-            self.meeting_watcher.manual_on = True
+        if self.meeting_watcher is None:
+            return
+        # Toggling off hands the light back to the detectors
+        self.meeting_watcher.command("auto" if self.meeting_watcher.mode == "on" else "on")
 
     @rumps.clicked("Start Watching")
     def start(self, _):
-        if not self.meeting_watcher.running:
+        if self.meeting_watcher and not self.meeting_watcher.running:
             if self.verbose:
                 print("Starting Meeting Watcher")
             self.meeting_watcher.start()
@@ -184,7 +149,7 @@ class StatusBarApp(rumps.App):
 
     @rumps.clicked("Stop Watching")
     def stop(self, _):
-        if self.meeting_watcher.running:
+        if self.meeting_watcher and self.meeting_watcher.running:
             if self.verbose:
                 print("Stopping Meeting Watcher")
             self.meeting_watcher.stop()
@@ -194,15 +159,49 @@ class StatusBarApp(rumps.App):
 
     @rumps.clicked("Meeting Log")
     def settings(self, _):
-        log_window = rumps.Window(
-            title="Meeting Log",
-            default_text=self.__get_log_entries__(),
+        while True:
+            log_window = rumps.Window(
+                title="Meeting Log",
+                default_text=self.__get_log_entries__(),
+                ok="Close",
+                cancel="Load More" if self.log_view.more else None,
+                dimensions=(400, 200)
+            )
+            log_window.icon = self.icon_watching
+            response = log_window.run()
+            # The cancel button (clicked == 0) loads the next page of older meetings
+            if response.clicked or not self.log_view.more:
+                break
+            self.log_view.load_more()
+
+    def __get_history__(self, count=100):
+        lines = []
+        for sample in self.meeting_watcher.history.recent(count):
+            detectors = " ".join(
+                f"{name}={'err' if result is None else 'yes' if result else 'no'}"
+                for name, result in sample["detectors"].items()
+            )
+            lines.append(f"{datetime.fromtimestamp(sample['timestamp']):%H:%M:%S.%f}"[:-5]
+                         + f"  {'meeting' if sample['in_meeting'] else 'idle':<7}  {detectors}"
+                         + f"  <{sample['latency_ms']:g}ms")
+        return "\n".join(lines)
+
+    @rumps.clicked("Detector History")
+    def history(self, _):
+        if self.meeting_watcher is None:
+            return
+        history_window = rumps.Window(
+            title="Detector History",
+            message=f"Last 100 of {len(self.meeting_watcher.history)} cycles, newest first",
+            default_text=self.__get_history__(),
             ok="Close",
-            cancel=None,
-            dimensions=(400, 200)
+            cancel="Save to File",
+            dimensions=(500, 300)
         )
-        log_window.icon = self.icon_watching
-        log_window.run()
+        history_window.icon = self.icon_watching
+        if not history_window.run().clicked:
+            path = self.meeting_watcher.dump_history()
+            rumps.alert(f"Detector history saved to {path}")
 
     @rumps.clicked("About")
     def prefs(self, _):
@@ -1,73 +1,207 @@
+import sys
+import time
+import asyncio
 import threading
-import psutil
-from time import sleep
-import paho.mqtt.client as mqtt
-from logger import LogEntry
+from collections import deque
+from datetime import datetime
+from detectors import create_detectors
+from scheduler import AdaptiveScheduler
+from engine import DetectionEngine
+from publisher import MqttPublisher
+from sinks import MqttSink, create_sinks
+from metrics import REGISTRY, MetricsServer, MetricsPublisher
+from configwatch import ConfigWatcher
+from history import SampleHistory
+from statemachine import MeetingStateMachine
+
+CYCLE_SECONDS = REGISTRY.histogram("meeting_watcher_cycle_seconds", "Duration of a detection cycle")
+TRANSITIONS = REGISTRY.counter("meeting_watcher_transitions_total", "Meeting state transitions", labels=("state",))
+CONFIG_RELOADS = REGISTRY.counter("meeting_watcher_config_reloads_total", "Config file reloads", labels=("result",))
+COMMANDS = REGISTRY.counter("meeting_watcher_commands_total", "Commands received on the command topic",
+                            labels=("command",))
+
+# mqtt settings that need a new broker connection when they change
+BROKER_KEYS = ("host", "port", "user", "password")
+# Watch modes, forced on or off and paused skip the detectors
+MODES = ("auto", "on", "off", "paused")
+# Minutes a pause command without a duration lasts
+DEFAULT_PAUSE = 60
+
+
+def parse_command(payload):
+    """ Parse a command topic payload, returns (command, minutes) or None
+
+    Commands are on, off, auto, rescan and pause [minutes].
+    """
+    words = payload.strip().lower().split()
+    if not words:
+        return None
+    command = words[0]
+    if command == "pause":
+        if len(words) == 1:
+            return command, DEFAULT_PAUSE
+        try:
+            minutes = float(words[1])
+        except ValueError:
+            return None
+        return (command, minutes) if minutes > 0 else None
+    if command in ("on", "off", "auto", "rescan") and len(words) == 1:
+        return command, None
+    return None
+
 
 class MeetingWatcher:
+    # Replaced by the replay mode with a virtual clock and a recording publisher
+    clock = staticmethod(time.monotonic)
+    wall_clock = staticmethod(time.time)
+    publisher_class = MqttPublisher
+
     def __init__(self, app_config, status_callback, state_callback):
         self.verbose = app_config.verbose
         self.error = None
-        self.watch_interval = app_config.user_config.options["watch_interval"]
+        self.app_config = app_config
+        self.user_config = app_config.user_config
+        options = app_config.user_config.options
+        self.state_machine = None
+        self.__apply_options__(options)
         self.log_db_file = app_config.log_db_file
+        self.log_store = app_config.log_store
+        self.log_store.verbose = self.verbose
+        self.loop = None
+        self.wake_event = None
+        self.detectors = create_detectors(app_config.user_config, notify=self.__wake__, verbose=self.verbose,
+                                          wall_clock=self.wall_clock)
+        self.engine = DetectionEngine(
+            self.detectors,
+            timeout=options.get("detector_timeout", 2.0),
+            max_workers=options.get("detector_workers"),
+            threshold=options.get("meeting_threshold", 1.0),
+            verbose=self.verbose
+        )
+        self.detector_results = {}
+        # Every cycle's detector results, a week of 1s samples is about 600KB
+        self.history = SampleHistory(max_samples=options.get("history_samples", 7 * 24 * 3600))
+        self.log_entry = None
+        self.status_callback = status_callback
+        self.state_callback = state_callback
+
+        self.meeting_state = False
+        self.running = False
+        self.thread = None
+        self.mode = "auto"
+        self.paused_until = None
+        # Commands from the command topic, applied by the watch loop
+        self.commands = deque()
+        self.recorder = None
+        if app_config.record_file:
+            from replay import Recorder
+            self.recorder = Recorder(app_config.record_file, self)
+        # A reloaded config waiting to be applied between cycles
+        self.pending_config = None
+        self.config_lock = threading.Lock()
+
+        self.publisher = self.__create_publisher__(app_config.user_config.mqtt)
+        self.sinks = self.__create_sinks__(app_config.user_config.sinks)
 
+        REGISTRY.gauge("meeting_watcher_poll_interval_seconds", "Current watch loop interval",
+                       callback=lambda: self.scheduler.interval)
+        REGISTRY.gauge("meeting_watcher_polls_per_hour", "Polls in the last hour",
+                       callback=lambda: self.scheduler.polls_per_hour)
+        REGISTRY.gauge("meeting_watcher_in_meeting", "1 while a meeting is detected",
+                       callback=lambda: int(self.meeting_state))
+        self.metrics_server = None
+        self.metrics_publisher = None
+        self.__create_metrics__(app_config.user_config.metrics or {})
+
+        self.config_watcher = None
+        if app_config.user_config_file and options.get("reload_config", True):
+            self.config_watcher = ConfigWatcher(app_config.user_config_file, self.reload_config, verbose=self.verbose)
+            self.config_watcher.start()
+
+    def __apply_options__(self, options):
+        self.watch_interval = options["watch_interval"]
+        self.scheduler = AdaptiveScheduler(
+            self.watch_interval,
+            min_interval=options.get("min_watch_interval"),
+            max_interval=options.get("max_watch_interval"),
+            stable_after=options.get("stable_after", 300),
+            adaptive=options.get("adaptive_interval", True),
+            quiet_interval=options.get("quiet_watch_interval"),
+            candidate_window=options.get("candidate_window", 120),
+            clock=self.clock
+        )
+        if "log_heartbeat" in options:
+            self.log_heartbeat = options["log_heartbeat"]
+        else:
+            self.log_heartbeat = 60
+        # A reload keeps the current state but restarts the debounce counts
+        self.state_machine = MeetingStateMachine(
+            enter_samples=options.get("enter_samples", 1),
+            leave_after=options.get("leave_after", 0),
+            state=self.state_machine.state if self.state_machine else False,
+            clock=self.clock
+        )
+
+    def __create_publisher__(self, mqtt_config):
         # MQTT Config values
-        self.mqtt_host = app_config.user_config.mqtt["host"]
-        if "publish_topic" in app_config.user_config.mqtt:
-            self.mqtt_publish_topic = app_config.user_config.mqtt["publish_topic"]
+        self.mqtt_host = mqtt_config["host"]
+        if "publish_topic" in mqtt_config:
+            self.mqtt_publish_topic = mqtt_config["publish_topic"]
         else:
             self.mqtt_publish_topic = "meeting/watcher"
-        if "port" in app_config.user_config.mqtt:
-            self.mqtt_port = app_config.user_config.mqtt["port"]
+        self.mqtt_command_topic = mqtt_config.get("command_topic", f"{self.mqtt_publish_topic}/set")
+        if "port" in mqtt_config:
+            self.mqtt_port = mqtt_config["port"]
         else:
             self.mqtt_port = 1883
-        if "user" in app_config.user_config.mqtt:
-            self.mqtt_user = app_config.user_config.mqtt["user"]
+        if "user" in mqtt_config:
+            self.mqtt_user = mqtt_config["user"]
         else:
             self.mqtt_user = None
-        if "password" in app_config.user_config.mqtt:
-            self.mqtt_password = app_config.user_config.mqtt["password"]
+        if "password" in mqtt_config:
+            self.mqtt_password = mqtt_config["password"]
         else:
             self.mqtt_password = None
-        if hasattr(app_config.user_config, "proc"):
-            self.proc = app_config.user_config.proc
-        else:
-            self.proc = {}
-        if "microphone" in app_config.user_config.watch:
-            self.watch_mic = app_config.user_config.watch["microphone"]
-        else:
-            self.watch_mic = True
-        if "proc" in app_config.user_config.watch:
-            self.watch_proc = app_config.user_config.watch["proc"]
-        else:
-            self.watch_proc = False
-        self.status_callback = status_callback
-        self.state_callback = state_callback
 
-        self.meeting_state = False
-        self.connected = False
-        self.running = False
-        self.manual_on = False
+        publisher = self.publisher_class(
+            self.mqtt_host, self.mqtt_port, self.mqtt_user, self.mqtt_password,
+            qos=mqtt_config.get("qos", 0),
+            retain=mqtt_config.get("retain", False),
+            reconnect_min=mqtt_config.get("reconnect_min", 1),
+            reconnect_max=mqtt_config.get("reconnect_max", 60),
+            queue_size=mqtt_config.get("queue_size", 100),
+            verbose=self.verbose
+        )
+        publisher.subscribe(self.mqtt_command_topic, self.on_message)
+        publisher.start()
+        # Extra outputs, mqtt sinks on the main broker reuse its connection
+        MqttSink.add_publisher(publisher, self.mqtt_user, self.mqtt_password)
+        return publisher
 
-        self.mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        self.mqttc.username_pw_set(self.mqtt_user, self.mqtt_password)
-        try:
-            self.mqttc.connect(self.mqtt_host, self.mqtt_port, 10)
-            self.mqttc.on_connect = self.on_connect
-            self.connected = True
-            self.mqttc.on_message = self.on_message
-            self.mqttc.subscribe(self.mqtt_publish_topic)
-            self.mqttc.loop_start()
-        except Exception as e:
-            if self.verbose:
-                print(f"Error connecting to MQTT: {e}")
+    def __create_sinks__(self, sink_configs):
+        broker = {"host": self.mqtt_host, "port": self.mqtt_port, "user": self.mqtt_user, "password": self.mqtt_password}
+        sinks = create_sinks(sink_configs, verbose=self.verbose, broker=broker)
+        sinks.start()
+        return sinks
 
-        if self.verbose:
-            if self.watch_mic:
-                print("Watching Microphone")
-            if self.watch_proc:
-                print("Watching Processes")
+    def __create_metrics__(self, metrics_config):
+        if metrics_config.get("port") is not None:
+            self.metrics_server = MetricsServer(host=metrics_config.get("host", "127.0.0.1"),
+                                                port=metrics_config["port"], verbose=self.verbose)
+            try:
+                self.metrics_server.start()
+            except OSError as e:
+                if self.verbose:
+                    print(f"Error starting metrics server: {e}")
+                self.metrics_server = None
+        if metrics_config.get("mqtt_topic"):
+            self.metrics_publisher = MetricsPublisher(self.publisher, metrics_config["mqtt_topic"],
+                                                      interval=metrics_config.get("interval", 60))
+            self.metrics_publisher.start()
 
+    @property
+    def connected(self):
+        return self.publisher.connected
 
     def __payload_to_bool__(self, payload):
         if str(payload) in ["1", "true", "True"]:
@@ -75,98 +209,335 @@ class MeetingWatcher:
         else:
             return False
 
-    def on_connect(self, client, userdata, flags, reason_code, properties):
-        if self.verbose:
-            print(f"MQTT Connected with result code: {reason_code}")
-        self.mqttc.subscribe(self.mqtt_publish_topic)
-
     def on_message(self, client, userdata, msg):
+        payload = msg.payload.decode(errors="replace")
         if self.verbose:
-            print(f"MQTT Message received: {msg.payload.decode()}")
-        self.meeting_state = self.__payload_to_bool__(msg.payload.decode())
-        self.state_callback(self.meeting_state)
+            print(f"MQTT command received: {payload}")
+        if msg.retain:
+            # A stale retained command would force the state on every start
+            return
+        parsed = parse_command(payload)
+        if parsed is None:
+            COMMANDS.inc(command="invalid")
+            if self.verbose:
+                print(f"Unknown command on {msg.topic}: {payload}", file=sys.stderr)
+            return
+        self.command(*parsed)
+
+    def command(self, command, minutes=None):
+        """ Queue a command for the watch loop and wake it """
+        COMMANDS.inc(command=command)
+        if self.recorder:
+            self.recorder.command(command, minutes)
+        self.commands.append((command, minutes))
+        if self.loop:
+            self.__wake__()
+        else:
+            self.__apply_commands__()
+
+    def __apply_commands__(self):
+        while self.commands:
+            command, minutes = self.commands.popleft()
+            if self.verbose:
+                print(f"Applying command {command}" + (f" for {minutes:g} minutes" if minutes else ""))
+            if command == "rescan":
+                for detector in self.detectors:
+                    detector.invalidate()
+                continue
+            self.paused_until = None
+            if command == "on":
+                self.mode = "on"
+                self.__set_state__(True)
+            elif command == "off":
+                self.mode = "off"
+                self.__set_state__(False)
+            elif command == "pause":
+                self.mode = "paused"
+                self.paused_until = self.clock() + minutes * 60
+                self.__set_state__(False)
+            else:
+                # Detection takes over from the current state
+                self.mode = "auto"
+            self.state_machine.reset(self.meeting_state)
+
+    def __set_state__(self, state):
+        """ Publish, log and report a meeting state change """
+        if state == self.meeting_state:
+            return
+        if state:
+            if self.verbose:
+                print("Meeting in progress")
+            self.publish("1")
+            TRANSITIONS.inc(state="on")
+            self.meeting_state = True
+            self.log_entry = self.log_store.start_meeting()
+        else:
+            if self.verbose:
+                print("Meeting ended")
+            self.publish("0")
+            TRANSITIONS.inc(state="off")
+            self.meeting_state = False
+            if self.log_entry:
+                self.log_store.end_meeting(self.log_entry)
+                self.log_entry = None
+        self.state_callback(state)
 
     def publish(self, message):
-        self.mqttc.publish(self.mqtt_publish_topic, message)
+        self.publisher.publish(self.mqtt_publish_topic, message)
+        self.sinks.publish(self.__payload_to_bool__(message))
 
-    def __watch_proc__(self):
-        if not self.watch_proc:
+    def reload_config(self):
+        """ Read the config file again and apply it, an invalid file leaves the running config untouched """
+        user_config = self.app_config.reload_user_config()
+        if not user_config.ready:
+            CONFIG_RELOADS.inc(result="invalid")
+            print(f"Config not reloaded: {user_config.error}", file=sys.stderr)
             return False
-        for proc_name, children in self.proc.items():
-            for process in psutil.process_iter():
-                if process.name().lower() in proc_name:
-                    for child in process.children():
-                        if child.name() in children:
-                            if self.verbose:
-                                print(f"Found {proc_name()}->{child} process running")
-                            return True
+        with self.config_lock:
+            self.pending_config = user_config
+        if self.loop:
+            # Applied by the watch loop between two cycles
+            self.__wake__()
+        else:
+            self.__apply_pending_config__()
+        return True
+
+    def __apply_pending_config__(self):
+        with self.config_lock:
+            user_config = self.pending_config
+            self.pending_config = None
+            if user_config is None:
+                return
+            changed = self.user_config.diff(user_config)
+            if self.verbose:
+                print(f"Config reloaded, changed: {', '.join(sorted(changed)) or 'nothing'}")
+            if not changed:
+                return
+            previous = self.user_config
+            self.user_config = user_config
+            if "options" in changed:
+                self.__apply_options__(user_config.options)
+                self.engine.timeout = user_config.options.get("detector_timeout", 2.0)
+                self.engine.threshold = user_config.options.get("meeting_threshold", 1.0)
+            if changed & {"watch", "proc", "options"}:
+                self.__apply_detectors__(previous, user_config)
+            reconnected = "mqtt" in changed and self.__apply_mqtt__(previous.mqtt, user_config.mqtt)
+            if "sinks" in changed or reconnected:
+                self.sinks.stop()
+                self.sinks = self.__create_sinks__(user_config.sinks)
+            if "metrics" in changed:
+                if self.metrics_publisher:
+                    self.metrics_publisher.stop()
+                if self.metrics_server:
+                    self.metrics_server.stop()
+                self.metrics_server = None
+                self.metrics_publisher = None
+                self.__create_metrics__(user_config.metrics or {})
+            elif reconnected and self.metrics_publisher:
+                self.metrics_publisher.publisher = self.publisher
+            CONFIG_RELOADS.inc(result="applied")
+
+    def __apply_detectors__(self, previous, user_config):
+        """ Update the detectors in place, rebuilding them only when the watch section changed """
+        if previous.watch == user_config.watch and \
+                previous.options.get("proc_events") == user_config.options.get("proc_events"):
+            for detector in self.detectors:
+                detector.reconfigure(user_config)
+            return
+        detectors = create_detectors(user_config, notify=self.__wake__, verbose=self.verbose,
+                                     wall_clock=self.wall_clock)
+        if self.running:
+            for detector in detectors:
+                detector.start()
+        stale = self.detectors
+        self.detectors = detectors
+        self.engine.set_detectors(detectors)
+        for detector in stale:
+            detector.stop()
+
+    def __apply_mqtt__(self, previous, mqtt_config):
+        """ Returns True when the broker connection had to be replaced """
+        if any(previous.get(key) != mqtt_config.get(key) for key in BROKER_KEYS):
+            if self.verbose:
+                print(f"MQTT broker settings changed, reconnecting to {mqtt_config['host']}")
+            MqttSink.remove_publisher(self.publisher, self.mqtt_user, self.mqtt_password)
+            self.publisher.stop()
+            self.publisher = self.__create_publisher__(mqtt_config)
+            self.publisher.publish(self.mqtt_publish_topic, "1" if self.meeting_state else "0")
+            return True
+        self.publisher.configure(
+            qos=mqtt_config.get("qos", 0),
+            retain=mqtt_config.get("retain", False),
+            reconnect_min=mqtt_config.get("reconnect_min", 1),
+            reconnect_max=mqtt_config.get("reconnect_max", 60),
+            queue_size=mqtt_config.get("queue_size", 100)
+        )
+        publish_topic = mqtt_config.get("publish_topic", "meeting/watcher")
+        if publish_topic != self.mqtt_publish_topic:
+            self.mqtt_publish_topic = publish_topic
+            self.publisher.publish(self.mqtt_publish_topic, "1" if self.meeting_state else "0")
+        command_topic = mqtt_config.get("command_topic", f"{publish_topic}/set")
+        if command_topic != self.mqtt_command_topic:
+            self.publisher.unsubscribe(self.mqtt_command_topic)
+            self.mqtt_command_topic = command_topic
+            self.publisher.subscribe(self.mqtt_command_topic, self.on_message)
         return False
 
+    def dump_history(self, path=None):
+        """ Write the sample history as NDJSON, by default next to the user config, returns the path """
+        if path is None:
+            path = f"{self.app_config.user_config_path}/history-{datetime.now():%Y%m%d-%H%M%S}.ndjson"
+        count = self.history.dump(path)
+        if self.verbose:
+            print(f"Wrote {count} history samples to {path}")
+        return path
+
+    def __detector__(self, source):
+        """ Return the first enabled detector watching a source """
+        for detector in self.detectors:
+            if detector.source == source:
+                return detector
+        return None
+
+    def __watch_proc__(self):
+        detector = self.__detector__("proc")
+        if not detector:
+            return False
+        return detector.detect()
+
     def __watch_mic__(self):
-        if not self.watch_mic:
+        detector = self.__detector__("microphone")
+        if not detector:
             return False
+        return detector.detect()
 
-        import AVFoundation
-        import CoreAudio
-        import struct
-        mic_ids = {
-            mic.connectionID(): mic
-            for mic in AVFoundation.AVCaptureDevice.devicesWithMediaType_(
-                AVFoundation.AVMediaTypeAudio
-            )
-        }
-        opa = CoreAudio.AudioObjectPropertyAddress(
-            CoreAudio.kAudioDevicePropertyDeviceIsRunningSomewhere,
-            CoreAudio.kAudioObjectPropertyScopeGlobal,
-            CoreAudio.kAudioObjectPropertyElementMaster
-        )
-        for mic_id in mic_ids:
-            response = CoreAudio.AudioObjectGetPropertyData(mic_id, opa, 0, [], 4, None)
-            # print('Mic', mic_ids[mic_id], 'active:', bool(struct.unpack('I', response[2])[0]))
-            if bool(struct.unpack('I', response[2])[0]):
-                if self.verbose:
-                    print(f"Microphone {mic_ids[mic_id]} is active")
-                return True
-        return False
+    def __watch_net__(self):
+        detector = self.__detector__("network")
+        if not detector:
+            return False
+        return detector.detect()
 
-    def __run_thread__(self):
-        log_entry = None
-        while self.running:
-            if self.manual_on:
-                sleep(self.watch_interval)
-                continue
+    def __wake__(self):
+        """ Wake the watch loop before the watch interval has elapsed """
+        loop = self.loop
+        if loop and self.wake_event:
+            try:
+                loop.call_soon_threadsafe(self.wake_event.set)
+            except RuntimeError:
+                # The loop has already been closed
+                pass
+
+    async def __sleep__(self, interval):
+        """ Sleep until woken or for interval seconds, None sleeps until woken """
+        try:
+            await asyncio.wait_for(self.wake_event.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        self.wake_event.clear()
+
+    async def __run_cycle__(self):
+        """ Run the detectors once and publish a state change, returns the next interval """
+        if self.verbose:
+            print("Meeting Watcher Running")
+        self.status_callback(True)
+        started = time.perf_counter()
+        self.in_meeting, self.detector_results = await self.engine.run_cycle()
+        if self.recorder:
+            self.recorder.cycle(self.detector_results)
+        candidate = any(detector.candidate for detector in self.detectors)
+
+        # Short flaps are absorbed here so they reach neither the broker nor the log
+        changed = self.state_machine.update(self.in_meeting)
+        if changed:
+            self.__set_state__(self.state_machine.state)
+        elif self.log_entry and (datetime.fromtimestamp(self.wall_clock())
+                                 - self.log_entry.last_seen).total_seconds() >= self.log_heartbeat:
+            self.log_store.touch(self.log_entry)
+        latency = time.perf_counter() - started
+        CYCLE_SECONDS.observe(latency)
+        self.history.record(self.wall_clock(), self.in_meeting, self.detector_results, latency)
+        # Poll quickly while a change is being confirmed so the debounce settles in samples, not intervals
+        transition = changed or self.state_machine.pending
+        quiet = [detector.quiet_for for detector in self.detectors if detector.quiet_for is not None]
+        interval = self.scheduler.update(self.state_machine.state, transition=transition, candidate=candidate,
+                                         quiet_for=min(quiet) if quiet else None)
+        if self.verbose and self.scheduler.adaptive:
+            print(f"Next poll in {interval:.1f}s, {self.scheduler.polls_per_hour} polls in the last hour "
+                  f"(fixed interval: {self.scheduler.fixed_polls_per_hour:.0f})")
+        return interval
+
+    def __check_pause__(self):
+        if self.mode == "paused" and self.clock() >= self.paused_until:
             if self.verbose:
-                print("Meeting Watcher Running")
-            self.in_meeting = False
-            self.status_callback(True)
-            if self.__watch_mic__():
-                self.in_meeting = True
-            if self.__watch_proc__():
-                self.in_meeting = True
-
-            if self.in_meeting and not self.meeting_state:
-                if self.verbose:
-                    print("Meeting in progress")
-                self.publish("1")
-                log_entry = LogEntry(db_path=self.log_db_file, auto_start=True)
-            elif not self.in_meeting and self.meeting_state:
-                if self.verbose:
-                    print("Meeting ended")
-                self.publish("0")
-                if log_entry:
-                    log_entry.end()
-                    log_entry = None
-            sleep(self.watch_interval)
+                print("Pause over, resuming detection")
+            self.mode = "auto"
+            self.paused_until = None
+
+    async def __run_async__(self):
+        self.loop = asyncio.get_running_loop()
+        self.wake_event = asyncio.Event()
+        try:
+            while self.running:
+                self.__apply_pending_config__()
+                self.__apply_commands__()
+                self.__check_pause__()
+                if self.mode == "auto":
+                    interval = await self.__run_cycle__()
+                elif self.mode == "paused":
+                    interval = self.paused_until - self.clock()
+                else:
+                    # Forced on or off until the next command
+                    interval = None
+                if self.running:
+                    await self.__sleep__(interval)
+        finally:
+            self.engine.stop()
+            self.loop = None
 
         self.status_callback(False)
         if self.verbose:
             print("Meeting Watcher stopped")
 
+    def __run_thread__(self):
+        asyncio.run(self.__run_async__())
+
     def start(self):
         self.running = True
+        self.log_store.open()
+        for detector in self.detectors:
+            detector.start()
         self.thread = threading.Thread(target=self.__run_thread__)
         self.thread.start()
 
-    def stop(self):
+    def stop(self, timeout=None):
+        """ Stop watching and wait for the watcher thread to exit """
         self.running = False
+        self.__wake__()
+        for detector in self.detectors:
+            detector.stop()
+        thread = self.thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.thread = None
 
+    def shutdown(self):
+        """ Stop watching, close an open meeting and release the broker connections and log store """
+        if self.config_watcher:
+            self.config_watcher.stop()
+        self.stop()
+        if self.meeting_state:
+            self.publish("0")
+            self.meeting_state = False
+        if self.log_entry:
+            self.log_store.end_meeting(self.log_entry)
+            self.log_entry = None
+        if self.metrics_publisher:
+            self.metrics_publisher.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        self.sinks.stop()
+        self.publisher.stop()
+        self.log_store.close()